@@ -1,5 +1,25 @@
+"""
+Administration des modèles, prévue pour des tables de plusieurs millions de lignes:
+
+- le nombre de lignes d'une liste sans filtre est estimé au lieu d'être compté
+  (`PaginateurEstime`), et celui d'une liste filtrée est borné;
+- les colonnes des listes évitent les `__str__` qui chargent toute une chaîne de
+  clés étrangères (ex: `Message` -> fait d'achat -> acheteur, bien, vendeur...), et
+  les relations affichées sont chargées avec `list_select_related`;
+- les clés étrangères des formulaires sont des champs d'id (`raw_id_fields`) ou des
+  autocomplétions, jamais des <select> avec toutes les lignes de la table;
+- la recherche n'utilise que des champs indexés: `=email` et `^nom` (iexact et
+  istartswith, des LIKE que SQLite résout avec les index NOCASE des modèles).
+"""
+
+from django import forms
 from django.contrib import admin
+from django.contrib.admin import helpers
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connections, models
+from django.utils.functional import cached_property
 
+from . import estimation
 from .models import (
     Acheteur,
     Adresse,
@@ -17,22 +37,236 @@ from .models import (
     Voie,
 )
 
-# Register your models here.
-admin.site.register(
-    [
-        Utilisateur,
-        Acheteur,
-        Vendeur,
-        Agent,
-        Agence,
-        InfosBien,
-        Bien,
-        FaitAchat,
-        RendezVous,
-        Avis,
-        Message,
-        Adresse,
-        Commune,
-        Voie,
-    ]
-)
+# au-delà, les listes affichent un nombre de lignes estimé ou minimal
+LIMITE_COMPTAGE = 10_000
+
+
+def estimer_nombre_lignes(modele, alias: str) -> int | None:
+    """
+    Estimation rapide du nombre de lignes de la table de `modele`, ou None:
+    - PostgreSQL: statistiques de l'autovacuum (pg_class.reltuples);
+    - SQLite: écart entre la plus petite et la plus grande clé primaire
+      auto-incrémentée (lues dans l'index), sinon statistiques de `ANALYZE`.
+    """
+    connexion = connections[alias]
+    table = modele._meta.db_table
+    try:
+        if connexion.vendor == "postgresql":
+            with connexion.cursor() as cursor:
+                cursor.execute("SELECT reltuples FROM pg_class WHERE oid = %s::regclass", [table])
+                ligne = cursor.fetchone()
+            return int(ligne[0]) if ligne and ligne[0] >= 0 else None
+        if connexion.vendor == "sqlite":
+            if isinstance(modele._meta.pk, models.AutoField):
+                lignes = modele._default_manager.using(alias)
+                # deux requêtes: SQLite ne lit l'index directement que pour un seul MIN/MAX
+                maximum = lignes.aggregate(m=models.Max("pk"))["m"]
+                minimum = lignes.aggregate(m=models.Min("pk"))["m"]
+                return 0 if maximum is None else maximum - minimum + 1
+            with connexion.cursor() as cursor:
+                cursor.execute("SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1", [table])
+                ligne = cursor.fetchone()
+            return int(ligne[0].split()[0]) if ligne else None
+    except DatabaseError:  # ex: pas de sqlite_stat1 sans ANALYZE
+        return None
+    return None
+
+
+class PaginateurEstime(Paginator):
+    """
+    Paginateur qui ne fait pas de `COUNT(*)` sur toute une grande table: sans filtre,
+    le nombre de lignes est estimé (voir `estimer_nombre_lignes`); avec un filtre, il
+    est compté jusqu'à `LIMITE_COMPTAGE` seulement (les pages suivantes ne sont pas
+    proposées).
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.has_filters():
+            estimation = estimer_nombre_lignes(queryset.model, queryset.db)
+            if estimation is not None and estimation > LIMITE_COMPTAGE:
+                return estimation
+        return queryset[: LIMITE_COMPTAGE + 1].count()
+
+
+class AdminGrandeTable(admin.ModelAdmin):
+    paginator = PaginateurEstime
+    # sinon l'admin compte toute la table pour afficher "x résultats (y au total)"
+    show_full_result_count = False
+    list_per_page = 50
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        # aussi pour l'autocomplétion, qui affiche le __str__ de chaque résultat
+        if isinstance(self.list_select_related, tuple | list):
+            queryset = queryset.select_related(*self.list_select_related)
+        return queryset
+
+    def action_checkbox(self, obj):
+        # l'original met `str(obj)` dans l'aria-label: une cascade de requêtes par ligne
+        # pour les modèles dont le __str__ suit des clés étrangères (Message, RendezVous...)
+        attrs = {
+            "class": "action-select",
+            "aria-label": f"Sélectionner {obj._meta.verbose_name} {obj.pk}",
+        }
+        checkbox = forms.CheckboxInput(attrs, lambda _valeur: False)
+        return checkbox.render(helpers.ACTION_CHECKBOX_NAME, str(obj.pk))
+
+
+@admin.display(description="Fait d'achat", ordering="fait_achat")
+def fait_achat_id(objet):
+    # pas `fait_achat`: son __str__ charge l'acheteur, le bien, le vendeur...
+    return objet.fait_achat_id
+
+
+# ---------------------------------------------------------------------------- #
+#                                 Localisation                                 #
+# ---------------------------------------------------------------------------- #
+
+
+@admin.register(Commune)
+class CommuneAdmin(AdminGrandeTable):
+    list_display = ("nom", "code_postal", "code_insee")
+    search_fields = ("^nom", "code_insee__exact")
+
+
+@admin.register(Voie)
+class VoieAdmin(AdminGrandeTable):
+    list_display = ("nom", "commune")
+    list_select_related = ("commune",)
+    search_fields = ("^nom",)
+    autocomplete_fields = ("commune",)
+
+
+@admin.register(Adresse)
+class AdresseAdmin(AdminGrandeTable):
+    list_display = ("label", "id_ban", "latitude", "longitude")
+    search_fields = ("^label", "id_ban__exact")
+    autocomplete_fields = ("voie",)
+
+
+@admin.register(Agence)
+class AgenceAdmin(AdminGrandeTable):
+    list_display = ("nom", "telephone", "adresse")
+    list_select_related = ("adresse",)
+    search_fields = ("^nom",)
+    autocomplete_fields = ("adresse",)
+
+
+# ---------------------------------------------------------------------------- #
+#                                     Biens                                    #
+# ---------------------------------------------------------------------------- #
+
+
+@admin.register(InfosBien)
+class InfosBienAdmin(AdminGrandeTable):
+    list_display = ("id", "lieu", "nb_chambres", "surface_habitable", "prix")
+    list_select_related = ("lieu",)
+    search_fields = ("^lieu__label",)
+    autocomplete_fields = ("lieu",)
+    readonly_fields = ("estimation",)
+
+    class Media:
+        # recalcule l'estimation pendant la saisie (vue estimation_prix)
+        js = ("admin/js/jquery.init.js", "estimation_prix.js")
+
+    @admin.display(description="Estimation du prix")
+    def estimation(self, infos):
+        if infos.pk is None:
+            return "-"
+        # pas le bien lui-même s'il est déjà vendu
+        resultat = estimation.estimer(
+            infos, exclure=Bien.objects.filter(infos_bien=infos).values_list("pk", flat=True)
+        )
+        return resultat or "Pas assez de ventes comparables"
+
+
+@admin.register(Bien)
+class BienAdmin(AdminGrandeTable):
+    list_display = ("id", "etat", "vendeur", "agent", "adresse")
+    list_select_related = (
+        "vendeur__utilisateur",
+        "agent__utilisateur",
+        "agent__agence",
+        "infos_bien__lieu",
+    )
+    list_filter = ("etat",)
+    search_fields = ("=vendeur__utilisateur__email", "^infos_bien__lieu__label")
+    raw_id_fields = ("infos_bien",)
+    autocomplete_fields = ("vendeur", "agent")
+
+    @admin.display(description="Adresse")
+    def adresse(self, bien):
+        return bien.infos_bien.lieu if bien.infos_bien else None
+
+
+# ---------------------------------------------------------------------------- #
+#                                 Utilisateurs                                 #
+# ---------------------------------------------------------------------------- #
+
+
+@admin.register(Utilisateur)
+class UtilisateurAdmin(AdminGrandeTable):
+    list_display = ("nom", "prenom", "email", "telephone")
+    search_fields = ("=email", "^nom")
+
+
+class RoleAdmin(AdminGrandeTable):
+    list_display = ("utilisateur",)
+    list_select_related = ("utilisateur",)
+    search_fields = ("=utilisateur__email", "^utilisateur__nom")
+    raw_id_fields = ("utilisateur",)
+
+
+@admin.register(Acheteur)
+class AcheteurAdmin(RoleAdmin):
+    raw_id_fields = ("utilisateur", "critere_recherche")
+
+
+@admin.register(Vendeur)
+class VendeurAdmin(RoleAdmin):
+    pass
+
+
+@admin.register(Agent)
+class AgentAdmin(RoleAdmin):
+    list_display = ("utilisateur", "agence")
+    list_select_related = ("utilisateur", "agence")
+    autocomplete_fields = ("agence",)
+
+
+# ---------------------------------------------------------------------------- #
+#                          Interaction acheteur - bien                         #
+# ---------------------------------------------------------------------------- #
+
+
+@admin.register(FaitAchat)
+class FaitAchatAdmin(AdminGrandeTable):
+    list_display = ("id", "acheteur", "bien_id", "etape_achat", "cree_le")
+    list_select_related = ("acheteur__utilisateur",)
+    list_filter = ("etape_achat",)
+    search_fields = ("=acheteur__utilisateur__email",)
+    raw_id_fields = ("bien", "acheteur")
+
+
+@admin.register(RendezVous)
+class RendezVousAdmin(AdminGrandeTable):
+    list_display = ("date", "objet", fait_achat_id, "lieu")
+    list_select_related = ("lieu",)
+    raw_id_fields = ("fait_achat",)
+    autocomplete_fields = ("lieu",)
+
+
+@admin.register(Avis)
+class AvisAdmin(AdminGrandeTable):
+    list_display = ("date", fait_achat_id, "commentaire")
+    raw_id_fields = ("fait_achat",)
+
+
+@admin.register(Message)
+class MessageAdmin(AdminGrandeTable):
+    list_display = ("date", "auteur", fait_achat_id)
+    list_select_related = ("auteur",)
+    search_fields = ("=auteur__email",)
+    raw_id_fields = ("auteur", "fait_achat")
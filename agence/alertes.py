@@ -0,0 +1,284 @@
+"""
+Alertes aux acheteurs quand un bien est mis en vente.
+
+Comparer un bien aux critères de tous les acheteurs est trop long pour être fait
+pendant la requête qui le met en vente. Les mises en vente sont donc mises dans la
+file `MiseEnVente` (signal `post_save` de `Bien`, ou `signaler` après un
+`bulk_create`), et une tâche de fond `envoyer_alertes` (voir agence.taches) la vide
+par lots toutes les `INTERVALLE` secondes:
+
+- les critères des acheteurs sont lus par blocs de `TAILLE_BLOC` et comparés à tous
+  les biens du lot d'un coup, avec numpy: le même score que
+  `InfosBien.score_correspondance`, calculé pour une matrice acheteurs x biens;
+- chaque acheteur reçoit au plus `MAX_PAR_JOUR` propositions par 24 h glissantes,
+  les meilleurs scores d'abord, et jamais deux fois le même bien;
+- les propositions sont des `FaitAchat` à l'étape `PROPOSITION`, créés avec
+  `bulk_create`.
+
+Il n'y a qu'une tâche par fenêtre de `INTERVALLE` secondes (clé de déduplication),
+exécutée à la fin de la fenêtre: toutes les mises en vente de la fenêtre sont
+traitées ensemble.
+
+Plusieurs exécutions peuvent être lancées en même temps (tâche en retard ou relancée,
+commande `envoyer_alertes`), mais un seul lot est traité à la fois: il est réservé
+par un seul `UPDATE`, qui ne modifie rien si un autre lot est déjà réservé, puis
+supprimé de la file une fois traité. Une exécution qui ne peut rien réserver
+s'arrête: celle qui a la réservation continuera jusqu'à ce que la file soit vide.
+Sans cela, deux exécutions proposeraient le même bien en double, ou des biens
+différents au même acheteur au-delà de son quota (chacune lit ses propositions
+récentes avant que l'autre n'ait écrit les siennes). Si le traitement échoue, le lot
+est libéré; si le travailleur est arrêté brutalement, la réservation expire après
+`DUREE_RESERVATION`.
+"""
+
+import itertools
+import time
+import uuid
+from datetime import timedelta
+
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import Count, Exists
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import entonnoir, instantane, metriques, taches
+from .models import Acheteur, Bien, FaitAchat, MiseEnVente
+
+INTERVALLE = 300  # secondes entre deux lots
+TAILLE_LOT = 500  # biens comparés ensemble aux critères des acheteurs
+TAILLE_BLOC = 2000  # acheteurs par matrice de scores
+SCORE_MIN = 90  # score minimal pour proposer un bien (100: critères identiques, sur place)
+MAX_PAR_JOUR = 5  # propositions par acheteur sur 24 h glissantes
+FENETRE_LIMITE = timedelta(days=1)
+# comme la duree_max de la tâche envoyer_alertes: ensuite, elle est relancée
+DUREE_RESERVATION = timedelta(minutes=30)
+
+# caractéristiques comparées, dans l'ordre de `InfosBien.score_correspondance`
+CARACTERISTIQUES = (
+    "nb_chambres",
+    "nb_salles_bain",
+    "nb_garages",
+    "nb_cuisines",
+    "nb_wc",
+    "surface_habitable",
+    "surface_terrain",
+)
+
+
+def signaler(bien_ids, using=DEFAULT_DB_ALIAS):
+    """
+    Met les biens `bien_ids` dans la file des alertes, et prévoit leur traitement.
+    Les biens qui ne sont plus en vente au moment du traitement sont ignorés.
+    """
+    MiseEnVente.objects.using(using).bulk_create(
+        [MiseEnVente(bien_id=pk) for pk in bien_ids], ignore_conflicts=True
+    )
+    transaction.on_commit(_prevoir_lot, using=using)
+
+
+def _prevoir_lot():
+    fenetre = int(time.time() // INTERVALLE)
+    # exécutée après la fin de la fenêtre: une mise en vente signalée pendant son
+    # exécution est dans une fenêtre suivante, et donc dans une autre tâche
+    delai = timedelta(seconds=(fenetre + 1) * INTERVALLE - time.time())
+    taches.ajouter("envoyer_alertes", cle=str(fenetre), delai=delai)
+
+
+@receiver(post_save, sender=Bien)
+def _bien_apres_save(sender, instance, using, raw, **kwargs):
+    avant = instantane.avant_save(instance)
+    if (
+        not raw
+        and instance.etat == Bien.Etat.MISE_EN_VENTE
+        and (avant is None or avant.etat != Bien.Etat.MISE_EN_VENTE)
+    ):
+        signaler([instance.pk], using)
+
+
+# ---------------------------------------------------------------------------- #
+#                                    Scores                                    #
+# ---------------------------------------------------------------------------- #
+
+
+def _matrice(lignes):
+    """
+    (caractéristiques, latitudes, longitudes) de lignes (*CARACTERISTIQUES, lat, lon).
+    Une caractéristique inconnue compte pour 0.
+    """
+    import numpy as np  # noqa: PLC0415
+
+    valeurs = np.array(lignes, dtype=float).reshape(len(lignes), len(CARACTERISTIQUES) + 2)
+    caracteristiques = np.nan_to_num(valeurs[:, : len(CARACTERISTIQUES)])
+    normes = np.linalg.norm(caracteristiques, axis=1)
+    normes[normes == 0] = 1  # un vecteur nul a une similarité nulle avec tout
+    return caracteristiques / normes[:, None], valeurs[:, -2], valeurs[:, -1]
+
+
+def scores(criteres, biens):
+    """
+    Matrice des scores (critères x biens), chaque case égale à
+    `critere.score_correspondance(infos_bien)`.
+
+    :param criteres: lignes (*CARACTERISTIQUES, latitude, longitude) des critères.
+    :param biens: idem pour les biens.
+    """
+    import numpy as np  # noqa: PLC0415
+
+    c, lat_c, lon_c = _matrice(criteres)
+    b, lat_b, lon_b = _matrice(biens)
+    similarites = c @ b.T
+    # distance de Haversine (km) entre chaque critère et chaque bien, voir
+    # models.haversine_distance
+    lat_c, lon_c, lat_b, lon_b = map(np.radians, (lat_c, lon_c, lat_b, lon_b))
+    a = (
+        np.sin((lat_b[None, :] - lat_c[:, None]) / 2) ** 2
+        + np.cos(lat_c)[:, None]
+        * np.cos(lat_b)[None, :]
+        * np.sin((lon_b[None, :] - lon_c[:, None]) / 2) ** 2
+    )
+    distances = 6371.0 * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+    return np.trunc(similarites * 100) - np.trunc(distances / 1000)
+
+
+# ---------------------------------------------------------------------------- #
+#                                     Lots                                     #
+# ---------------------------------------------------------------------------- #
+
+
+def _colonnes(prefixe: str, lieu: str) -> list[str]:
+    return [
+        *(f"{prefixe}{nom}" for nom in CARACTERISTIQUES),
+        f"{prefixe}{lieu}__latitude",
+        f"{prefixe}{lieu}__longitude",
+    ]
+
+
+def alerter(bien_ids) -> int:
+    """
+    Crée les propositions des biens `bien_ids` (ceux qui sont encore en vente et
+    localisés) aux acheteurs dont les critères correspondent, voir le docstring du
+    module.
+
+    :return: le nombre de propositions créées.
+    """
+    import numpy as np  # noqa: PLC0415
+
+    lignes_biens = list(
+        Bien.objects.filter(
+            pk__in=bien_ids,
+            etat=Bien.Etat.MISE_EN_VENTE,
+            infos_bien__lieu__latitude__isnull=False,
+            infos_bien__lieu__longitude__isnull=False,
+        ).values_list("pk", *_colonnes("infos_bien__", "lieu"))
+    )
+    if not lignes_biens:
+        return 0
+    ids_biens = np.array([ligne[0] for ligne in lignes_biens])
+    biens = [ligne[1:] for ligne in lignes_biens]
+    deja_proposes = set(
+        FaitAchat.objects.filter(bien_id__in=ids_biens.tolist()).values_list(
+            "acheteur_id", "bien_id"
+        )
+    )
+    recents = dict(
+        FaitAchat.objects.filter(
+            etape_achat=FaitAchat.EtapeAchat.PROPOSITION,
+            cree_le__gte=timezone.now() - FENETRE_LIMITE,
+        )
+        .values_list("acheteur_id")
+        .annotate(n=Count("pk"))
+        .order_by()
+    )
+
+    acheteurs = (
+        Acheteur.objects.filter(
+            critere_recherche__lieu__latitude__isnull=False,
+            critere_recherche__lieu__longitude__isnull=False,
+        )
+        .order_by("pk")
+        .values_list("pk", *_colonnes("critere_recherche__", "lieu"))
+        .iterator(chunk_size=TAILLE_BLOC)
+    )
+    creees = limites = 0
+    colonne = {bien_id: j for j, bien_id in enumerate(ids_biens.tolist())}
+    while bloc := list(itertools.islice(acheteurs, TAILLE_BLOC)):
+        ids_acheteurs = np.array([ligne[0] for ligne in bloc])
+        matrice = scores([ligne[1:] for ligne in bloc], biens)
+        ligne_acheteur = {acheteur_id: i for i, acheteur_id in enumerate(ids_acheteurs.tolist())}
+        for acheteur_id, bien_id in deja_proposes:
+            if (i := ligne_acheteur.get(acheteur_id)) is not None:
+                matrice[i, colonne[bien_id]] = -np.inf
+        # biens de chaque acheteur du meilleur score au moins bon: on garde les
+        # `quota` premiers au-dessus de SCORE_MIN
+        ordre = np.argsort(-matrice, axis=1, kind="stable")
+        assez_proches = np.take_along_axis(matrice, ordre, axis=1) >= SCORE_MIN
+        quotas = np.array([MAX_PAR_JOUR - recents.get(pk, 0) for pk in ids_acheteurs.tolist()])
+        dans_quota = np.arange(len(biens))[None, :] < quotas[:, None]
+        limites += int(np.count_nonzero(assez_proches & ~dans_quota))
+        lignes, rangs = np.nonzero(assez_proches & dans_quota)
+        nouvelles = [
+            FaitAchat(
+                acheteur_id=acheteur_id,
+                bien_id=bien_id,
+                etape_achat=FaitAchat.EtapeAchat.PROPOSITION,
+            )
+            for acheteur_id, bien_id in zip(
+                ids_acheteurs[lignes].tolist(),
+                ids_biens[ordre[lignes, rangs]].tolist(),
+                strict=True,
+            )
+        ]
+        # une transaction par bloc: la base n'est pas verrouillée pendant tout le lot
+        with transaction.atomic():
+            nouvelles = FaitAchat.objects.bulk_create(nouvelles, batch_size=1000)
+            # bulk_create ne déclenche pas les signaux de l'entonnoir
+            entonnoir.ajouter_faits_achat(
+                FaitAchat.objects.filter(pk__in=[fait.pk for fait in nouvelles])
+            )
+        creees += len(nouvelles)
+    metriques.ALERTES.inc(creees, resultat="envoyee")
+    metriques.ALERTES.inc(limites, resultat="limitee")
+    return creees
+
+
+def reserver_lot(reservation: uuid.UUID, taille_lot: int = TAILLE_LOT) -> list[int]:
+    """
+    Réserve les `taille_lot` biens les plus anciens de la file, en une requête, si
+    aucun autre lot n'est réservé (réservation de moins de `DUREE_RESERVATION`).
+
+    :return: les ids des biens réservés, vide si la file est vide ou déjà occupée.
+    """
+    maintenant = timezone.now()
+    occupee = MiseEnVente.objects.filter(
+        reservation__isnull=False, reservee_le__gte=maintenant - DUREE_RESERVATION
+    )
+    MiseEnVente.objects.filter(
+        ~Exists(occupee),
+        bien_id__in=MiseEnVente.objects.order_by("date").values("bien_id")[:taille_lot],
+    ).update(reservation=reservation, reservee_le=maintenant)
+    return list(
+        MiseEnVente.objects.filter(reservation=reservation).values_list("bien_id", flat=True)
+    )
+
+
+def envoyer_alertes(taille_lot: int = TAILLE_LOT) -> int:
+    """
+    Vide la file des mises en vente par lots de `taille_lot` biens, réservés par
+    `reserver_lot`.
+
+    :return: le nombre de propositions créées.
+    """
+    creees = 0
+    while lot := reserver_lot(reservation := uuid.uuid4(), taille_lot):
+        reservees = MiseEnVente.objects.filter(reservation=reservation)
+        try:
+            with metriques.ALERTES_DUREE.chronometrer():
+                creees += alerter(lot)
+        except BaseException:
+            # refait plus tard sans doublon: les biens déjà proposés à un acheteur
+            # et ses propositions récentes sont relus
+            reservees.update(reservation=None, reservee_le=None)
+            raise
+        reservees.delete()
+    return creees
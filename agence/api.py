@@ -0,0 +1,339 @@
+"""
+API JSON en lecture seule pour les sites, applications et portails partenaires.
+
+Chaque ressource (`biens`, `infosbiens`, `agences`, `agents`, `rendezvous`) est lue
+avec `values(...)`: seules les colonnes des champs demandés (`?fields=`) sont dans le
+SELECT, sans créer d'objets Django. Les relations demandées avec `?include=` sont:
+- vers un seul objet (ex: l'agent d'un bien): des colonnes de plus dans la même
+  requête, avec une jointure (l'équivalent de `select_related`);
+- vers plusieurs objets (ex: les rendez-vous d'un bien): une seule requête de plus
+  pour toute la page, avec `<relation>__in` (l'équivalent de `prefetch_related`).
+
+Les listes sont paginées par curseur sur la clé primaire (opaque pour le client) et
+`?ids=` lit jusqu'à `LIMITE_MAX` objets en un appel: un client synchronise toute une
+table sans OFFSET ni une requête HTTP par objet.
+"""
+
+import base64
+import hmac
+import json
+from dataclasses import dataclass, field
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F, Model
+from phonenumber_field.phonenumber import PhoneNumber
+
+from .models import Agence, Agent, Bien, InfosBien, RendezVous
+
+PAR_PAGE = 100
+LIMITE_MAX = 1000  # objets par page, et identifiants par appel avec `?ids=`
+
+
+class EncodeurApi(DjangoJSONEncoder):
+    """Ajoute les numéros de téléphone (format E.164) à l'encodeur de Django."""
+
+    def default(self, o):
+        if isinstance(o, PhoneNumber):
+            return o.as_e164
+        return super().default(o)
+
+
+@dataclass(frozen=True)
+class Relation:
+    ressource: str  # nom de la ressource incluse
+    # multiple=False: chemin ORM de l'objet inclus depuis le modèle de la ressource
+    # multiple=True: chemin ORM depuis le modèle inclus vers celui de la ressource
+    chemin: str
+    multiple: bool = False
+
+
+@dataclass(frozen=True)
+class Ressource:
+    nom: str
+    modele: type[Model]
+    # nom dans le JSON -> chemin ORM de la valeur ("id" est toujours présent)
+    champs: dict[str, str]
+    relations: dict[str, Relation] = field(default_factory=dict)
+
+    def choisir_champs(self, valeur: str | None) -> tuple[str, ...]:
+        """
+        Champs d'une liste `?fields=` (tous si elle est absente), avec toujours "id".
+
+        :raise ValueError: si un champ n'existe pas.
+        """
+        if not valeur:
+            return tuple(self.champs)
+        noms = [nom for nom in valeur.split(",") if nom]
+        if inconnus := [nom for nom in noms if nom not in self.champs]:
+            msg = (
+                f"Champs inconnus pour {self.nom}: {', '.join(inconnus)} "
+                f"(possibles: {', '.join(self.champs)})"
+            )
+            raise ValueError(msg)
+        return ("id", *(nom for nom in dict.fromkeys(noms) if nom != "id"))
+
+
+# nom -> Ressource
+RESSOURCES: dict[str, Ressource] = {}
+
+
+def enregistrer_ressource(nom: str, modele, champs, relations=None):
+    RESSOURCES[nom] = Ressource(nom, modele, {"id": "pk", **champs}, relations or {})
+
+
+enregistrer_ressource(
+    "biens",
+    Bien,
+    {
+        "etat": "etat",
+        "vendeur": "vendeur_id",
+        "agent": "agent_id",
+        "infos_bien": "infos_bien_id",
+    },
+    {
+        "infos_bien": Relation("infosbiens", "infos_bien"),
+        "agent": Relation("agents", "agent"),
+        "rendezvous": Relation("rendezvous", "fait_achat__bien", multiple=True),
+    },
+)
+enregistrer_ressource(
+    "infosbiens",
+    InfosBien,
+    {
+        "nb_chambres": "nb_chambres",
+        "nb_salles_bain": "nb_salles_bain",
+        "nb_garages": "nb_garages",
+        "nb_cuisines": "nb_cuisines",
+        "nb_wc": "nb_wc",
+        "surface_habitable": "surface_habitable",
+        "surface_terrain": "surface_terrain",
+        "description": "description",
+        "prix": "prix",
+        "devise": "prix_currency",
+        "adresse": "lieu__label",
+        "latitude": "lieu__latitude",
+        "longitude": "lieu__longitude",
+    },
+    {"biens": Relation("biens", "infos_bien", multiple=True)},
+)
+enregistrer_ressource(
+    "agences",
+    Agence,
+    {
+        "nom": "nom",
+        "telephone": "telephone",
+        "adresse": "adresse__label",
+        "latitude": "adresse__latitude",
+        "longitude": "adresse__longitude",
+    },
+    {"agents": Relation("agents", "agence", multiple=True)},
+)
+enregistrer_ressource(
+    "agents",
+    Agent,
+    {
+        "nom": "utilisateur__nom",
+        "prenom": "utilisateur__prenom",
+        "email": "utilisateur__email",
+        "telephone": "utilisateur__telephone",
+        "agence": "agence_id",
+    },
+    {
+        "agence": Relation("agences", "agence"),
+        "biens": Relation("biens", "agent", multiple=True),
+    },
+)
+enregistrer_ressource(
+    "rendezvous",
+    RendezVous,
+    {
+        "date": "date",
+        "duree": "duree",
+        "objet": "objet",
+        "commentaire": "commentaire",
+        "lieu": "lieu__label",
+        "fait_achat": "fait_achat_id",
+        "bien": "fait_achat__bien_id",
+    },
+    {"bien": Relation("biens", "fait_achat__bien")},
+)
+
+
+# ---------------------------------------------------------------------------- #
+#                                   Requêtes                                   #
+# ---------------------------------------------------------------------------- #
+
+
+def cle_valide(cle: str | None) -> bool:
+    """Vrai si `cle` est une des clés d'API de `settings.API["CLES"]`."""
+    if not cle:
+        return False
+    # en octets: compare_digest refuse les str non ASCII (TypeError, donc une erreur 500)
+    cle = cle.encode()
+    return any(hmac.compare_digest(cle, valide.encode()) for valide in settings.API["CLES"])
+
+
+def encoder_curseur(ressource: Ressource, pk) -> str:
+    return base64.urlsafe_b64encode(json.dumps([ressource.nom, pk]).encode()).decode()
+
+
+def decoder_curseur(ressource: Ressource, curseur: str):
+    """:raise ValueError: si le curseur n'a pas été produit pour cette ressource."""
+    try:
+        nom, pk = json.loads(base64.urlsafe_b64decode(curseur.encode()))
+    except (ValueError, TypeError) as e:
+        msg = "Curseur invalide"
+        raise ValueError(msg) from e
+    if nom != ressource.nom or not isinstance(pk, int):
+        msg = "Curseur invalide"
+        raise ValueError(msg)
+    return pk
+
+
+def _entier(valeur: str, nom: str) -> int:
+    try:
+        return int(valeur)
+    except ValueError:
+        msg = f"{nom} doit être un entier: {valeur!r}"
+        raise ValueError(msg) from None
+
+
+@dataclass(frozen=True)
+class Lecture:
+    """Ce qu'il faut lire d'une ressource: ses champs et ceux des relations incluses."""
+
+    ressource: Ressource
+    champs: tuple[str, ...]
+    # nom de la relation -> (ressource incluse, ses champs)
+    inclusions: dict[str, tuple[Ressource, tuple[str, ...]]]
+
+    @classmethod
+    def depuis_parametres(cls, nom: str, parametres) -> "Lecture":
+        """
+        Lit `?fields=`, `?include=` et `?fields[<ressource incluse>]=`.
+
+        :raise LookupError: si la ressource n'existe pas.
+        :raise ValueError: si un champ ou une relation n'existe pas.
+        """
+        ressource = RESSOURCES[nom]
+        inclusions = {}
+        for relation in filter(None, parametres.get("include", "").split(",")):
+            if relation not in ressource.relations:
+                msg = (
+                    f"Relation inconnue pour {nom}: {relation} "
+                    f"(possibles: {', '.join(ressource.relations)})"
+                )
+                raise ValueError(msg)
+            incluse = RESSOURCES[ressource.relations[relation].ressource]
+            champs = incluse.choisir_champs(parametres.get(f"fields[{incluse.nom}]"))
+            inclusions[relation] = (incluse, champs)
+        champs = ressource.choisir_champs(parametres.get("fields"))
+        # une relation incluse vers un seul objet remplace le champ de son identifiant
+        champs += tuple(
+            relation
+            for relation in inclusions
+            if relation in ressource.champs and relation not in champs
+        )
+        return cls(ressource, champs, inclusions)
+
+    def _colonnes(self) -> dict[str, str]:
+        """Colonnes du SELECT principal: {chemin ORM: chemin ORM} (dédoublonnées)."""
+        chemins = [self.ressource.champs[nom] for nom in self.champs]
+        for nom, (incluse, champs) in self.inclusions.items():
+            relation = self.ressource.relations[nom]
+            if not relation.multiple:
+                chemins += [f"{relation.chemin}__{incluse.champs[c]}" for c in champs]
+        return dict.fromkeys(chemins)
+
+    def lire(self, queryset) -> list[dict]:
+        """Objets JSON de `queryset` (déjà filtré et trié), relations comprises."""
+        objets = []
+        for ligne in queryset.values(*self._colonnes()):
+            objet = {nom: ligne[self.ressource.champs[nom]] for nom in self.champs}
+            for nom, (incluse, champs) in self.inclusions.items():
+                relation = self.ressource.relations[nom]
+                if relation.multiple:
+                    continue
+                prefixe = f"{relation.chemin}__"
+                objet[nom] = (
+                    {c: ligne[prefixe + incluse.champs[c]] for c in champs}
+                    if ligne[prefixe + "pk"] is not None
+                    else None
+                )
+            objets.append(objet)
+        self._inclure_multiples(objets)
+        return objets
+
+    def _inclure_multiples(self, objets: list[dict]):
+        ids = [objet["id"] for objet in objets]
+        for nom, (incluse, champs) in self.inclusions.items():
+            relation = self.ressource.relations[nom]
+            if not relation.multiple:
+                continue
+            par_parent = {pk: [] for pk in ids}
+            chemins = dict.fromkeys(incluse.champs[c] for c in champs)
+            lignes = (
+                incluse.modele._default_manager.filter(**{f"{relation.chemin}__in": ids})
+                .order_by("pk")
+                .values(*chemins, api_parent=F(relation.chemin))
+            )
+            for ligne in lignes:
+                par_parent[ligne["api_parent"]].append(
+                    {c: ligne[incluse.champs[c]] for c in champs}
+                )
+            for objet in objets:
+                objet[nom] = par_parent[objet["id"]]
+
+    def page(
+        self, curseur: str | None = None, limite: int = PAR_PAGE
+    ) -> tuple[list[dict], str | None]:
+        """
+        Renvoie (objets, curseur de la page suivante ou None), par clé primaire croissante.
+
+        :raise ValueError: si le curseur est invalide.
+        """
+        queryset = self.ressource.modele._default_manager.order_by("pk")
+        if curseur:
+            queryset = queryset.filter(pk__gt=decoder_curseur(self.ressource, curseur))
+        objets = self.lire(queryset[: limite + 1])
+        suivant = None
+        if len(objets) > limite:
+            objets = objets[:limite]
+            suivant = encoder_curseur(self.ressource, objets[-1]["id"])
+        return objets, suivant
+
+    def par_ids(self, ids: list[int]) -> tuple[list[dict], list[int]]:
+        """Renvoie (objets dans l'ordre de `ids`, identifiants introuvables)."""
+        trouves = {
+            objet["id"]: objet
+            for objet in self.lire(self.ressource.modele._default_manager.filter(pk__in=ids))
+        }
+        manquants = [pk for pk in ids if pk not in trouves]
+        return [trouves[pk] for pk in ids if pk in trouves], manquants
+
+
+def repondre(nom: str, parametres) -> dict:
+    """
+    Contenu de la réponse à `GET /agence/api/<nom>/` avec les paramètres `parametres`:
+    `?ids=` (au plus `LIMITE_MAX`), ou sinon une page de `?limite=` objets après
+    `?curseur=`.
+
+    :raise LookupError: si la ressource n'existe pas.
+    :raise ValueError: si un paramètre est invalide.
+    """
+    lecture = Lecture.depuis_parametres(nom, parametres)
+    if "ids" in parametres:
+        ids = [_entier(pk, "ids") for pk in parametres["ids"].split(",") if pk]
+        ids = list(dict.fromkeys(ids))
+        if len(ids) > LIMITE_MAX:
+            msg = f"Au plus {LIMITE_MAX} identifiants par appel ({len(ids)} demandés)"
+            raise ValueError(msg)
+        objets, manquants = lecture.par_ids(ids)
+        return {"resultats": objets, "manquants": manquants}
+    limite = _entier(parametres.get("limite", PAR_PAGE), "limite")
+    if not 1 <= limite <= LIMITE_MAX:
+        msg = f"limite doit être entre 1 et {LIMITE_MAX}"
+        raise ValueError(msg)
+    objets, suivant = lecture.page(parametres.get("curseur"), limite)
+    return {"resultats": objets, "suivant": suivant}
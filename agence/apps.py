@@ -1,6 +1,25 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class AgenceConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "agence"
+
+    def ready(self):
+        from . import (  # noqa: PLC0415
+            alertes,
+            direct,
+            entonnoir,
+            estimation,
+            identite,
+            instantane,
+            recherche,
+            recherche_texte,
+            referentiel,
+        )
+
+        identite.installer_descripteurs(self.get_models())
+        referentiel.installer_descripteurs(self.get_models())
+        # la table FTS5 est virtuelle: elle n'a pas de migration
+        post_migrate.connect(recherche_texte.creer_table, sender=self)
@@ -0,0 +1,160 @@
+"""
+Chronologie d'un fait d'achat: messages, rendez-vous et avis fusionnés par date.
+
+Les trois flux sont lus avec une seule requête UNION ALL, du plus récent au plus
+ancien, et paginés par curseur sur (date, type, id): la page suivante reprend
+juste après le dernier événement affiché, sans OFFSET. Chaque branche de l'union
+applique elle-même la condition du curseur, ce qui lui permet d'utiliser l'index
+(fait_achat, date) de sa table.
+
+`apercus` lit la première page de plusieurs faits d'achat en une seule requête:
+chaque branche ne garde que ses `limite` + 1 derniers événements par fait d'achat
+(ROW_NUMBER() partitionné par fait d'achat), puis les trois sont fusionnées.
+"""
+
+import base64
+import json
+from datetime import datetime
+from typing import NamedTuple
+
+from django.db.models import CharField, F, IntegerField, Q, Value, Window
+from django.db.models.functions import RowNumber, Substr
+from django.utils.dateparse import parse_datetime
+
+from .models import Avis, Message, RendezVous
+
+PAR_PAGE = 20
+LONGUEUR_TEXTE = 280  # les textes sont tronqués: la chronologie n'est qu'un aperçu
+
+
+class Evenement(NamedTuple):
+    type: str  # "avis", "message" ou "rendezvous"
+    id: int
+    date: datetime
+    texte: str  # commentaire de l'avis, contenu du message ou objet du rendez-vous
+    auteur_id: int | None  # seulement pour les messages
+
+
+class PageChronologie(NamedTuple):
+    evenements: list[Evenement]
+    suivant: str | None  # curseur de la page suivante (événements plus anciens)
+
+
+# type -> (modèle, champ du texte, champ de l'auteur)
+SOURCES = {
+    "avis": (Avis, "commentaire", None),
+    "message": (Message, "contenu", "auteur_id"),
+    "rendezvous": (RendezVous, "objet", None),
+}
+
+
+def encoder_curseur(evenement: Evenement) -> str:
+    position = [evenement.date.isoformat(), evenement.type, evenement.id]
+    return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+
+def decoder_curseur(curseur: str) -> tuple[datetime, str, int]:
+    """:raise ValueError: si le curseur n'a pas été produit par `encoder_curseur`."""
+    try:
+        date, type_, id_ = json.loads(base64.urlsafe_b64decode(curseur.encode()))
+        date = parse_datetime(date)
+    except (ValueError, TypeError) as e:
+        msg = "Curseur de chronologie invalide"
+        raise ValueError(msg) from e
+    if date is None or type_ not in SOURCES or not isinstance(id_, int):
+        msg = "Curseur de chronologie invalide"
+        raise ValueError(msg)
+    return date, type_, id_
+
+
+def _branche(type_, fait_achat_id, position):
+    queryset = SOURCES[type_][0].objects.filter(fait_achat_id=fait_achat_id)
+    if position is not None:
+        # (date, type, id) < position, simplifié sachant que le type est fixe ici
+        date, type_curseur, id_ = position
+        if type_ < type_curseur:
+            queryset = queryset.filter(date__lte=date)
+        elif type_ > type_curseur:
+            queryset = queryset.filter(date__lt=date)
+        else:
+            queryset = queryset.filter(Q(date__lt=date) | Q(date=date, id__lt=id_))
+    return _colonnes(queryset, type_)
+
+
+def _colonnes(queryset, type_, *avant):
+    """Les colonnes (`avant`, type, id, date, texte, auteur) d'une branche de l'union."""
+    _, champ_texte, champ_auteur = SOURCES[type_]
+    # uniquement des annotations, pour que les colonnes soient dans le même ordre
+    # dans chaque branche de l'union
+    return (
+        queryset.order_by()
+        .annotate(
+            t=Value(type_, output_field=CharField()),
+            i=F("id"),
+            d=F("date"),
+            x=Substr(champ_texte, 1, LONGUEUR_TEXTE),
+            a=F(champ_auteur) if champ_auteur else Value(None, output_field=IntegerField()),
+        )
+        .values_list(*avant, "t", "i", "d", "x", "a")
+    )
+
+
+def _page(lignes, limite: int) -> PageChronologie:
+    evenements = [Evenement(*ligne) for ligne in lignes]
+    suivant = None
+    if len(evenements) > limite:
+        evenements = evenements[:limite]
+        suivant = encoder_curseur(evenements[-1])
+    return PageChronologie(evenements, suivant)
+
+
+def chronologie(fait_achat_id: int, curseur: str | None = None, limite: int = PAR_PAGE):
+    """
+    Renvoie une page de la chronologie du fait d'achat, du plus récent au plus ancien.
+
+    :param curseur: `PageChronologie.suivant` de la page précédente, None pour la
+        première page.
+    :raise ValueError: si le curseur est invalide.
+    """
+    position = decoder_curseur(curseur) if curseur else None
+    premiere, *autres = (_branche(type_, fait_achat_id, position) for type_ in SOURCES)
+    lignes = premiere.union(*autres, all=True).order_by("-d", "-t", "-i")[: limite + 1]
+    return _page(lignes, limite)
+
+
+def _cle_tri(ligne):
+    # même ordre que `chronologie`: (date, type, id)
+    type_, id_, date, *_ = ligne
+    return date, type_, id_
+
+
+def apercus(fait_achat_ids, limite: int = PAR_PAGE) -> dict[int, PageChronologie]:
+    """
+    La première page de la chronologie de chacun des faits d'achat, en une requête:
+    `{fait_achat_id: chronologie(fait_achat_id, limite=limite)}`.
+    """
+    fait_achat_ids = list(fait_achat_ids)
+    branches = [
+        _colonnes(
+            modele.objects.filter(fait_achat_id__in=fait_achat_ids)
+            .annotate(
+                rang=Window(
+                    RowNumber(),
+                    partition_by=F("fait_achat_id"),
+                    order_by=[F("date").desc(), F("id").desc()],
+                )
+            )
+            .filter(rang__lte=limite + 1),
+            type_,
+            "fait_achat_id",
+        )
+        for type_, (modele, _, _) in SOURCES.items()
+    ]
+    premiere, *autres = branches
+    par_fait = {pk: [] for pk in fait_achat_ids}
+    for fait_achat_id, *ligne in premiere.union(*autres, all=True):
+        par_fait[fait_achat_id].append(ligne)
+    return {
+        pk: _page(sorted(lignes, key=_cle_tri, reverse=True), limite)
+        for pk, lignes in par_fait.items()
+    }
@@ -0,0 +1,130 @@
+"""
+Suivi en direct des échanges d'un fait d'achat (messages, avis, rendez-vous).
+
+Chaque création d'un de ces objets (via `save()`) est inscrite dans le journal
+`EvenementAchat` puis, une fois la transaction validée, son id est publié sur un
+canal en mémoire auquel sont abonnés les flux Server-Sent Events ouverts
+(`views.flux_fait_achat`). La publication ne sert qu'à réveiller les flux, qui lisent
+ensuite le journal depuis leur dernier id: rien n'est perdu ni envoyé en double.
+Le canal n'existe que dans le processus courant, les flux relisent donc aussi le
+journal à chaque battement de cœur pour voir les événements des autres processus.
+Les clients sans EventSource interrogent le journal avec un curseur "depuis l'id"
+(`views.evenements_fait_achat`).
+
+Les flux SSE sont des vues asynchrones, qui ne restent ouvertes qu'avec un serveur
+ASGI (uvicorn...). Sous WSGI (runserver, gunicorn), Django lit une réponse en flux
+jusqu'au bout avant de l'envoyer: la page de chronologie interroge alors le journal,
+et le flux répond tout de suite avec les événements en attente et demande au client
+de se reconnecter (`retry`) après `INTERVALLE_SANS_FLUX` secondes.
+"""
+
+import asyncio
+import json
+import threading
+from collections import defaultdict
+from contextlib import asynccontextmanager
+
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
+from django.db.models.signals import post_save
+
+from .chronologie import LONGUEUR_TEXTE, SOURCES
+from .models import EvenementAchat
+
+BATTEMENT = 15  # secondes entre deux commentaires SSE quand rien ne se passe
+MAX_EVENEMENTS = 100  # par réponse du journal
+INTERVALLE_SANS_FLUX = 10  # secondes entre deux interrogations du journal, sous WSGI
+
+
+class Canal:
+    """Publication/abonnement en mémoire, par fait d'achat."""
+
+    def __init__(self):
+        self._abonnes = defaultdict(set)  # fait_achat_id -> {(boucle, file)}
+        self._verrou = threading.Lock()
+
+    @asynccontextmanager
+    async def abonnement(self, fait_achat_id: int):
+        """Renvoie une file qui reçoit les événements publiés pour ce fait d'achat."""
+        abonne = (asyncio.get_running_loop(), asyncio.Queue())
+        with self._verrou:
+            self._abonnes[fait_achat_id].add(abonne)
+        try:
+            yield abonne[1]
+        finally:
+            with self._verrou:
+                self._abonnes[fait_achat_id].discard(abonne)
+                if not self._abonnes[fait_achat_id]:
+                    del self._abonnes[fait_achat_id]
+
+    def publier(self, fait_achat_id: int, message):
+        """Peut être appelé depuis n'importe quel thread."""
+        with self._verrou:
+            abonnes = list(self._abonnes.get(fait_achat_id, ()))
+        for boucle, file in abonnes:
+            boucle.call_soon_threadsafe(file.put_nowait, message)
+
+
+canal = Canal()
+
+
+def _donnees(entree: EvenementAchat, objet) -> dict:
+    _, champ_texte, champ_auteur = SOURCES[entree.type]
+    return {
+        "id": entree.pk,
+        "type": entree.type,
+        "objet_id": entree.objet_id,
+        "date": objet.date.isoformat(),
+        "texte": getattr(objet, champ_texte)[:LONGUEUR_TEXTE],
+        "auteur_id": getattr(objet, champ_auteur) if champ_auteur else None,
+    }
+
+
+def evenements_depuis(fait_achat_id: int, depuis: int = 0, limite: int = MAX_EVENEMENTS):
+    """
+    Renvoie les événements du journal d'id > `depuis`, du plus ancien au plus récent
+    (au plus `limite`, reprendre ensuite depuis le dernier id renvoyé).
+    """
+    entrees = list(
+        EvenementAchat.objects.filter(fait_achat_id=fait_achat_id, id__gt=depuis).order_by("id")[
+            :limite
+        ]
+    )
+    par_type = defaultdict(list)
+    for entree in entrees:
+        par_type[entree.type].append(entree.objet_id)
+    objets = {type_: SOURCES[type_][0].objects.in_bulk(ids) for type_, ids in par_type.items()}
+    return [
+        _donnees(entree, objet)
+        for entree in entrees
+        # objet supprimé depuis: on saute l'événement
+        if (objet := objets[entree.type].get(entree.objet_id)) is not None
+    ]
+
+
+def flux_disponible(request) -> bool:
+    """Vrai si un flux SSE peut rester ouvert: requête servie par un serveur ASGI."""
+    return isinstance(request, ASGIRequest)
+
+
+def format_sse(evenement: dict) -> str:
+    return f"id: {evenement['id']}\nevent: {evenement['type']}\ndata: {json.dumps(evenement)}\n\n"
+
+
+# ---------------------------------------------------------------------------- #
+#                                    Signaux                                   #
+# ---------------------------------------------------------------------------- #
+
+
+def _journaliser(sender, instance, created, raw, using, **kwargs):
+    if raw or not created:
+        return
+    type_ = next(type_ for type_, (modele, *_) in SOURCES.items() if modele is sender)
+    entree = EvenementAchat.objects.using(using).create(
+        fait_achat_id=instance.fait_achat_id, type=type_, objet_id=instance.pk
+    )
+    transaction.on_commit(lambda: canal.publier(entree.fait_achat_id, entree.pk), using=using)
+
+
+for _modele, *_ in SOURCES.values():
+    post_save.connect(_journaliser, sender=_modele)
@@ -0,0 +1,266 @@
+"""
+Entonnoir de vente: faits d'achat par étape et biens par état, jour par jour, pour
+une agence ou un agent.
+
+Compter en direct avec un GROUP BY sur FaitAchat -> Bien -> Agent -> Agence parcourt
+tous les faits d'achat à chaque affichage. Les tables d'agrégats `EtapeAchatJour` et
+`EtatBienJour` gardent à la place, pour chaque jour, agent et valeur, le nombre
+d'entrées et de sorties (quelques lignes par agent et par jour), maintenues à chaque
+modification par les signaux en bas du module:
+
+- les entrées d'une étape sur une période donnent l'entonnoir (combien de faits
+  d'achat sont arrivés à chaque étape);
+- la somme des entrées moins les sorties (plus les transferts, voir plus bas)
+  jusqu'à un jour donne le nombre de faits d'achat (ou de biens) dans chaque étape
+  (ou état) ce jour-là.
+
+Un changement d'agent d'un bien est un transfert, pour le bien et tous ses faits
+d'achat: le stock passe de l'ancien agent au nouveau (colonne `transferts`), sans
+compter d'entrée ni de sortie. L'entonnoir ne compte donc que les vrais passages
+d'étape, et les entrées passées restent à l'agent qui les a eues. Une agence
+regroupe les statistiques de ses agents actuels.
+
+Les modifications qui ne passent pas par save() ne sont pas suivies: après un
+`bulk_create`, appeler `ajouter_biens` ou `ajouter_faits_achat`, et après un `update`
+ou du SQL brut, `reconstruire_entonnoir` (commande `reconstruire_entonnoir`).
+"""
+
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncDate
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import instantane
+from .models import Bien, EtapeAchatJour, EtatBienJour, FaitAchat
+
+# table d'agrégats -> champ de la valeur comptée
+CHAMPS = {EtapeAchatJour: "etape_achat", EtatBienJour: "etat"}
+
+
+def _ajuster(using, modele, cle, **compteurs):
+    """
+    Ajoute `compteurs` (entrees, sorties, transferts) à la ligne du jour de `cle`:
+    (agent_id, valeur), comme pour `_deplacer`.
+    """
+    agent_id, valeur = cle
+    cle = {"jour": timezone.localdate(), "agent_id": agent_id, CHAMPS[modele]: valeur}
+    lignes = modele.objects.using(using)
+    # pas de contrainte unique (agent peut être NULL): deux créations simultanées
+    # font deux lignes, sans conséquence puisque les lectures font des sommes
+    pk = lignes.filter(**cle).values_list("pk", flat=True).first()
+    if pk is None:
+        lignes.create(**cle, **compteurs)
+    else:
+        lignes.filter(pk=pk).update(**{nom: F(nom) + n for nom, n in compteurs.items()})
+
+
+def _deplacer(using, modele, avant, apres, nombre=1):
+    """`avant`, `apres`: (agent_id, valeur) ou None (création, suppression)."""
+    if avant == apres:
+        return
+    if avant is not None and apres is not None and avant[1] == apres[1]:
+        # même valeur, autre agent: transfert
+        _ajuster(using, modele, avant, transferts=-nombre)
+        _ajuster(using, modele, apres, transferts=nombre)
+        return
+    if avant is not None:
+        _ajuster(using, modele, avant, sorties=nombre)
+    if apres is not None:
+        _ajuster(using, modele, apres, entrees=nombre)
+
+
+def ajouter_biens(biens):
+    """Compte les biens du queryset `biens`, créés sans passer par save()."""
+    for agent_id, etat, nombre in (
+        biens.values_list("agent_id", "etat").annotate(n=Count("pk")).order_by()
+    ):
+        _ajuster(biens.db, EtatBienJour, (agent_id, etat), entrees=nombre)
+
+
+def ajouter_faits_achat(faits):
+    """Compte les faits d'achat du queryset `faits`, créés sans passer par save()."""
+    for agent_id, etape, nombre in (
+        faits.values_list("bien__agent_id", "etape_achat").annotate(n=Count("pk")).order_by()
+    ):
+        _ajuster(faits.db, EtapeAchatJour, (agent_id, etape), entrees=nombre)
+
+
+def reconstruire_entonnoir():
+    """
+    Recalcule les tables d'agrégats à partir des données actuelles. L'historique est
+    perdu: chaque fait d'achat est compté comme entré dans son étape actuelle le jour
+    de sa création, et chaque bien comme entré dans son état actuel aujourd'hui.
+    """
+    aujourdhui = timezone.localdate()
+    etapes = (
+        FaitAchat.objects.annotate(jour=TruncDate("cree_le"))
+        .values_list("jour", "bien__agent_id", "etape_achat")
+        .annotate(n=Count("pk"))
+        .order_by()
+    )
+    etats = Bien.objects.values_list("agent_id", "etat").annotate(n=Count("pk")).order_by()
+    with transaction.atomic():
+        EtapeAchatJour.objects.all().delete()
+        EtatBienJour.objects.all().delete()
+        EtapeAchatJour.objects.bulk_create(
+            EtapeAchatJour(jour=jour, agent_id=agent_id, etape_achat=etape, entrees=n)
+            for jour, agent_id, etape, n in etapes
+        )
+        EtatBienJour.objects.bulk_create(
+            EtatBienJour(jour=aujourdhui, agent_id=agent_id, etat=etat, entrees=n)
+            for agent_id, etat, n in etats
+        )
+
+
+# ---------------------------------------------------------------------------- #
+#                                    Lecture                                   #
+# ---------------------------------------------------------------------------- #
+
+
+@dataclass
+class Entonnoir:
+    jours: list[date]
+    # étape -> faits d'achat entrés dans l'étape pendant la période
+    entrees: dict[int, int] = field(default_factory=dict)
+    # étape -> faits d'achat dans l'étape à la fin de la période
+    en_cours: dict[int, int] = field(default_factory=dict)
+    # jour -> étape -> faits d'achat entrés dans l'étape ce jour-là
+    entrees_par_jour: dict[date, dict[int, int]] = field(default_factory=dict)
+    # jour -> état -> biens dans cet état à la fin du jour
+    etats_par_jour: dict[date, dict[str, int]] = field(default_factory=dict)
+    # agent -> étape -> faits d'achat entrés dans l'étape pendant la période
+    entrees_par_agent: dict[int | None, dict[int, int]] = field(default_factory=dict)
+
+
+def _portee(agence_id=None, agent_id=None) -> Q:
+    if agent_id is not None:
+        return Q(agent_id=agent_id)
+    if agence_id is not None:
+        return Q(agent__agence_id=agence_id)
+    return Q()
+
+
+def _serie(modele, portee: Q, debut: date, fin: date):
+    """
+    Renvoie ({valeur: nombre la veille de `debut`}, {jour: {valeur: (entrées, solde)}})
+    pour les jours de `debut` à `fin`, le solde étant entrées - sorties + transferts.
+    """
+    champ = CHAMPS[modele]
+    lignes = modele.objects.filter(portee)
+    initial = dict(
+        lignes.filter(jour__lt=debut)
+        .values_list(champ)
+        .annotate(n=Sum("entrees") - Sum("sorties") + Sum("transferts"))
+        .order_by()
+    )
+    par_jour = {}
+    for jour, valeur, entrees, solde in (
+        lignes.filter(jour__range=(debut, fin))
+        .values_list("jour", champ)
+        .annotate(e=Sum("entrees"), s=Sum("entrees") - Sum("sorties") + Sum("transferts"))
+        .order_by()
+    ):
+        par_jour.setdefault(jour, {})[valeur] = (entrees, solde)
+    return initial, par_jour
+
+
+def entonnoir(debut: date, fin: date, agence_id=None, agent_id=None) -> Entonnoir:
+    """
+    Lit l'entonnoir de `debut` à `fin` (inclus) dans les tables d'agrégats, pour un
+    agent, une agence, ou tout le réseau: cinq requêtes, quel que soit le nombre de
+    faits d'achat.
+    """
+    portee = _portee(agence_id, agent_id)
+    resultat = Entonnoir(jours=[debut + timedelta(n) for n in range((fin - debut).days + 1)])
+
+    en_cours, etapes_par_jour = _serie(EtapeAchatJour, portee, debut, fin)
+    etats, etats_par_jour = _serie(EtatBienJour, portee, debut, fin)
+    for jour in resultat.jours:
+        entrees_jour = {}
+        for etape, (entrees, solde) in etapes_par_jour.get(jour, {}).items():
+            entrees_jour[etape] = entrees
+            resultat.entrees[etape] = resultat.entrees.get(etape, 0) + entrees
+            en_cours[etape] = en_cours.get(etape, 0) + solde
+        resultat.entrees_par_jour[jour] = entrees_jour
+        for etat, (_, solde) in etats_par_jour.get(jour, {}).items():
+            etats[etat] = etats.get(etat, 0) + solde
+        resultat.etats_par_jour[jour] = dict(etats)
+    resultat.en_cours = en_cours
+
+    for agent, etape, entrees in (
+        EtapeAchatJour.objects.filter(portee, jour__range=(debut, fin))
+        .values_list("agent_id", "etape_achat")
+        .annotate(n=Sum("entrees"))
+        .order_by()
+    ):
+        resultat.entrees_par_agent.setdefault(agent, {})[etape] = entrees
+    return resultat
+
+
+# ---------------------------------------------------------------------------- #
+#                                    Signaux                                   #
+# ---------------------------------------------------------------------------- #
+# Chaque save() lit l'ancienne valeur avant d'écrire (une requête, partagée par tous
+# les modules pour un bien: agence.instantane), puis ajuste les compteurs de
+# l'ancienne et de la nouvelle valeur si elle a changé.
+
+
+@receiver(post_save, sender=Bien)
+def _bien_apres_save(sender, instance, using, raw, **kwargs):
+    if raw:
+        return
+    instantane_avant = instantane.avant_save(instance)
+    avant = instantane_avant and (instantane_avant.agent_id, instantane_avant.etat)
+    apres = (instance.agent_id, instance.etat)
+    _deplacer(using, EtatBienJour, avant, apres)
+    if avant is not None and avant[0] != apres[0]:
+        # les faits d'achat du bien changent d'agent avec lui
+        for etape, nombre in (
+            FaitAchat.objects.using(using)
+            .filter(bien_id=instance.pk)
+            .values_list("etape_achat")
+            .annotate(n=Count("pk"))
+            .order_by()
+        ):
+            _deplacer(using, EtapeAchatJour, (avant[0], etape), (apres[0], etape), nombre)
+
+
+@receiver(post_delete, sender=Bien)
+def _bien_apres_delete(sender, instance, using, **kwargs):
+    _deplacer(using, EtatBienJour, (instance.agent_id, instance.etat), None)
+
+
+def _agent_du_bien(using, bien_id):
+    return Bien.objects.using(using).filter(pk=bien_id).values_list("agent_id", flat=True).first()
+
+
+@receiver(pre_save, sender=FaitAchat)
+def _fait_achat_avant_save(sender, instance, using, raw, **kwargs):
+    instance._entonnoir_avant = (
+        None
+        if raw or instance.pk is None
+        else FaitAchat.objects.using(using)
+        .filter(pk=instance.pk)
+        .values_list("bien__agent_id", "etape_achat")
+        .first()
+    )
+
+
+@receiver(post_save, sender=FaitAchat)
+def _fait_achat_apres_save(sender, instance, using, raw, **kwargs):
+    if raw:
+        return
+    apres = (_agent_du_bien(using, instance.bien_id), instance.etape_achat)
+    _deplacer(using, EtapeAchatJour, getattr(instance, "_entonnoir_avant", None), apres)
+
+
+@receiver(post_delete, sender=FaitAchat)
+def _fait_achat_apres_delete(sender, instance, using, **kwargs):
+    # le bien existe encore quand ses faits d'achat sont supprimés en cascade
+    avant = (_agent_du_bien(using, instance.bien_id), instance.etape_achat)
+    _deplacer(using, EtapeAchatJour, avant, None)
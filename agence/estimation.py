@@ -0,0 +1,381 @@
+"""
+Estimation du prix d'un bien à partir des ventes comparables.
+
+Les comparables sont les `K` biens vendus (état `SIGNATURE_VENTE`, avec un prix et
+des coordonnées) les plus proches du bien à estimer, pour une distance qui mélange
+l'emplacement et les caractéristiques: `ECHELLE_DISTANCE` km comptent autant qu'une
+chambre de plus ou qu'une surface habitable 25 % plus grande (voir `ECARTS` et
+`RAPPORTS`). Le prix de chaque comparable est ramené à la surface habitable du bien
+(même prix au m²); l'estimation est la médiane de ces prix, et l'intervalle de
+confiance va de leur quantile `QUANTILES[0]` à leur quantile `QUANTILES[1]`. Les
+ventes à plus de `DISTANCE_MAX` km ne sont jamais des comparables.
+
+Chaque processus garde en mémoire un index des ventes (`IndexVentes`), construit à la
+première estimation: les ventes sont rangées dans une grille de cubes de
+`TAILLE_CELLULE` km de côté (coordonnées cartésiennes sur la sphère terrestre), et une
+estimation ne parcourt que les cellules autour du bien, de la plus proche à la plus
+lointaine, jusqu'à ce qu'aucune cellule plus lointaine ne puisse contenir un
+comparable plus proche: quelques millisecondes, quel que soit le nombre de ventes.
+
+L'index est mis à jour au fil des ventes: chaque vente conclue, modifiée ou annulée
+(signaux en bas du module, ou `signaler` après un `bulk_create` ou un `update`) ajoute
+une ligne au journal `ChangementVente`, que chaque index relit au plus toutes les
+`INTERVALLE_VERIFICATION` secondes pour ne recharger que les biens concernés. Les
+nouvelles coordonnées d'une adresse ne sont prises en compte qu'au redémarrage.
+"""
+
+import itertools
+import math
+import threading
+import time
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import Max, Q
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import instantane, metriques
+from .models import Bien, ChangementVente, InfosBien
+
+if TYPE_CHECKING:
+    import numpy as np
+
+K = 10  # comparables par estimation
+K_MIN = 3  # en dessous, pas d'estimation
+QUANTILES = (0.1, 0.9)  # bornes de l'intervalle de confiance
+DISTANCE_MAX = 20.0  # km
+ECHELLE_DISTANCE = 1.0  # km comptant pour une unité d'écart
+TAILLE_CELLULE = 5.0  # km
+INTERVALLE_VERIFICATION = 2.0  # secondes entre deux lectures du journal
+DEVISE = "EUR"
+RAYON_TERRE = 6371.0  # km
+
+# caractéristiques comparées par différence -> écart comptant pour une unité
+ECARTS = {"nb_chambres": 1, "nb_salles_bain": 1, "nb_garages": 1, "nb_cuisines": 2, "nb_wc": 2}
+# surfaces comparées par rapport -> rapport comptant pour une unité (1.25: 25 % de plus)
+RAPPORTS = {"surface_habitable": 1.25, "surface_terrain": 2.0}
+# champs de InfosBien lus pour chaque bien, dans l'ordre attendu par `_vecteurs`
+CHAMPS = ("lieu__latitude", "lieu__longitude", *ECARTS, *RAPPORTS)
+
+VENDUS = Q(
+    etat=Bien.Etat.SIGNATURE_VENTE,
+    infos_bien__prix__isnull=False,
+    infos_bien__prix_currency=DEVISE,
+    infos_bien__lieu__latitude__isnull=False,
+    infos_bien__lieu__longitude__isnull=False,
+)
+
+
+def _vecteurs(valeurs):
+    """
+    Vecteurs de comparaison (une ligne par bien) de lignes (*CHAMPS): la distance
+    euclidienne entre deux vecteurs est la distance entre deux biens. Les trois
+    premières coordonnées sont la position en km divisée par `ECHELLE_DISTANCE`.
+    Une caractéristique inconnue compte pour 0.
+    """
+    import numpy as np  # noqa: PLC0415
+
+    latitudes, longitudes = np.radians(valeurs[:, 0]), np.radians(valeurs[:, 1])
+    # corde plutôt qu'arc: moins de 1 m d'écart jusqu'à DISTANCE_MAX
+    colonnes = [
+        RAYON_TERRE * np.cos(latitudes) * np.cos(longitudes),
+        RAYON_TERRE * np.cos(latitudes) * np.sin(longitudes),
+        RAYON_TERRE * np.sin(latitudes),
+    ]
+    colonnes = [colonne / ECHELLE_DISTANCE for colonne in colonnes]
+    caracteristiques = np.nan_to_num(valeurs[:, 2:]).clip(0)
+    for i, ecart in enumerate(ECARTS.values()):
+        colonnes.append(caracteristiques[:, i] / ecart)
+    for i, rapport in enumerate(RAPPORTS.values(), start=len(ECARTS)):
+        colonnes.append(np.log1p(caracteristiques[:, i]) / math.log(rapport))
+    return np.column_stack(colonnes)
+
+
+def _cles(vecteurs):
+    """Cellule (i, j, k) de la grille de chaque vecteur."""
+    import numpy as np  # noqa: PLC0415
+
+    return np.floor(vecteurs[:, :3] * ECHELLE_DISTANCE / TAILLE_CELLULE).astype(np.int64)
+
+
+def _coques() -> list[list[tuple[int, int, int]]]:
+    """
+    Décalages des cellules à parcourir, groupés par distance (en cellules) à celle du
+    bien: la coque `r` contient les décalages dont la plus grande coordonnée vaut `r`.
+    """
+    rayon = math.ceil(DISTANCE_MAX / TAILLE_CELLULE)
+    coques = [[] for _ in range(rayon + 1)]
+    for decalage in itertools.product(range(-rayon, rayon + 1), repeat=3):
+        coques[max(map(abs, decalage))].append(decalage)
+    return coques
+
+
+COQUES = _coques()
+
+
+# ---------------------------------------------------------------------------- #
+#                                     Index                                    #
+# ---------------------------------------------------------------------------- #
+
+
+@dataclass
+class Cellule:
+    """Ventes d'une cellule de la grille, une ligne par bien."""
+
+    ids: "np.ndarray"
+    vecteurs: "np.ndarray"
+    prix: "np.ndarray"
+    surfaces: "np.ndarray"  # surface habitable, NaN si inconnue
+
+    def sans(self, ids) -> "Cellule | None":
+        import numpy as np  # noqa: PLC0415
+
+        garder = ~np.isin(self.ids, list(ids))
+        if not garder.any():
+            return None
+        return Cellule(
+            self.ids[garder], self.vecteurs[garder], self.prix[garder], self.surfaces[garder]
+        )
+
+    def avec(self, autre: "Cellule") -> "Cellule":
+        import numpy as np  # noqa: PLC0415
+
+        return Cellule(
+            *(
+                np.concatenate([getattr(self, champ), getattr(autre, champ)])
+                for champ in ("ids", "vecteurs", "prix", "surfaces")
+            )
+        )
+
+
+class IndexVentes:
+    """
+    Index en mémoire des ventes d'un processus, pour trouver les plus proches voisins
+    d'un bien, voir le docstring du module.
+    """
+
+    def __init__(self):
+        self._cellules: dict[tuple, Cellule] = {}
+        self._cellule_de: dict[int, tuple] = {}  # bien -> clé de sa cellule
+        self._dernier = None  # dernier changement lu dans le journal, None: pas construit
+        self._verifie_a = float("-inf")
+        self._verrou = threading.Lock()
+
+    def __len__(self):
+        return len(self._cellule_de)
+
+    def vider(self):
+        """Vide l'index de ce processus: il sera reconstruit à la prochaine estimation."""
+        with self._verrou:
+            self._cellules.clear()
+            self._cellule_de.clear()
+            self._dernier = None
+            self._verifie_a = float("-inf")
+
+    # ----------------------------- Mise à jour ----------------------------- #
+
+    def _verifier(self):
+        maintenant = time.monotonic()
+        if maintenant - self._verifie_a < INTERVALLE_VERIFICATION:
+            return
+        # lus sur la base principale: une réplique en retard ferait sauter des changements
+        journal = ChangementVente.objects.using(DEFAULT_DB_ALIAS)
+        biens = Bien.objects.using(DEFAULT_DB_ALIAS).filter(VENDUS)
+        if self._dernier is None:
+            # le journal d'abord: une vente conclue pendant la lecture des biens est
+            # relue à la vérification suivante
+            self._dernier = journal.aggregate(m=Max("pk"))["m"] or 0
+            self._mettre_a_jour(biens, retires=())
+        elif changements := list(
+            journal.filter(pk__gt=self._dernier).order_by("pk").values_list("pk", "bien_id")
+        ):
+            self._dernier = changements[-1][0]
+            bien_ids = {bien_id for _, bien_id in changements}
+            self._mettre_a_jour(biens.filter(pk__in=bien_ids), retires=bien_ids)
+        self._verifie_a = maintenant
+
+    def _mettre_a_jour(self, biens, retires):
+        """Retire les biens `retires` de l'index, puis y ajoute les biens vendus `biens`."""
+        import numpy as np  # noqa: PLC0415
+
+        par_cellule = {}
+        for bien_id in retires:
+            if (cle := self._cellule_de.pop(bien_id, None)) is not None:
+                par_cellule.setdefault(cle, set()).add(bien_id)
+        for cle, ids in par_cellule.items():
+            if (cellule := self._cellules[cle].sans(ids)) is None:
+                del self._cellules[cle]
+            else:
+                self._cellules[cle] = cellule
+
+        lignes = list(
+            biens.values_list(
+                "pk", "infos_bien__prix", *(f"infos_bien__{champ}" for champ in CHAMPS)
+            )
+        )
+        if not lignes:
+            return
+        ids = np.array([ligne[0] for ligne in lignes], dtype=np.int64)
+        valeurs = np.array([ligne[1:] for ligne in lignes], dtype=float)
+        vecteurs = _vecteurs(valeurs[:, 1:])
+        surfaces = valeurs[:, 1 + CHAMPS.index("surface_habitable")]
+        # lignes triées par cellule, puis découpées en une tranche par cellule
+        cles = _cles(vecteurs)
+        ordre = np.lexsort(cles.T[::-1])
+        cles = cles[ordre]
+        debuts = np.flatnonzero(np.r_[True, (cles[1:] != cles[:-1]).any(axis=1)])
+        for debut, fin in zip(debuts, [*debuts[1:], len(ordre)], strict=True):
+            tranche = ordre[debut:fin]
+            cle = tuple(cles[debut].tolist())
+            nouvelle = Cellule(
+                ids[tranche], vecteurs[tranche], valeurs[tranche, 0], surfaces[tranche]
+            )
+            cellule = self._cellules.get(cle)
+            self._cellules[cle] = nouvelle if cellule is None else cellule.avec(nouvelle)
+            self._cellule_de.update(dict.fromkeys(nouvelle.ids.tolist(), cle))
+
+    # ------------------------------- Lecture ------------------------------- #
+
+    def voisins(self, vecteur, k: int = K, exclure=()):
+        """
+        Renvoie (ids, distances, prix, surfaces) des `k` ventes les plus proches de
+        `vecteur` (voir `_vecteurs`) à moins de `DISTANCE_MAX` km, de la plus proche à
+        la plus lointaine, sans les biens `exclure`.
+        """
+        import numpy as np  # noqa: PLC0415
+
+        exclure = list(exclure)
+        portee = (DISTANCE_MAX / ECHELLE_DISTANCE) ** 2
+        colonnes = ([], [], [], [])  # ids, distances, prix, surfaces
+        with self._verrou:
+            self._verifier()
+            x, y, z = _cles(vecteur[None, :])[0].tolist()
+            for rayon, coque in enumerate(COQUES):
+                for dx, dy, dz in coque:
+                    cellule = self._cellules.get((x + dx, y + dy, z + dz))
+                    if cellule is None:
+                        continue
+                    carres = (cellule.vecteurs - vecteur) ** 2
+                    garder = carres[:, :3].sum(axis=1) <= portee
+                    if exclure:
+                        garder &= ~np.isin(cellule.ids, exclure)
+                    colonnes[0].append(cellule.ids[garder])
+                    colonnes[1].append(np.sqrt(carres[garder].sum(axis=1)))
+                    colonnes[2].append(cellule.prix[garder])
+                    colonnes[3].append(cellule.surfaces[garder])
+                # les ventes des coques suivantes sont à plus de rayon * TAILLE_CELLULE
+                # km: on s'arrête quand les k plus proches trouvées sont toutes plus près
+                distances = np.concatenate(colonnes[1]) if colonnes[1] else np.empty(0)
+                if (
+                    len(distances) >= k
+                    and np.partition(distances, k - 1)[k - 1]
+                    <= rayon * TAILLE_CELLULE / ECHELLE_DISTANCE
+                ):
+                    break
+        if not colonnes[0]:
+            return tuple(np.empty(0) for _ in colonnes)
+        ids, distances, prix, surfaces = (np.concatenate(colonne) for colonne in colonnes)
+        plus_proches = np.argsort(distances, kind="stable")[:k]
+        return tuple(colonne[plus_proches] for colonne in (ids, distances, prix, surfaces))
+
+
+INDEX = IndexVentes()
+
+
+# ---------------------------------------------------------------------------- #
+#                                  Estimation                                  #
+# ---------------------------------------------------------------------------- #
+
+
+@dataclass
+class Estimation:
+    prix: float
+    bas: float
+    haut: float
+    comparables: list[int]  # biens vendus, du plus proche au plus lointain
+
+    def __str__(self):
+        def euros(montant):
+            return f"{montant:,.0f} €".replace(",", " ")
+
+        return (
+            f"{euros(self.prix)} (de {euros(self.bas)} à {euros(self.haut)}, "
+            f"{len(self.comparables)} ventes comparables)"
+        )
+
+
+def estimer(infos: InfosBien, exclure=()) -> Estimation | None:
+    """
+    Estime le prix d'un bien à partir des ventes comparables, voir le docstring du
+    module.
+
+    :param infos: caractéristiques du bien (pas forcément enregistrées).
+    :param exclure: biens à ne pas prendre comme comparables (ex: le bien lui-même).
+    :return: None si le bien n'est pas localisé ou s'il y a moins de `K_MIN` ventes
+        comparables.
+    """
+    import numpy as np  # noqa: PLC0415
+
+    lieu = infos.lieu
+    if lieu is None or lieu.latitude is None or lieu.longitude is None:
+        return None
+    with metriques.ESTIMATION_DUREE.chronometrer():
+        valeurs = [lieu.latitude, lieu.longitude, *(getattr(infos, c) for c in CHAMPS[2:])]
+        vecteur = _vecteurs(np.array([valeurs], dtype=float))[0]
+        ids, _, prix, surfaces = INDEX.voisins(vecteur, K, exclure)
+        if len(ids) < K_MIN:
+            return None
+        # prix ramenés à la surface du bien, quand les deux surfaces sont connues
+        if infos.surface_habitable:
+            connues = surfaces > 0
+            prix = np.where(
+                connues, prix * infos.surface_habitable / np.where(connues, surfaces, 1), prix
+            )
+        bas, milieu, haut = np.quantile(prix, [QUANTILES[0], 0.5, QUANTILES[1]])
+    return Estimation(round(milieu, 2), round(bas, 2), round(haut, 2), ids.tolist())
+
+
+# ---------------------------------------------------------------------------- #
+#                                    Signaux                                   #
+# ---------------------------------------------------------------------------- #
+
+
+def signaler(bien_ids, using=DEFAULT_DB_ALIAS):
+    """
+    Ajoute les biens `bien_ids` au journal des ventes: les index les rechargeront.
+    À appeler après un `bulk_create` ou un `update` de biens vendus (ou qui l'étaient).
+    """
+    ChangementVente.objects.using(using).bulk_create(
+        [ChangementVente(bien_id=pk) for pk in bien_ids]
+    )
+
+
+@receiver(post_save, sender=Bien)
+def _bien_apres_save(sender, instance, using, raw, **kwargs):
+    if raw:
+        return
+    instantane_avant = instantane.avant_save(instance)
+    avant = instantane_avant and (instantane_avant.etat, instantane_avant.infos_bien_id)
+    apres = (instance.etat, instance.infos_bien_id)
+    vendu = Bien.Etat.SIGNATURE_VENTE
+    if avant != apres and vendu in (avant and avant[0], instance.etat):
+        signaler([instance.pk], using)
+
+
+@receiver(post_delete, sender=Bien)
+def _bien_apres_delete(sender, instance, using, **kwargs):
+    if instance.etat == Bien.Etat.SIGNATURE_VENTE:
+        signaler([instance.pk], using)
+
+
+@receiver(post_save, sender=InfosBien)
+def _infos_bien_apres_save(sender, instance, created, using, raw, **kwargs):
+    if not created and not raw:
+        signaler(
+            Bien.objects.using(using)
+            .filter(infos_bien_id=instance.pk, etat=Bien.Etat.SIGNATURE_VENTE)
+            .values_list("pk", flat=True),
+            using,
+        )
@@ -0,0 +1,205 @@
+"""
+Exports en masse (CSV ou Parquet) des biens et des transactions.
+
+Les lignes sont lues avec `values_list(...).iterator(chunk_size=...)`: les jointures
+sont faites par la base et seuls `chunk_size` tuples sont en mémoire à la fois, que
+l'export fasse mille ou dix millions de lignes. Le CSV est produit ligne par ligne
+(réponse `StreamingHttpResponse` ou fichier), le Parquet par groupes de lignes
+("row groups") de `TAILLE_GROUPE` lignes.
+
+Le Parquet nécessite pyarrow (`uv sync --extra parquet`), importé seulement quand
+on en a besoin.
+"""
+
+import csv
+import itertools
+from dataclasses import dataclass
+from datetime import date, datetime
+
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import DecimalField, Model
+
+from .models import Bien, FaitAchat
+
+CHUNK_SIZE = 2000
+TAILLE_GROUPE = 100_000  # lignes par groupe Parquet
+
+
+@dataclass(frozen=True)
+class Export:
+    nom: str
+    modele: type[Model]
+    # (nom de la colonne, chemin ORM de la valeur)
+    colonnes: tuple[tuple[str, str], ...]
+
+    @property
+    def entetes(self):
+        return [nom for nom, _ in self.colonnes]
+
+    def lignes(self, using=DEFAULT_DB_ALIAS, chunk_size=CHUNK_SIZE):
+        """Itère sur les lignes de l'export (tuples), sans tout charger en mémoire."""
+        return (
+            self.modele.objects.using(using)
+            .order_by("pk")
+            .values_list(*(chemin for _, chemin in self.colonnes))
+            .iterator(chunk_size=chunk_size)
+        )
+
+    def champ(self, chemin: str):
+        """Champ du modèle au bout du chemin ORM (ex: "infos_bien__lieu__label")."""
+        modele = self.modele
+        *relations, nom = chemin.split("__")
+        for relation in relations:
+            modele = modele._meta.get_field(relation).related_model
+        champ = modele._meta.get_field(nom)
+        # pour une clé étrangère, values_list renvoie la clé primaire de la cible
+        # (qui peut elle-même être une clé étrangère, ex: Vendeur.utilisateur)
+        while champ.is_relation:
+            champ = champ.target_field
+        return champ
+
+
+# nom -> Export
+EXPORTS: dict[str, Export] = {}
+
+
+def enregistrer_export(nom: str, modele, colonnes):
+    EXPORTS[nom] = Export(nom, modele, tuple(colonnes))
+
+
+enregistrer_export(
+    "biens",
+    Bien,
+    [
+        ("id", "id"),
+        ("etat", "etat"),
+        ("vendeur_id", "vendeur"),
+        ("agent_id", "agent"),
+        ("prix", "infos_bien__prix"),
+        ("devise", "infos_bien__prix_currency"),
+        ("nb_chambres", "infos_bien__nb_chambres"),
+        ("nb_salles_bain", "infos_bien__nb_salles_bain"),
+        ("surface_habitable", "infos_bien__surface_habitable"),
+        ("surface_terrain", "infos_bien__surface_terrain"),
+        ("adresse", "infos_bien__lieu__label"),
+        ("code_postal", "infos_bien__lieu__voie__commune__code_postal"),
+        ("commune", "infos_bien__lieu__voie__commune__nom"),
+        ("latitude", "infos_bien__lieu__latitude"),
+        ("longitude", "infos_bien__lieu__longitude"),
+    ],
+)
+
+enregistrer_export(
+    "transactions",
+    FaitAchat,
+    [
+        ("id", "id"),
+        ("bien_id", "bien"),
+        ("acheteur_id", "acheteur"),
+        ("agent_id", "bien__agent"),
+        ("etape_achat", "etape_achat"),
+        ("etat_bien", "bien__etat"),
+        ("prix", "bien__infos_bien__prix"),
+        ("devise", "bien__infos_bien__prix_currency"),
+        ("code_postal", "bien__infos_bien__lieu__voie__commune__code_postal"),
+    ],
+)
+
+
+# ---------------------------------------------------------------------------- #
+#                                      CSV                                     #
+# ---------------------------------------------------------------------------- #
+
+
+class _Echo:
+    """Pseudo-fichier: `csv.writer` renvoie directement la ligne écrite."""
+
+    @staticmethod
+    def write(valeur):
+        return valeur
+
+
+def _valeur_csv(valeur):
+    if isinstance(valeur, datetime | date):
+        return valeur.isoformat()
+    return valeur
+
+
+def lignes_csv(export: Export, using=DEFAULT_DB_ALIAS, chunk_size=CHUNK_SIZE):
+    """Itère sur les lignes CSV (chaînes), en-tête compris."""
+    writer = csv.writer(_Echo())
+    yield writer.writerow(export.entetes)
+    for ligne in export.lignes(using, chunk_size):
+        yield writer.writerow([_valeur_csv(valeur) for valeur in ligne])
+
+
+# ---------------------------------------------------------------------------- #
+#                                    Parquet                                   #
+# ---------------------------------------------------------------------------- #
+
+
+def _pyarrow():
+    try:
+        import pyarrow as pa  # noqa: PLC0415
+        import pyarrow.parquet as pq  # noqa: PLC0415
+    except ImportError as e:
+        msg = "L'export Parquet nécessite pyarrow (uv sync --extra parquet)"
+        raise ImportError(msg) from e
+    return pa, pq
+
+
+def schema_parquet(export: Export):
+    """Schéma Arrow déduit des champs du modèle (les colonnes sont toutes nullables)."""
+    pa, _ = _pyarrow()
+    types = {
+        "AutoField": pa.int64(),
+        "BigAutoField": pa.int64(),
+        "IntegerField": pa.int64(),
+        "BigIntegerField": pa.int64(),
+        "FloatField": pa.float64(),
+        "BooleanField": pa.bool_(),
+        "DateTimeField": pa.timestamp("us", tz="UTC"),
+        "DateField": pa.date32(),
+        "DurationField": pa.duration("us"),
+    }
+    champs = []
+    for nom, chemin in export.colonnes:
+        champ = export.champ(chemin)
+        if isinstance(champ, DecimalField):
+            type_ = pa.decimal128(champ.max_digits, champ.decimal_places)
+        else:
+            type_ = types.get(champ.get_internal_type(), pa.string())
+        champs.append(pa.field(nom, type_))
+    return pa.schema(champs)
+
+
+def ecrire_parquet(
+    export: Export,
+    fichier,
+    using=DEFAULT_DB_ALIAS,
+    chunk_size=CHUNK_SIZE,
+    taille_groupe=TAILLE_GROUPE,
+) -> int:
+    """
+    Écrit l'export dans `fichier` (chemin ou fichier binaire), un groupe de lignes à
+    la fois. Renvoie le nombre de lignes écrites.
+
+    :raise ImportError: si pyarrow n'est pas installé.
+    """
+    pa, pq = _pyarrow()
+    schema = schema_parquet(export)
+    lignes = export.lignes(using, chunk_size)
+    total = 0
+    with pq.ParquetWriter(fichier, schema) as writer:
+        while groupe := list(itertools.islice(lignes, taille_groupe)):
+            colonnes = zip(*groupe, strict=True)
+            tableau = pa.Table.from_arrays(
+                [
+                    pa.array(valeurs, type=champ.type)
+                    for valeurs, champ in zip(colonnes, schema, strict=True)
+                ],
+                schema=schema,
+            )
+            writer.write_table(tableau)
+            total += len(groupe)
+    return total
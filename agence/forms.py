@@ -1,3 +1,4 @@
+from datetime import timedelta
 from typing import ClassVar
 
 from bidict import bidict
@@ -9,17 +10,11 @@ from phonenumber_field.widgets import RegionalPhoneNumberWidget
 
 from agence.models import Agent, Utilisateur
 
-from . import models
+from . import models, recherche
+from .identite import get_or_none
 from .models import Bien
 
 
-def get_or_none(classmodel, **kwargs):
-    try:
-        return classmodel.objects.get(**kwargs)
-    except classmodel.DoesNotExist:
-        return None
-
-
 def email_autocomplete_field():
     return forms.CharField(label="Email", widget=autocomplete.ListSelect2(url="email-autocomplete"))
 
@@ -62,6 +57,40 @@ class InfosBienForm(forms.ModelForm):
         }
 
 
+class RechercheBienForm(forms.Form):
+    q = forms.CharField(
+        max_length=255,
+        required=False,
+        label="Mots-clés",
+        widget=forms.TextInput(attrs={"placeholder": "ex: maison jardin Lyon"}),
+    )
+    etat = forms.ChoiceField(
+        choices=[("", "Tous"), *Bien.Etat.choices], required=False, label="État"
+    )
+    tranche_prix = forms.ChoiceField(
+        choices=[("", "Toutes"), *((cle, cle) for cle in recherche.TRANCHES_PRIX)],
+        required=False,
+        label="Tranche de prix",
+    )
+    chambres = forms.TypedChoiceField(
+        choices=[("", "Indifférent")]
+        + [
+            (n, f"{n}+" if n == recherche.CHAMBRES_MAX else str(n))
+            for n in range(1, recherche.CHAMBRES_MAX + 1)
+        ],
+        coerce=int,
+        empty_value=None,
+        required=False,
+        label="Chambres",
+    )
+    prix_min = forms.DecimalField(min_value=0, required=False, label="Prix min (€)")
+    prix_max = forms.DecimalField(min_value=0, required=False, label="Prix max (€)")
+    surface_min = forms.FloatField(min_value=0, required=False, label="Surface min (m²)")
+    surface_max = forms.FloatField(min_value=0, required=False, label="Surface max (m²)")
+    terrain_min = forms.FloatField(min_value=0, required=False, label="Terrain min (m²)")
+    commune = forms.CharField(max_length=255, required=False, label="Commune (nom ou code postal)")
+
+
 class BienForm(forms.ModelForm):
     class Meta:
         model = Bien
@@ -74,6 +103,27 @@ class BienForm(forms.ModelForm):
         }
 
 
+class ImportBiensForm(forms.Form):
+    fichier = forms.FileField(
+        label="Fichier CSV",
+        help_text="Colonnes: adresse, vendeur (email), agent (email), etat, prix, ...",
+        widget=forms.ClearableFileInput(attrs={"accept": ".csv,text/csv"}),
+    )
+    agent = forms.EmailField(
+        required=False, label="Agent par défaut (email)", help_text="Si la colonne agent est vide"
+    )
+
+    def clean_agent(self):
+        email = self.cleaned_data["agent"]
+        if not email:
+            return None
+        agent = get_or_none(Agent, utilisateur__email=email)
+        if agent is None:
+            msg = "Aucun agent avec cet email."
+            raise forms.ValidationError(msg)
+        return agent
+
+
 # ---------------------------------------------------------------------------- #
 #                                 Utilisateurs                                 #
 # ---------------------------------------------------------------------------- #
@@ -218,12 +268,13 @@ class AgentForm(forms.ModelForm):
 
 class AgenceForm(forms.ModelForm):
     adresse = forms.CharField(
-        label="Adresse", widget=autocomplete.ListSelect2(url="adresse-autocomplete")
+        label="Adresse", strip=True, widget=autocomplete.ListSelect2(url="adresse-autocomplete")
     )
 
     class Meta:
         model = models.Agence
-        fields: ClassVar = ["nom", "telephone", "adresse"]
+        # l'adresse est géocodée plus tard, par la tâche creer_agence (agence.taches)
+        fields: ClassVar = ["nom", "telephone"]
         labels: ClassVar = {
             "nom": "Nom",
             "telephone": "Téléphone",
@@ -232,13 +283,6 @@ class AgenceForm(forms.ModelForm):
             "telephone": RegionalPhoneNumberWidget(),
         }
 
-    def clean_adresse(self):
-        texte = self.cleaned_data["adresse"]
-        try:
-            adresse = models.Adresse.from_texte(texte)
-        except ValueError as e:
-            raise forms.ValidationError(str(e)) from e
-        return adresse
 
 # ---------------------------------------------------------------------------- #
 #                                  Fait Achats                                 #
@@ -271,4 +315,38 @@ class AvisForm(forms.ModelForm):
             avis.date = timezone.now()
         if commit:
             avis.save()
-        return avis
\ No newline at end of file
+        return avis
+
+
+class EntonnoirForm(forms.Form):
+    JOURS_DEFAUT = 30
+    JOURS_MAX = 366
+
+    debut = forms.DateField(
+        required=False, label="Du", widget=forms.DateInput(attrs={"type": "date"})
+    )
+    fin = forms.DateField(
+        required=False, label="Au", widget=forms.DateInput(attrs={"type": "date"})
+    )
+    agence = forms.ModelChoiceField(
+        queryset=models.Agence.objects.order_by("nom"), required=False, empty_label="Toutes"
+    )
+    agent = forms.ModelChoiceField(
+        queryset=Agent.objects.select_related("utilisateur", "agence").order_by("utilisateur__nom"),
+        required=False,
+        empty_label="Tous",
+    )
+
+    def clean(self):
+        cleaned_data = super().clean()
+        # par défaut, les JOURS_DEFAUT derniers jours
+        fin = cleaned_data.get("fin") or timezone.localdate()
+        debut = cleaned_data.get("debut") or fin - timedelta(days=self.JOURS_DEFAUT - 1)
+        if debut > fin:
+            msg = "La date de début doit être avant la date de fin."
+            raise forms.ValidationError(msg)
+        if (fin - debut).days >= self.JOURS_MAX:
+            msg = f"La période est limitée à {self.JOURS_MAX} jours."
+            raise forms.ValidationError(msg)
+        cleaned_data["debut"], cleaned_data["fin"] = debut, fin
+        return cleaned_data
@@ -0,0 +1,100 @@
+"""
+Géocodage en lot avec l'API Adresse (Base Adresse Nationale): l'endpoint
+/search/csv/ géocode un fichier CSV entier en une seule requête, envoyé ici par lots
+de `TAILLE_LOT` adresses.
+
+La doc de l'API: https://adresse.data.gouv.fr/outils/api-doc/adresse
+L'URL de l'API est dans le réglage `API_ADRESSE_URL`.
+"""
+
+import csv
+import io
+from typing import NamedTuple
+
+from django.conf import settings
+
+from . import metriques
+
+TAILLE_LOT = 5000  # adresses par requête /search/csv/ (limite de l'API: 50 Mo)
+SCORE_MIN = 0.5  # en dessous, on considère que l'adresse n'a pas été trouvée
+
+
+class ErreurGeocodage(ValueError):
+    pass
+
+
+class ResultatGeocodage(NamedTuple):
+    id_ban: str
+    label: str
+    numero: str
+    voie: str
+    code_insee: str
+    commune: str
+    code_postal: str
+    longitude: float
+    latitude: float
+
+
+def _resultat_csv(ligne: dict) -> ResultatGeocodage | None:
+    # result_street est vide pour les lieux-dits: le nom du lieu-dit sert alors de voie
+    voie = ligne.get("result_street") or ligne.get("result_name")
+    try:
+        score = float(ligne.get("result_score") or 0)
+        if score < SCORE_MIN or not (ligne.get("result_id") and voie):
+            return None
+        return ResultatGeocodage(
+            id_ban=ligne["result_id"],
+            label=ligne["result_label"],
+            numero=ligne.get("result_housenumber", ""),
+            voie=voie,
+            code_insee=ligne["result_citycode"],
+            commune=ligne["result_city"],
+            code_postal=ligne["result_postcode"],
+            longitude=float(ligne["longitude"]),
+            latitude=float(ligne["latitude"]),
+        )
+    except (KeyError, ValueError):
+        return None
+
+
+def _geocoder_csv(textes: list[str]) -> list[ResultatGeocodage | None]:
+    import requests  # noqa: PLC0415
+
+    fichier = io.StringIO()
+    writer = csv.writer(fichier)
+    writer.writerow(["adresse"])
+    writer.writerows([texte] for texte in textes)
+    try:
+        with metriques.GEOCODAGE_DUREE.chronometrer(api="search_csv"):
+            response = requests.post(
+                f"{settings.API_ADRESSE_URL}/search/csv/",
+                files={"data": ("adresses.csv", fichier.getvalue().encode(), "text/csv")},
+                data={"columns": "adresse"},
+                timeout=300,
+            )
+        response.raise_for_status()
+    except requests.RequestException as e:
+        metriques.GEOCODAGE_ECHECS.inc(api="search_csv")
+        msg = "API de géocodage inaccessible"
+        raise ErreurGeocodage(msg) from e
+    lignes = list(csv.DictReader(io.StringIO(response.content.decode("utf-8-sig"))))
+    if len(lignes) != len(textes):
+        metriques.GEOCODAGE_ECHECS.inc(api="search_csv")
+        msg = f"Réponse API invalide: {len(lignes)} lignes pour {len(textes)} adresses"
+        raise ErreurGeocodage(msg)
+    return [_resultat_csv(ligne) for ligne in lignes]
+
+
+def geocoder_lot(textes, taille_lot: int = TAILLE_LOT) -> dict[str, ResultatGeocodage | None]:
+    """
+    Géocode plusieurs adresses (les doublons ne sont envoyés qu'une fois).
+
+    :return: {texte: résultat, ou None si l'adresse n'a pas été trouvée}
+    :raise ErreurGeocodage: si l'API est inaccessible ou sa réponse invalide.
+    """
+    uniques = list(dict.fromkeys(textes))
+    resultats = {}
+    for debut in range(0, len(uniques), taille_lot):
+        lot = uniques[debut : debut + taille_lot]
+        resultats.update(zip(lot, _geocoder_csv(lot), strict=True))
+    return resultats
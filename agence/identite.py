@@ -0,0 +1,183 @@
+"""
+Carte d'identité ("identity map") limitée à une requête HTTP.
+
+Pendant une requête, chaque objet (modèle, clé primaire) n'est chargé qu'une seule
+fois: `get_or_none` et l'accès aux clés étrangères (ex: `bien.vendeur`,
+`vendeur.utilisateur`) passent d'abord par la carte avant de faire une requête SQL.
+La carte est activée par `agence.middleware.CarteIdentiteMiddleware`, en dehors
+d'une requête rien ne change.
+
+Les objets enregistrés ou supprimés via l'ORM (`save()`, `delete()`) sont mis à jour
+dans la carte (voir `installer_descripteurs` pour les suppressions). Par contre, les
+modifications faites avec `QuerySet.update()` ou en SQL brut ne sont pas vues jusqu'à
+la fin de la requête.
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.core.exceptions import ValidationError
+from django.db.models.fields.related_descriptors import (
+    ForwardManyToOneDescriptor,
+    ForwardOneToOneDescriptor,
+)
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+
+class CarteIdentite:
+    def __init__(self):
+        self.objets = {}
+        self.succes = 0
+        self.echecs = 0
+
+    @staticmethod
+    def cle(modele, pk):
+        return (modele._meta.concrete_model._meta.label, pk)
+
+    def obtenir(self, modele, pk, charger):
+        """
+        Renvoie l'objet (modele, pk) de la carte, ou l'obtient avec `charger()` et
+        l'enregistre s'il n'y est pas encore.
+        """
+        cle = self.cle(modele, pk)
+        if cle in self.objets:
+            self.succes += 1
+            return self.objets[cle]
+        self.echecs += 1
+        objet = charger()
+        if objet is not None:
+            self.objets[cle] = objet
+        return objet
+
+    def enregistrer(self, objet):
+        self.objets[self.cle(type(objet), objet.pk)] = objet
+
+    def retirer(self, modele, pk):
+        self.objets.pop(self.cle(modele, pk), None)
+
+
+_carte_courante: ContextVar[CarteIdentite | None] = ContextVar("carte_identite", default=None)
+
+
+def carte_courante() -> CarteIdentite | None:
+    return _carte_courante.get()
+
+
+@contextmanager
+def carte_identite():
+    """Active une nouvelle carte d'identité pour la durée du bloc."""
+    carte = CarteIdentite()
+    jeton = _carte_courante.set(carte)
+    try:
+        yield carte
+    finally:
+        _carte_courante.reset(jeton)
+
+
+# ---------------------------------------------------------------------------- #
+#                                  get_or_none                                 #
+# ---------------------------------------------------------------------------- #
+
+
+def _pk_recherche(classmodel, kwargs):
+    """
+    Si la recherche se fait uniquement sur la clé primaire, renvoie sa valeur
+    (convertie dans le bon type), sinon None.
+    """
+    if len(kwargs) != 1:
+        return None
+    ((nom, valeur),) = kwargs.items()
+    champ_pk = classmodel._meta.pk
+    if nom not in {"pk", champ_pk.name, champ_pk.attname}:
+        return None
+    if hasattr(valeur, "_meta"):
+        valeur = valeur.pk
+    try:
+        return champ_pk.to_python(valeur)
+    except ValidationError:
+        return None
+
+
+def get_or_none(classmodel, **kwargs):
+    """
+    Renvoie l'objet correspondant à `kwargs` ou None. `classmodel` peut être un modèle
+    ou un queryset (ex: `Utilisateur.objects.avec_roles()`).
+    """
+    queryset = classmodel.objects.all() if isinstance(classmodel, type) else classmodel
+    modele = queryset.model
+
+    def charger():
+        try:
+            return queryset.get(**kwargs)
+        except modele.DoesNotExist:
+            return None
+
+    carte = carte_courante()
+    if carte is None or (pk := _pk_recherche(modele, kwargs)) is None:
+        return charger()
+    return carte.obtenir(modele, pk, charger)
+
+
+# ---------------------------------------------------------------------------- #
+#                               Clés étrangères                                #
+# ---------------------------------------------------------------------------- #
+
+
+class _CarteDescripteurMixin:
+    """Fait passer le chargement d'une clé étrangère par la carte d'identité."""
+
+    def get_object(self, instance):
+        charger = super().get_object
+        carte = carte_courante()
+        if carte is None:
+            return charger(instance)
+        pk = getattr(instance, self.field.attname)
+        return carte.obtenir(self.field.remote_field.model, pk, lambda: charger(instance))
+
+
+class CarteForwardManyToOneDescriptor(_CarteDescripteurMixin, ForwardManyToOneDescriptor):
+    pass
+
+
+class CarteForwardOneToOneDescriptor(_CarteDescripteurMixin, ForwardOneToOneDescriptor):
+    pass
+
+
+def installer_descripteurs(modeles):
+    """
+    Remplace les descripteurs des ForeignKey/OneToOneField des modèles donnés par
+    des descripteurs qui consultent la carte d'identité. Seules les relations vers
+    la clé primaire sont concernées (pas les héritages multi-tables).
+
+    La suppression d'un objet le retire de la carte uniquement pour les modèles
+    cibles de ces relations: un receveur post_delete sur tous les modèles
+    empêcherait Django de faire des suppressions en masse sans charger les objets.
+    """
+    cibles = set()
+    for modele in modeles:
+        for champ in modele._meta.local_fields:
+            if not (champ.many_to_one or champ.one_to_one) or champ.remote_field.parent_link:
+                continue
+            if champ.target_field != champ.remote_field.model._meta.pk:
+                continue
+            descripteur = (
+                CarteForwardOneToOneDescriptor
+                if champ.one_to_one
+                else CarteForwardManyToOneDescriptor
+            )
+            setattr(modele, champ.name, descripteur(champ))
+            cibles.add(champ.remote_field.model)
+    for cible in cibles:
+        post_delete.connect(_retirer_apres_delete, sender=cible)
+
+
+@receiver(post_save)
+def _enregistrer_apres_save(sender, instance, **kwargs):
+    if (carte := carte_courante()) is not None:
+        carte.enregistrer(instance)
+
+
+def _retirer_apres_delete(sender, instance, **kwargs):
+    if (carte := carte_courante()) is not None:
+        carte.retirer(sender, instance.pk)
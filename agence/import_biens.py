@@ -0,0 +1,213 @@
+"""
+Import en masse de biens depuis un fichier CSV (une ligne par bien).
+
+Colonnes reconnues (la première ligne du fichier donne les noms):
+`adresse` et `vendeur` (email d'un vendeur existant) sont obligatoires; `agent`
+(email), `etat` (PR, ES, MV, SC ou SV), `prix`, `nb_chambres`, `nb_salles_bain`,
+`nb_garages`, `nb_cuisines`, `nb_wc`, `surface_habitable`, `surface_terrain` et
+`description` sont facultatives.
+
+Le fichier est traité par lots de `TAILLE_LOT` lignes, chacun avec un nombre fixe
+de requêtes:
+- les adresses sont dédoublonnées puis résolues par `Adresse.bulk_from_textes`:
+  celles déjà en base (même label) ne sont pas géocodées, les autres le sont en une
+  requête et les communes, voies et adresses sont insérées ou mises à jour en masse;
+- les vendeurs et agents sont cherchés par email en une requête;
+- les `InfosBien` puis les `Bien` sont insérés avec `bulk_create`, dans une
+  transaction par lot, puis ajoutés à l'index plein texte et aux facettes.
+
+Une ligne invalide n'empêche pas l'import des autres: elle est simplement reportée
+dans `RapportImport.erreurs`. Si l'API de géocodage ne répond pas, l'import
+s'arrête après le dernier lot complet (`RapportImport.interrompu`).
+"""
+
+import csv
+import itertools
+from dataclasses import dataclass, field
+
+from django import forms
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Q
+
+from . import alertes, entonnoir, estimation, recherche, recherche_texte
+from .geocodage import ErreurGeocodage
+from .models import Adresse, Agent, Bien, InfosBien, Vendeur
+
+TAILLE_LOT = 2000
+
+COLONNES_INFOS = (
+    "prix",
+    "nb_chambres",
+    "nb_salles_bain",
+    "nb_garages",
+    "nb_cuisines",
+    "nb_wc",
+    "surface_habitable",
+    "surface_terrain",
+    "description",
+)
+COLONNES_OBLIGATOIRES = ("adresse", "vendeur")
+
+
+@dataclass
+class RapportImport:
+    lignes: int = 0
+    biens_crees: int = 0
+    adresses: int = 0  # adresses distinctes du fichier
+    erreurs: list[tuple[int, str]] = field(default_factory=list)  # (n° de ligne, message)
+    interrompu: str = ""  # raison de l'arrêt de l'import, s'il n'est pas allé au bout
+
+
+class _LigneInvalide(ValueError):
+    pass
+
+
+def _champ_formulaire(nom: str) -> forms.Field:
+    if nom == "prix":
+        # le MoneyField donne un champ montant + devise, on n'importe que des euros
+        champ = InfosBien._meta.get_field(nom)
+        return forms.DecimalField(
+            max_digits=champ.max_digits, decimal_places=champ.decimal_places, min_value=0
+        )
+    return InfosBien._meta.get_field(nom).formfield()
+
+
+CHAMPS_INFOS = {nom: _champ_formulaire(nom) for nom in COLONNES_INFOS}
+
+
+def _infos_bien(ligne: dict) -> InfosBien:
+    valeurs = {}
+    for nom, champ in CHAMPS_INFOS.items():
+        valeur = (ligne.get(nom) or "").strip()
+        if not valeur:
+            continue
+        if not isinstance(champ, forms.CharField):
+            valeur = valeur.replace(",", ".").replace(" ", "")  # "1 250,5" -> "1250.5"
+        try:
+            valeurs[nom] = champ.clean(valeur)
+        except ValidationError as e:
+            msg = f"{nom}: {' '.join(e.messages)}"
+            raise _LigneInvalide(msg) from e
+    return InfosBien(**valeurs)
+
+
+def _etat(ligne: dict) -> str:
+    etat = (ligne.get("etat") or "").strip().upper()
+    if not etat:
+        return Bien.Etat.PROSPECTION
+    if etat not in Bien.Etat.values:
+        msg = f"etat: {etat!r} n'est pas un état valide ({', '.join(Bien.Etat.values)})"
+        raise _LigneInvalide(msg)
+    return etat
+
+
+def _par_email(modele, emails) -> dict[str, int]:
+    """{email: id} des utilisateurs ayant le rôle `modele`, en une requête."""
+    return dict(
+        modele.objects.filter(utilisateur__email__in=set(emails)).values_list(
+            "utilisateur__email", "pk"
+        )
+    )
+
+
+class _ResolveurAdresses:
+    """Texte d'adresse -> id de l'`Adresse`, avec un cache partagé entre les lots."""
+
+    def __init__(self):
+        self.ids: dict[str, int | None] = {}  # None: adresse introuvable
+
+    def resoudre(self, textes):
+        """
+        :raise ErreurGeocodage: si l'API est inaccessible ou sa réponse invalide.
+        """
+        inconnus = {texte for texte in textes if texte not in self.ids}
+        if not inconnus:
+            return
+        adresses = Adresse.bulk_from_textes(inconnus)
+        self.ids.update(dict.fromkeys(inconnus))
+        self.ids.update({texte: adresse.pk for texte, adresse in adresses.items()})
+
+
+def _importer_lot(lot, resolveur: _ResolveurAdresses, agent_defaut, rapport: RapportImport):
+    """`lot`: liste de (numéro de ligne, ligne du CSV)."""
+    resolveur.resoudre({(ligne.get("adresse") or "").strip() for _, ligne in lot} - {""})
+    vendeurs = _par_email(Vendeur, ((ligne.get("vendeur") or "").strip() for _, ligne in lot))
+    agents = _par_email(Agent, ((ligne.get("agent") or "").strip() for _, ligne in lot))
+
+    infos, biens = [], []
+    for numero, ligne in lot:
+        try:
+            if manquantes := [
+                nom for nom in COLONNES_OBLIGATOIRES if not (ligne.get(nom) or "").strip()
+            ]:
+                msg = f"colonne(s) vide(s): {', '.join(manquantes)}"
+                raise _LigneInvalide(msg)
+            adresse = ligne["adresse"].strip()
+            if (lieu_id := resolveur.ids.get(adresse)) is None:
+                msg = f"adresse introuvable: {adresse!r}"
+                raise _LigneInvalide(msg)
+            email_vendeur = ligne["vendeur"].strip()
+            if (vendeur_id := vendeurs.get(email_vendeur)) is None:
+                msg = f"vendeur inconnu: {email_vendeur!r}"
+                raise _LigneInvalide(msg)
+            agent_id = agent_defaut.pk if agent_defaut else None
+            if email_agent := (ligne.get("agent") or "").strip():
+                if (agent_id := agents.get(email_agent)) is None:
+                    msg = f"agent inconnu: {email_agent!r}"
+                    raise _LigneInvalide(msg)
+            infos_bien = _infos_bien(ligne)
+            infos_bien.lieu_id = lieu_id
+            bien = Bien(etat=_etat(ligne), vendeur_id=vendeur_id, agent_id=agent_id)
+        except _LigneInvalide as e:
+            rapport.erreurs.append((numero, str(e)))
+            continue
+        infos.append(infos_bien)
+        biens.append(bien)
+
+    if not biens:
+        return
+    with transaction.atomic():
+        InfosBien.objects.bulk_create(infos)
+        for bien, infos_bien in zip(biens, infos, strict=True):
+            bien.infos_bien = infos_bien
+        Bien.objects.bulk_create(biens)
+        # bulk_create ne déclenche pas les signaux qui maintiennent les agrégats
+        nouveaux = Q(pk__in=[bien.pk for bien in biens])
+        recherche_texte.indexer(nouveaux)
+        recherche.ajouter_facettes(Bien.objects.filter(nouveaux))
+        entonnoir.ajouter_biens(Bien.objects.filter(nouveaux))
+        alertes.signaler([bien.pk for bien in biens if bien.etat == Bien.Etat.MISE_EN_VENTE])
+        estimation.signaler([bien.pk for bien in biens if bien.etat == Bien.Etat.SIGNATURE_VENTE])
+    rapport.biens_crees += len(biens)
+
+
+def importer_biens(fichier, agent=None, taille_lot: int = TAILLE_LOT) -> RapportImport:
+    """
+    Importe les biens du fichier CSV `fichier` (fichier texte ouvert, ou itérable de
+    lignes), voir le docstring du module pour les colonnes.
+
+    :param agent: agent des biens dont la colonne `agent` est vide.
+    :return: le rapport d'import (nombre de biens créés, erreurs par ligne).
+    """
+    rapport = RapportImport()
+    lecteur = csv.DictReader(fichier)
+    colonnes = {nom.strip() for nom in lecteur.fieldnames or ()}
+    if manquantes := [nom for nom in COLONNES_OBLIGATOIRES if nom not in colonnes]:
+        rapport.interrompu = f"colonne(s) manquante(s): {', '.join(manquantes)}"
+        return rapport
+    lecteur.fieldnames = [nom.strip() for nom in lecteur.fieldnames]
+
+    resolveur = _ResolveurAdresses()
+    # la ligne 1 est l'en-tête
+    lignes = enumerate(lecteur, start=2)
+    while lot := list(itertools.islice(lignes, taille_lot)):
+        rapport.lignes += len(lot)
+        try:
+            _importer_lot(lot, resolveur, agent, rapport)
+        except ErreurGeocodage as e:
+            rapport.lignes -= len(lot)
+            rapport.interrompu = f"{e} (ligne {lot[0][0]} et suivantes non importées)"
+            break
+    rapport.adresses = len(resolveur.ids)
+    return rapport
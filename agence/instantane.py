@@ -0,0 +1,45 @@
+"""
+Instantané d'un `Bien` tel qu'il est en base juste avant son save(): état, agent,
+infos du bien (prix et nombre de chambres compris), lu en une seule requête et
+partagé par les modules qui comparent l'avant et l'après d'un save() (alertes,
+entonnoir, estimation, recherche) au lieu d'une requête chacun.
+
+Les receveurs d'un signal sont appelés dans l'ordre de leur connexion: ces modules
+importent celui-ci avant de connecter les leurs, le receveur `pre_save` d'ici passe
+donc toujours en premier.
+"""
+
+from decimal import Decimal
+from typing import NamedTuple
+
+from django.db.models.signals import pre_save
+from django.dispatch import receiver
+
+from .models import Bien
+
+
+class BienAvant(NamedTuple):
+    etat: str
+    agent_id: int | None
+    infos_bien_id: int | None
+    prix: Decimal | None
+    nb_chambres: int | None
+
+
+CHAMPS = ("etat", "agent_id", "infos_bien_id", "infos_bien__prix", "infos_bien__nb_chambres")
+
+
+def avant_save(instance: Bien) -> BienAvant | None:
+    """
+    L'instantané de `instance` pris par son dernier pre_save, à lire dans un
+    receveur `post_save`. None pour une création ou un chargement de fixture (`raw`).
+    """
+    return getattr(instance, "_avant_save", None)
+
+
+@receiver(pre_save, sender=Bien)
+def _bien_avant_save(sender, instance, using, raw, **kwargs):
+    ligne = None
+    if not raw and instance.pk is not None:
+        ligne = Bien.objects.using(using).filter(pk=instance.pk).values_list(*CHAMPS).first()
+    instance._avant_save = None if ligne is None else BienAvant(*ligne)
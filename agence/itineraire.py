@@ -0,0 +1,143 @@
+"""
+Tournée de la journée d'un agent: dans quel ordre visiter les lieux de ses
+rendez-vous pour parcourir le moins de kilomètres possible.
+
+La matrice de toutes les distances (haversine) est calculée en une seule opération
+numpy, puis l'ordre de visite est construit par l'heuristique du plus proche voisin
+et amélioré par 2-opt (on inverse un segment de la tournée tant que cela la
+raccourcit). C'est une heuristique: la tournée obtenue est en général proche de
+la plus courte, sans garantie d'être optimale. Chaque passe de 2-opt évalue toutes
+les inversions possibles à partir d'une étape d'un coup, avec numpy: une
+cinquantaine d'étapes se traitent en quelques millisecondes.
+
+La tournée part de l'agence de l'agent (si son adresse est géolocalisée) et ne
+revient pas au point de départ.
+"""
+
+from dataclasses import dataclass, field
+from datetime import date, datetime, time, timedelta
+
+import numpy as np
+from django.utils import timezone
+
+from .models import RendezVous
+
+RAYON_TERRE = 6371.0  # km, comme haversine_distance
+EPSILON_GAIN = 1e-9  # km: en dessous, une inversion 2-opt n'est pas un vrai gain (arrondis)
+
+
+def matrice_distances(latitudes, longitudes) -> np.ndarray:
+    """
+    Distances de Haversine (en km) entre tous les points, en une seule passe.
+
+    :return: matrice symétrique n x n.
+    """
+    lat = np.radians(np.asarray(latitudes, dtype=float))
+    lon = np.radians(np.asarray(longitudes, dtype=float))
+    dlat = lat[:, None] - lat[None, :]
+    dlon = lon[:, None] - lon[None, :]
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat)[:, None] * np.cos(lat)[None, :] * np.sin(dlon / 2) ** 2
+    return 2 * RAYON_TERRE * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+
+def longueur(distances: np.ndarray, ordre) -> float:
+    ordre = np.asarray(ordre)
+    return float(distances[ordre[:-1], ordre[1:]].sum())
+
+
+def plus_proche_voisin(distances: np.ndarray, depart: int = 0) -> list[int]:
+    """Ordre de visite qui va toujours au point non visité le plus proche."""
+    n = len(distances)
+    visite = np.zeros(n, dtype=bool)
+    ordre = [depart]
+    visite[depart] = True
+    for _ in range(n - 1):
+        ligne = np.where(visite, np.inf, distances[ordre[-1]])
+        suivant = int(ligne.argmin())
+        ordre.append(suivant)
+        visite[suivant] = True
+    return ordre
+
+
+def deux_opt(distances: np.ndarray, ordre, max_passes: int = 50) -> list[int]:
+    """
+    Améliore un chemin ouvert (le premier point reste fixe) par 2-opt: inverser
+    ordre[i:j+1] remplace les arêtes (a, b) et (c, e) par (a, c) et (b, e).
+    """
+    ordre = np.asarray(ordre)
+    n = len(ordre)
+    for _ in range(max_passes):
+        ameliore = False
+        for i in range(1, n - 1):
+            a, b = ordre[i - 1], ordre[i]
+            c = ordre[i + 1 :]  # candidats pour la fin du segment, j = i+1 .. n-1
+            # point après le segment, aucun si le segment va jusqu'au bout du chemin
+            e = ordre[i + 2 :]
+            avant = distances[a, b] + np.append(distances[c[:-1], e], 0.0)
+            apres = distances[a, c] + np.append(distances[b, e], 0.0)
+            gains = avant - apres
+            k = int(gains.argmax())
+            if gains[k] > EPSILON_GAIN:
+                j = i + 1 + k
+                ordre[i : j + 1] = ordre[i : j + 1][::-1]
+                ameliore = True
+        if not ameliore:
+            break
+    return ordre.tolist()
+
+
+def ordre_de_visite(distances: np.ndarray, depart: int = 0) -> list[int]:
+    return deux_opt(distances, plus_proche_voisin(distances, depart))
+
+
+# ---------------------------------------------------------------------------- #
+#                              Journée d'un agent                              #
+# ---------------------------------------------------------------------------- #
+
+
+@dataclass
+class Tournee:
+    jour: date
+    depart: object = None  # adresse de l'agence, si elle est géolocalisée
+    etapes: list = field(default_factory=list)  # rendez-vous dans l'ordre de visite
+    distance_km: float = 0.0
+    distance_chronologique_km: float = 0.0  # en suivant l'ordre des horaires
+    sans_lieu: list = field(default_factory=list)  # rendez-vous non géolocalisés
+
+
+def tournee_agent(agent, jour: date) -> Tournee:
+    """Tournée optimisée des rendez-vous de l'agent pour le jour donné."""
+    debut = timezone.make_aware(datetime.combine(jour, time()))
+    rendez_vous = list(
+        RendezVous.objects.filter(
+            fait_achat__bien__agent=agent,
+            date__gte=debut,
+            date__lt=debut + timedelta(days=1),
+        )
+        .select_related("lieu")
+        .order_by("date")
+    )
+    tournee = Tournee(jour=jour)
+    geolocalises = []
+    for rdv in rendez_vous:
+        lieu = rdv.lieu
+        if lieu is None or lieu.latitude is None or lieu.longitude is None:
+            tournee.sans_lieu.append(rdv)
+        else:
+            geolocalises.append(rdv)
+    if not geolocalises:
+        return tournee
+
+    points = [rdv.lieu for rdv in geolocalises]
+    adresse_agence = agent.agence.adresse
+    if adresse_agence.latitude is not None and adresse_agence.longitude is not None:
+        tournee.depart = adresse_agence
+        points.insert(0, adresse_agence)
+    decalage = 1 if tournee.depart else 0
+
+    distances = matrice_distances([p.latitude for p in points], [p.longitude for p in points])
+    ordre = ordre_de_visite(distances)
+    tournee.etapes = [geolocalises[i - decalage] for i in ordre[decalage:]]
+    tournee.distance_km = longueur(distances, ordre)
+    tournee.distance_chronologique_km = longueur(distances, range(len(points)))
+    return tournee
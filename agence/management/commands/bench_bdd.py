@@ -0,0 +1,170 @@
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management import BaseCommand
+
+# Version réduite des tables utilisateurs, suffisante pour reproduire la charge
+# de CreateUserView (écritures) et de list_users (lectures).
+SCHEMA = """
+    CREATE TABLE agence_utilisateur (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        nom VARCHAR(255) NOT NULL,
+        prenom VARCHAR(255) NOT NULL,
+        email VARCHAR(254) NOT NULL UNIQUE
+    );
+    CREATE TABLE agence_acheteur (
+        utilisateur_id INTEGER PRIMARY KEY REFERENCES agence_utilisateur (id)
+    );
+    CREATE INDEX agence_utilisateur_nom ON agence_utilisateur (nom, prenom);
+"""
+
+REQUETE_LECTURE = """
+    SELECT u.id, u.email, u.nom, u.prenom, GROUP_CONCAT(COALESCE(a.type_, 'aucune type'))
+    FROM agence_utilisateur AS u
+    LEFT JOIN (SELECT utilisateur_id, 'acheteur' AS type_ FROM agence_acheteur) AS a
+        ON u.id = a.utilisateur_id
+    GROUP BY u.id
+    ORDER BY u.nom, u.prenom
+    LIMIT 100
+"""
+
+# Correspond au comportement par défaut de Django avec SQLite
+PRAGMAS_DEFAUT = {"journal_mode": "DELETE", "synchronous": "FULL"}
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare le débit lectures/écritures concurrentes de SQLite entre le profil "
+        "par défaut et le profil production (GESTION_IMMO_BDD=production)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--duree", type=float, default=5.0, help="Durée par profil (s)")
+        parser.add_argument("--lecteurs", type=int, default=4, help="Nombre de threads lecteurs")
+        parser.add_argument("--ecrivains", type=int, default=2, help="Nombre de threads écrivains")
+        parser.add_argument(
+            "--lignes", type=int, default=5_000, help="Nombre d'utilisateurs initiaux"
+        )
+
+    def handle(self, *args, **options):
+        profils = {
+            "defaut": (PRAGMAS_DEFAUT, "BEGIN"),
+            "production": (settings.SQLITE_PRAGMAS_PRODUCTION, "BEGIN IMMEDIATE"),
+        }
+        self.stdout.write(
+            f"{'profil':<12}{'lectures/s':>12}{'écritures/s':>13}"
+            f"{'p95 lecture':>13}{'p95 écriture':>14}{'erreurs':>9}"
+        )
+        with tempfile.TemporaryDirectory() as dossier:
+            for nom, (pragmas, begin) in profils.items():
+                chemin = Path(dossier) / f"{nom}.sqlite3"
+                preparer_base(chemin, pragmas, options["lignes"])
+                resultat = mesurer(chemin, pragmas, begin, options)
+                self.stdout.write(
+                    f"{nom:<12}"
+                    f"{resultat['lectures'] / options['duree']:>12.0f}"
+                    f"{resultat['ecritures'] / options['duree']:>13.0f}"
+                    f"{percentile_ms(resultat['latences_lecture'], 95):>11.1f}ms"
+                    f"{percentile_ms(resultat['latences_ecriture'], 95):>12.1f}ms"
+                    f"{resultat['erreurs']:>9}"
+                )
+
+
+def connecter(chemin, pragmas):
+    # isolation_level=None: on gère les transactions nous-mêmes, comme Django
+    conn = sqlite3.connect(chemin, isolation_level=None, check_same_thread=False)
+    for nom, valeur in pragmas.items():
+        conn.execute(f"PRAGMA {nom}={valeur}")
+    return conn
+
+
+def preparer_base(chemin, pragmas, nb_lignes):
+    conn = connecter(chemin, pragmas)
+    conn.executescript(SCHEMA)
+    conn.execute("BEGIN")
+    conn.executemany(
+        "INSERT INTO agence_utilisateur (nom, prenom, email) VALUES (?, ?, ?)",
+        ((f"nom{i % 500}", f"prenom{i}", f"init{i}@exemple.fr") for i in range(nb_lignes)),
+    )
+    conn.execute("INSERT INTO agence_acheteur SELECT id FROM agence_utilisateur WHERE id % 3 = 0")
+    conn.execute("COMMIT")
+    conn.close()
+
+
+def mesurer(chemin, pragmas, begin, options):
+    fin = time.perf_counter() + options["duree"]
+    verrou = threading.Lock()
+    resultat = {
+        "lectures": 0,
+        "ecritures": 0,
+        "erreurs": 0,
+        "latences_lecture": [],
+        "latences_ecriture": [],
+    }
+
+    def lecteur():
+        conn = connecter(chemin, pragmas)
+        latences, erreurs = [], 0
+        while time.perf_counter() < fin:
+            debut = time.perf_counter()
+            try:
+                conn.execute(REQUETE_LECTURE).fetchall()
+            except sqlite3.OperationalError:
+                erreurs += 1
+                continue
+            latences.append(time.perf_counter() - debut)
+        conn.close()
+        with verrou:
+            resultat["lectures"] += len(latences)
+            resultat["latences_lecture"] += latences
+            resultat["erreurs"] += erreurs
+
+    def ecrivain(numero):
+        # même schéma d'écriture que CreateUserView: un utilisateur puis son rôle,
+        # dans une seule transaction
+        conn = connecter(chemin, pragmas)
+        latences, erreurs, i = [], 0, 0
+        while time.perf_counter() < fin:
+            i += 1
+            debut = time.perf_counter()
+            try:
+                conn.execute(begin)
+                curseur = conn.execute(
+                    "INSERT INTO agence_utilisateur (nom, prenom, email) VALUES (?, ?, ?)",
+                    ("bench", f"ecrivain{numero}", f"bench{numero}-{i}@exemple.fr"),
+                )
+                conn.execute(
+                    "INSERT INTO agence_acheteur (utilisateur_id) VALUES (?)",
+                    (curseur.lastrowid,),
+                )
+                conn.execute("COMMIT")
+            except sqlite3.OperationalError:
+                erreurs += 1
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                continue
+            latences.append(time.perf_counter() - debut)
+        conn.close()
+        with verrou:
+            resultat["ecritures"] += len(latences)
+            resultat["latences_ecriture"] += latences
+            resultat["erreurs"] += erreurs
+
+    threads = [threading.Thread(target=lecteur) for _ in range(options["lecteurs"])]
+    threads += [threading.Thread(target=ecrivain, args=(i,)) for i in range(options["ecrivains"])]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return resultat
+
+
+def percentile_ms(latences, centile):
+    if len(latences) < 2:  # noqa: PLR2004
+        return float("nan")
+    return statistics.quantiles(latences, n=100)[centile - 1] * 1000
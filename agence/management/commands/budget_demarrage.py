@@ -0,0 +1,92 @@
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+from django.core.management import BaseCommand, CommandError
+
+# Exécuté dans un nouveau processus: mesure django.setup() et le chargement des URL
+# (qui importe toutes les vues), comme au démarrage d'un worker
+MESURE = """
+import json, sys, time
+debut = time.perf_counter()
+import django
+django.setup()
+from django.urls import get_resolver
+get_resolver().url_patterns
+print(json.dumps({"duree": time.perf_counter() - debut, "modules": sorted(sys.modules)}))
+"""
+
+# Dépendances lourdes qui ne doivent être importées qu'à la première utilisation
+INTERDITS = ("numpy", "pandas", "scipy", "sklearn", "requests", "pyarrow", "faker", "sqlalchemy")
+
+
+def _executer(*options) -> subprocess.CompletedProcess:
+    resultat = subprocess.run(  # noqa: S603
+        [sys.executable, *options, "-c", MESURE],
+        capture_output=True,
+        text=True,
+        env=os.environ.copy(),
+        check=False,
+    )
+    if resultat.returncode:
+        msg = f"Le démarrage a échoué:\n{resultat.stderr}"
+        raise CommandError(msg)
+    return resultat
+
+
+def imports_les_plus_lents(nombre: int) -> list[tuple[str, float]]:
+    """(paquet, durée cumulée en ms) des paquets les plus longs à importer."""
+    lignes = _executer("-X", "importtime").stderr.splitlines()
+    durees = {}
+    for ligne in lignes:
+        # "import time:   self [us] | cumulative | imported package", sans indentation
+        # pour les imports de premier niveau
+        if m := re.match(r"import time:\s+\d+ \|\s+(\d+) \| (\S+)$", ligne):
+            paquet = m[2].split(".")[0]
+            durees[paquet] = durees.get(paquet, 0) + int(m[1]) / 1000
+    return sorted(durees.items(), key=lambda item: -item[1])[:nombre]
+
+
+class Command(BaseCommand):
+    help = (
+        "Mesure le temps de démarrage de Django (django.setup() et chargement des URL) et "
+        "le nombre de modules importés, et échoue si le budget est dépassé"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--budget-ms", type=float, default=1000, help="Durée médiane maximale (ms)"
+        )
+        parser.add_argument(
+            "--budget-modules", type=int, default=900, help="Nombre maximal de modules importés"
+        )
+        parser.add_argument("--repetitions", type=int, default=5)
+        parser.add_argument(
+            "--detail", action="store_true", help="Affiche les paquets les plus longs à importer"
+        )
+
+    def handle(self, *args, **options):
+        _executer()  # compile les .pyc, pour ne pas compter la première fois
+        mesures = [json.loads(_executer().stdout) for _ in range(options["repetitions"])]
+        duree_ms = statistics.median(mesure["duree"] for mesure in mesures) * 1000
+        modules = set(mesures[-1]["modules"])
+        self.stdout.write(f"Démarrage: {duree_ms:.0f} ms, {len(modules)} modules importés")
+
+        if options["detail"]:
+            for paquet, ms in imports_les_plus_lents(15):
+                self.stdout.write(f"  {paquet:<30}{ms:>8.1f} ms")
+
+        erreurs = []
+        if duree_ms > options["budget_ms"]:
+            erreurs.append(f"durée {duree_ms:.0f} ms > {options['budget_ms']:.0f} ms")
+        if len(modules) > options["budget_modules"]:
+            erreurs.append(f"{len(modules)} modules > {options['budget_modules']}")
+        if interdits := [nom for nom in INTERDITS if nom in modules]:
+            erreurs.append(f"modules importés au démarrage: {', '.join(interdits)}")
+        if erreurs:
+            msg = "Budget de démarrage dépassé: " + "; ".join(erreurs)
+            raise CommandError(msg)
+        self.stdout.write(self.style.SUCCESS("Budget de démarrage respecté"))
@@ -0,0 +1,380 @@
+import csv
+import email.parser
+import hashlib
+import io
+import json
+import os
+import random
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlencode, urlparse
+
+import requests
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+from django.urls import reverse
+
+from agence.management.commands.bench_bdd import percentile_ms
+
+# ---------------------------------------------------------------------------- #
+#                                Trafic simulé                                 #
+# ---------------------------------------------------------------------------- #
+
+# nom -> (poids, fonction qui renvoie les URL candidates à partir de la copie de la base)
+ROUTES = {}
+ECHANTILLON = 200  # objets tirés au hasard par route
+
+
+def route(nom: str, poids: int):
+    """
+    Décorateur pour enregistrer une route du mélange de trafic.
+    La fonction décorée reçoit une connexion sqlite3 (lecture seule) vers la copie de
+    la base et un `random.Random` (tirages reproductibles avec --graine), et renvoie
+    la liste des URL possibles; à chaque requête, le client tire une route selon les
+    poids puis une URL au hasard dans cette liste.
+    """
+
+    def decorator(fonction):
+        ROUTES[nom] = (poids, fonction)
+        return fonction
+
+    return decorator
+
+
+def _echantillon(conn, rng, sql):
+    valeurs = [ligne[0] for ligne in conn.execute(sql)]
+    return rng.sample(valeurs, min(len(valeurs), ECHANTILLON))
+
+
+@route("index", poids=1)
+def _index(conn, rng):
+    return [reverse("index")]
+
+
+@route("list_users", poids=2)
+def _list_users(conn, rng):
+    return [reverse("list_users")]
+
+
+@route("profil_acheteur", poids=3)
+def _profil_acheteur(conn, rng):
+    sql = "SELECT utilisateur_id FROM agence_acheteur ORDER BY 1"
+    return [reverse("profil_acheteur", args=[pk]) for pk in _echantillon(conn, rng, sql)]
+
+
+@route("profil_vendeur", poids=3)
+def _profil_vendeur(conn, rng):
+    sql = "SELECT utilisateur_id FROM agence_vendeur ORDER BY 1"
+    return [reverse("profil_vendeur", args=[pk]) for pk in _echantillon(conn, rng, sql)]
+
+
+@route("profil_agent", poids=2)
+def _profil_agent(conn, rng):
+    sql = "SELECT utilisateur_id FROM agence_agent ORDER BY 1"
+    return [reverse("profil_agent", args=[pk]) for pk in _echantillon(conn, rng, sql)]
+
+
+@route("chronologie", poids=2)
+def _chronologie(conn, rng):
+    sql = "SELECT id FROM agence_faitachat ORDER BY 1"
+    return [reverse("chronologie_fait_achat", args=[pk]) for pk in _echantillon(conn, rng, sql)]
+
+
+@route("recherche_bien", poids=4)
+def _recherche_bien(conn, rng):
+    url = reverse("recherche_bien")
+    communes = _echantillon(conn, rng, "SELECT nom FROM agence_commune ORDER BY id")[:50]
+    filtres = [{}, {"etat": "MV"}, {"chambres": 3}, {"q": "maison"}, {"q": "jardin calme"}]
+    filtres += [{"commune": commune} for commune in communes]
+    return [f"{url}?{urlencode(f)}" for f in filtres]
+
+
+@route("email_autocomplete", poids=4)
+def _email_autocomplete(conn, rng):
+    url = reverse("email-autocomplete")
+    emails = _echantillon(conn, rng, "SELECT email FROM agence_utilisateur ORDER BY id")
+    return [f"{url}?{urlencode({'q': email[:3]})}" for email in emails]
+
+
+@route("adresse_autocomplete", poids=2)
+def _adresse_autocomplete(conn, rng):
+    url = reverse("adresse-autocomplete")
+    return [f"{url}?{urlencode({'q': q})}" for q in ("8 rue", "avenue de la", "place du", "12 bd")]
+
+
+# ---------------------------------------------------------------------------- #
+#                          Bouchon des API de géocodage                        #
+# ---------------------------------------------------------------------------- #
+
+
+def _faux_resultat(texte: str) -> dict:
+    """Résultat déterministe pour un texte d'adresse (toujours le même)."""
+    h = int(hashlib.md5(texte.encode(), usedforsecurity=False).hexdigest(), 16)
+    numero, _, reste = texte.partition(" ")
+    voie, _, commune = reste.rpartition(",")
+    return {
+        "id": f"bouchon_{h % 10**12}",
+        "label": texte,
+        "housenumber": numero if numero.isdigit() else "",
+        "street": (voie or reste).strip() or "Voie",
+        "city": commune.strip() or "Commune",
+        "citycode": f"{h % 90_000 + 10_000}",
+        "postcode": f"{h % 90_000 + 10_000}",
+        "longitude": -1 + (h % 600) / 100,
+        "latitude": 43 + (h % 700) / 100,
+    }
+
+
+class BouchonGeocodage(BaseHTTPRequestHandler):
+    """
+    Imite les points d'entrée utilisés par l'application: /completion/ (IGN) et
+    /search/csv/ (BAN), avec des réponses déterministes et sans réseau.
+    """
+
+    def log_message(self, format, *args):  # noqa: A002
+        pass
+
+    def _repondre(self, contenu: bytes, content_type: str):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(contenu)))
+        self.end_headers()
+        self.wfile.write(contenu)
+
+    def do_GET(self):
+        requete = urlparse(self.path)
+        if requete.path.rstrip("/") != "/completion":
+            self.send_error(404)
+            return
+        texte = parse_qs(requete.query).get("text", [""])[0]
+        resultats = [{"fulltext": f"{texte} {i}, Ville{i}"} for i in range(1, 6)]
+        self._repondre(
+            json.dumps({"status": "OK", "results": resultats}).encode(), "application/json"
+        )
+
+    def do_POST(self):
+        if urlparse(self.path).path.rstrip("/") != "/search/csv":
+            self.send_error(404)
+            return
+        corps = self.rfile.read(int(self.headers["Content-Length"]))
+        message = email.parser.BytesParser().parsebytes(
+            f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode() + corps
+        )
+        fichier = next(
+            part.get_payload(decode=True)
+            for part in message.get_payload()
+            if part.get_param("name", header="content-disposition") == "data"
+        )
+        sortie = io.StringIO()
+        writer = csv.writer(sortie)
+        writer.writerow(
+            [
+                "adresse", "latitude", "longitude", "result_label", "result_score",
+                "result_id", "result_housenumber", "result_street", "result_postcode",
+                "result_city", "result_citycode",
+            ]
+        )  # fmt: skip
+        for ligne in csv.DictReader(io.StringIO(fichier.decode("utf-8-sig"))):
+            r = _faux_resultat(ligne["adresse"])
+            writer.writerow(
+                [
+                    ligne["adresse"], r["latitude"], r["longitude"], r["label"], 0.9,
+                    r["id"], r["housenumber"], r["street"], r["postcode"], r["city"],
+                    r["citycode"],
+                ]
+            )  # fmt: skip
+        self._repondre(sortie.getvalue().encode(), "text/csv")
+
+
+# ---------------------------------------------------------------------------- #
+#                                   Commande                                   #
+# ---------------------------------------------------------------------------- #
+
+
+def _port_libre() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class Command(BaseCommand):
+    help = (
+        "Test de charge: lance un serveur local sur une copie de la base, envoie un "
+        "mélange pondéré de requêtes avec plusieurs clients concurrents et affiche le "
+        "débit et les latences (p50/p95/p99) par route"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--duree", type=float, default=10.0, help="Durée de la mesure (s)")
+        parser.add_argument(
+            "--echauffement",
+            type=float,
+            default=2.0,
+            help="Durée avant la mesure, requêtes non comptées (s)",
+        )
+        parser.add_argument("--clients", type=int, default=8, help="Clients concurrents")
+        parser.add_argument(
+            "--graine", type=int, default=0, help="Graine du tirage des requêtes et des données"
+        )
+        parser.add_argument(
+            "--base",
+            help="Base SQLite à copier (par défaut, la base configurée dans les settings)",
+        )
+        parser.add_argument(
+            "--peupler",
+            type=int,
+            metavar="N",
+            help="Crée une base neuve avec peupler_data --n N au lieu de copier une base",
+        )
+        parser.add_argument(
+            "--routes",
+            nargs="+",
+            choices=sorted(ROUTES),
+            help="Ne charger que ces routes (par défaut, tout le mélange)",
+        )
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as dossier:
+            copie = Path(dossier) / "charge.sqlite3"
+            bouchon = ThreadingHTTPServer(("127.0.0.1", 0), BouchonGeocodage)
+            threading.Thread(target=bouchon.serve_forever, daemon=True).start()
+            url_bouchon = f"http://127.0.0.1:{bouchon.server_port}"
+            env = os.environ | {
+                "GESTION_IMMO_BDD_FICHIER": str(copie),
+                "API_ADRESSE_URL": url_bouchon,
+                "API_COMPLETION_URL": url_bouchon,
+            }
+            try:
+                self.preparer_base(copie, env, options)
+                urls = self.urls_candidates(
+                    copie, options["routes"] or sorted(ROUTES), options["graine"]
+                )
+                port = _port_libre()
+                serveur = self.lancer_serveur(port, env)
+                try:
+                    mesures = self.charger(f"http://127.0.0.1:{port}", urls, options)
+                finally:
+                    serveur.terminate()
+                    serveur.wait()
+            finally:
+                bouchon.shutdown()
+        self.rapport(mesures, options["duree"])
+
+    def preparer_base(self, copie: Path, env, options):
+        if options["peupler"]:
+            self.stderr.write(f"Création d'une base avec {options['peupler']} entrées...")
+            manage = [sys.executable, str(settings.BASE_DIR / "manage.py")]
+            for commande in (
+                ["migrate", "--run-syncdb", "-v0"],
+                ["peupler_data", "--n", str(options["peupler"]), "--seed", str(options["graine"])],
+            ):
+                # arguments fixés ici, pas d'entrée utilisateur passée à un shell
+                subprocess.run(  # noqa: S603
+                    [*manage, *commande], env=env, check=True, stdout=subprocess.DEVNULL
+                )
+            return
+        source = Path(options["base"] or settings.DATABASES["default"]["NAME"])
+        if not source.exists():
+            msg = f"Base introuvable: {source} (utiliser --peupler N pour en créer une)"
+            raise CommandError(msg)
+        # l'API de sauvegarde donne une copie cohérente même si la base est utilisée
+        with sqlite3.connect(source) as origine, sqlite3.connect(copie) as destination:
+            origine.backup(destination)
+
+    def urls_candidates(self, copie: Path, routes, graine: int) -> dict[str, list[str]]:
+        rng = random.Random(graine)
+        conn = sqlite3.connect(f"{copie.as_uri()}?mode=ro", uri=True)
+        try:
+            urls = {nom: ROUTES[nom][1](conn, rng) for nom in routes}
+        finally:
+            conn.close()
+        return {nom: liste for nom, liste in urls.items() if liste}
+
+    def lancer_serveur(self, port: int, env) -> subprocess.Popen:
+        serveur = subprocess.Popen(  # noqa: S603
+            [
+                sys.executable,
+                str(settings.BASE_DIR / "manage.py"),
+                "runserver",
+                f"127.0.0.1:{port}",
+                "--noreload",
+            ],
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        limite = time.monotonic() + 30
+        while time.monotonic() < limite:
+            if serveur.poll() is not None:
+                msg = "Le serveur n'a pas démarré"
+                raise CommandError(msg)
+            try:
+                requests.get(f"http://127.0.0.1:{port}/", timeout=1)
+            except requests.ConnectionError:
+                time.sleep(0.2)
+            else:
+                return serveur
+        serveur.terminate()
+        msg = "Le serveur ne répond pas après 30 s"
+        raise CommandError(msg)
+
+    def charger(self, base_url: str, urls, options):
+        """Renvoie {route: [(latence en s, erreur), ...]} des requêtes mesurées."""
+        noms = list(urls)
+        poids = [ROUTES[nom][0] for nom in noms]
+        debut_mesure = time.perf_counter() + options["echauffement"]
+        fin = debut_mesure + options["duree"]
+        mesures = defaultdict(list)
+        verrou = threading.Lock()
+
+        def client(numero):
+            rng = random.Random(options["graine"] * 1000 + numero)
+            session = requests.Session()
+            locales = defaultdict(list)
+            while (maintenant := time.perf_counter()) < fin:
+                nom = rng.choices(noms, poids)[0]
+                url = base_url + rng.choice(urls[nom])
+                try:
+                    erreur = session.get(url, timeout=30).status_code >= 400  # noqa: PLR2004
+                except requests.RequestException:
+                    erreur = True
+                if maintenant >= debut_mesure:
+                    locales[nom].append((time.perf_counter() - maintenant, erreur))
+            session.close()
+            with verrou:
+                for nom, liste in locales.items():
+                    mesures[nom] += liste
+
+        self.stderr.write(
+            f"{options['clients']} clients pendant {options['echauffement']:g} + "
+            f"{options['duree']:g} s..."
+        )
+        threads = [threading.Thread(target=client, args=(i,)) for i in range(options["clients"])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return mesures
+
+    def rapport(self, mesures, duree: float):
+        self.stdout.write(
+            f"{'route':<22}{'requêtes':>10}{'req/s':>9}{'erreurs':>9}"
+            f"{'p50':>10}{'p95':>10}{'p99':>10}"
+        )
+        lignes = sorted(mesures.items(), key=lambda item: -len(item[1]))
+        toutes = [mesure for _, liste in lignes for mesure in liste]
+        for nom, liste in [*lignes, ("total", toutes)]:
+            latences = [latence for latence, _ in liste]
+            erreurs = sum(erreur for _, erreur in liste)
+            self.stdout.write(
+                f"{nom:<22}{len(liste):>10}{len(liste) / duree:>9.1f}{erreurs:>9}"
+                + "".join(f"{percentile_ms(latences, c):>8.1f}ms" for c in (50, 95, 99))
+            )
@@ -0,0 +1,351 @@
+import re
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+
+from django.apps import apps
+from django.core.management import BaseCommand, CommandError, call_command
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import (
+    CaptureQueriesContext,
+    setup_databases,
+    setup_test_environment,
+    teardown_databases,
+    teardown_test_environment,
+)
+from django.urls import reverse
+
+import agence.models as ag
+from agence.routers import ALIAS_LECTURE
+from agence.views import RendezVousParVendeurView
+
+# ---------------------------------------------------------------------------- #
+#                              Vues analysées                                  #
+# ---------------------------------------------------------------------------- #
+
+# nom -> fonction qui prépare l'exécution d'une vue sur les données existantes
+VUES_ANALYSEES = {}
+
+
+def analyser_vue(nom: str):
+    """
+    Décorateur pour enregistrer une vue à analyser.
+    La fonction décorée reçoit un `django.test.Client`, choisit les données à utiliser
+    et renvoie une fonction sans argument qui exécute la vue (ou None s'il n'y a pas
+    de données). Seules les requêtes SQL émises par cette dernière sont capturées.
+    """
+
+    def decorator(fonction):
+        VUES_ANALYSEES[nom] = fonction
+        return fonction
+
+    return decorator
+
+
+def _le_plus_actif(queryset, relation):
+    """L'objet du queryset qui a le plus de `relation`, pour analyser le pire cas."""
+    return queryset.annotate(n=Count(relation)).order_by("-n").first()
+
+
+@analyser_vue("list_users")
+def _list_users(client):
+    return lambda: client.get(reverse("list_users"))
+
+
+@analyser_vue("profil_acheteur")
+def _profil_acheteur(client):
+    if acheteur := _le_plus_actif(ag.Acheteur.objects, "faitachat"):
+        return lambda: client.get(reverse("profil_acheteur", args=[acheteur.pk]))
+    return None
+
+
+@analyser_vue("profil_agent")
+def _profil_agent(client):
+    if agent := _le_plus_actif(ag.Agent.objects, "bien"):
+        return lambda: client.get(reverse("profil_agent", args=[agent.pk]))
+    return None
+
+
+@analyser_vue("profil_vendeur")
+def _profil_vendeur(client):
+    if vendeur := _le_plus_actif(ag.Vendeur.objects, "bien"):
+        return lambda: client.get(reverse("profil_vendeur", args=[vendeur.pk]))
+    return None
+
+
+@analyser_vue("rendezvous_vendeur")
+def _rendezvous_vendeur(client):
+    # Pas de route pour cette vue: on évalue directement son queryset
+    if vendeur := _le_plus_actif(ag.Vendeur.objects, "bien"):
+        vue = RendezVousParVendeurView(kwargs={"vendeur_id": vendeur.pk})
+        return lambda: list(vue.get_queryset())
+    return None
+
+
+@analyser_vue("email_autocomplete")
+def _email_autocomplete(client):
+    return lambda: client.get(reverse("email-autocomplete"), {"q": "a"})
+
+
+# ---------------------------------------------------------------------------- #
+#                             Analyse des plans                                #
+# ---------------------------------------------------------------------------- #
+
+RE_LITTERAUX = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+RE_COLONNE = re.compile(r'"(\w+)"\."(\w+)"')
+RE_CONDITION = re.compile(
+    r'"(\w+)"\."(\w+)"\s*(?:=|<|>|!=|\bIN\b|\bIS\b|\bLIKE\b|\bBETWEEN\b)'
+    r'|(?:=|<|>)\s*"(\w+)"\."(\w+)"',
+    re.IGNORECASE,
+)
+RE_ALIAS = re.compile(r'"(\w+)" (?:AS )?"?([A-Z]\d+)"?\b')
+RE_SCAN = re.compile(r"^SCAN (\w+)(?: (?:USING|VIRTUAL))?")
+RE_TRI = re.compile(r"USE TEMP B-TREE FOR (.+)$")
+
+
+@dataclass
+class Probleme:
+    vue: str
+    alias: str
+    sql: str
+    occurrences: int
+    details: list[str] = field(default_factory=list)
+    candidats: list[tuple[str, tuple[str, ...]]] = field(default_factory=list)
+
+
+def normaliser(sql: str) -> str:
+    """Remplace les valeurs littérales pour regrouper les requêtes identiques."""
+    return RE_LITTERAUX.sub("?", sql)
+
+
+def colonnes_conditions(sql: str, alias_tables: dict[str, str]) -> dict[str, list[str]]:
+    """
+    Colonnes utilisées dans des conditions (WHERE / ON) par table, dans l'ordre
+    d'apparition. Heuristique sur le texte du SQL généré par Django.
+    """
+    debut = sql.upper().find(" FROM ")
+    fin = sql.upper().rfind(" ORDER BY ")
+    corps = sql[debut : fin if fin > debut else len(sql)]
+    resultat = defaultdict(list)
+    for match in RE_CONDITION.finditer(corps):
+        table, colonne = match.group(1, 2) if match.group(1) else match.group(3, 4)
+        table = alias_tables.get(table, table)
+        if colonne not in resultat[table]:
+            resultat[table].append(colonne)
+    return resultat
+
+
+def colonnes_tri(sql: str, alias_tables: dict[str, str]) -> dict[str, list[str]]:
+    position = sql.upper().rfind(" ORDER BY ")
+    if position == -1:
+        return {}
+    resultat = defaultdict(list)
+    for table, colonne in RE_COLONNE.findall(sql[position:]):
+        resultat[alias_tables.get(table, table)].append(colonne)
+    return resultat
+
+
+def index_existants(alias: str, table: str) -> list[tuple[str, ...]]:
+    with connections[alias].cursor() as cursor:
+        cursor.execute(f'PRAGMA index_list("{table}")')
+        noms = [ligne[1] for ligne in cursor.fetchall()]
+        index = []
+        for nom in noms:
+            cursor.execute(f'PRAGMA index_info("{nom}")')
+            index.append(tuple(ligne[2] for ligne in cursor.fetchall()))
+    return index
+
+
+def est_couvert(candidat: tuple[str, ...], existants: list[tuple[str, ...]]) -> bool:
+    return any(index[: len(candidat)] == candidat for index in existants)
+
+
+def analyser_requete(vue, alias, sql, occurrences) -> Probleme | None:
+    try:
+        with connections[alias].cursor() as cursor:
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+            plan = [ligne[3] for ligne in cursor.fetchall()]
+    except DatabaseError:
+        # requête qui a elle-même échoué pendant l'exécution de la vue
+        return None
+
+    alias_tables = {alias_sql: table for table, alias_sql in RE_ALIAS.findall(sql)}
+    conditions = colonnes_conditions(sql, alias_tables)
+    tris = colonnes_tri(sql, alias_tables)
+    probleme = Probleme(vue, alias, sql, occurrences)
+    tables_candidates = {}
+
+    for detail in plan:
+        if (match := RE_SCAN.match(detail)) and " USING " not in detail:
+            table = alias_tables.get(match.group(1), match.group(1))
+            probleme.details.append(detail)
+            tables_candidates[table] = tuple(conditions.get(table, ()))
+        elif match := RE_TRI.search(detail):
+            probleme.details.append(detail)
+            if "ORDER BY" in match.group(1):
+                for table, colonnes in tris.items():
+                    tables_candidates[table] = tuple(conditions.get(table, ())) + tuple(
+                        c for c in colonnes if c not in conditions.get(table, ())
+                    )
+
+    if not probleme.details:
+        return None
+
+    for table, colonnes in tables_candidates.items():
+        modele = _modele_par_table().get(table)
+        if not colonnes or modele is None:
+            continue
+        candidat = colonnes
+        # Une égalité sur la clé primaire ne renvoie qu'une ligne: on garde seulement le tri
+        if modele._meta.pk.column in colonnes:
+            candidat = tuple(c for c in tris.get(table, ()) if c != modele._meta.pk.column)
+        if candidat and not est_couvert(candidat, index_existants(alias, table)):
+            probleme.candidats.append((table, candidat))
+    return probleme
+
+
+def _modele_par_table():
+    return {modele._meta.db_table: modele for modele in apps.get_models()}
+
+
+def declaration_index(table: str, colonnes: tuple[str, ...]) -> tuple[str, str]:
+    """Renvoie (nom du modèle, déclaration models.Index(...)) pour un index candidat."""
+    modele = _modele_par_table()[table]
+    par_colonne = {
+        f.column: f.name for f in modele._meta.concrete_fields if getattr(f, "column", None)
+    }
+    champs = ", ".join(f'"{par_colonne.get(c, c)}"' for c in colonnes)
+    return modele._meta.label, f"models.Index(fields=[{champs}])"
+
+
+# ---------------------------------------------------------------------------- #
+#                                  Commande                                    #
+# ---------------------------------------------------------------------------- #
+
+
+class Command(BaseCommand):
+    help = (
+        "Exécute les vues enregistrées, capture leurs requêtes SQL et signale avec "
+        "EXPLAIN QUERY PLAN les parcours complets de table, les tris temporaires "
+        "et les index composites candidats"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--vue",
+            action="append",
+            choices=sorted(VUES_ANALYSEES),
+            help="Vue à analyser (peut être répété). Par défaut toutes les vues.",
+        )
+        parser.add_argument(
+            "--peupler",
+            type=int,
+            default=None,
+            metavar="N",
+            help="Analyse une base de test temporaire peuplée avec peupler_data --n N "
+            "au lieu de la base courante",
+        )
+        parser.add_argument("--seed", type=int, default=0, help="Graine pour --peupler")
+        parser.add_argument(
+            "--meta",
+            action="store_true",
+            help="Affiche les déclarations Meta.indexes correspondant aux index candidats",
+        )
+        parser.add_argument(
+            "--sql", action="store_true", help="Affiche le SQL des requêtes signalées"
+        )
+
+    def handle(self, *args, **options):
+        vues = options["vue"] or sorted(VUES_ANALYSEES)
+        setup_test_environment()
+        ancienne_config = None
+        try:
+            if options["peupler"] is not None:
+                ancienne_config = setup_databases(
+                    verbosity=0,
+                    interactive=False,
+                    aliases={DEFAULT_DB_ALIAS, ALIAS_LECTURE},
+                    serialized_aliases=set(),
+                )
+                call_command("peupler_data", n=options["peupler"], seed=options["seed"])
+            problemes = self.analyser(vues)
+        finally:
+            if ancienne_config is not None:
+                teardown_databases(ancienne_config, verbosity=0)
+            teardown_test_environment()
+
+        self.afficher(problemes, afficher_sql=options["sql"])
+        if options["meta"]:
+            self.afficher_meta(problemes)
+
+    def analyser(self, vues):
+        client = Client()
+        problemes = []
+        for nom in vues:
+            captures = {
+                alias: CaptureQueriesContext(connections[alias])
+                for alias in (DEFAULT_DB_ALIAS, ALIAS_LECTURE)
+            }
+            executer = VUES_ANALYSEES[nom](client)
+            if executer is None:
+                self.stdout.write(f"{nom}: pas de données pour exécuter la vue")
+                continue
+            for capture in captures.values():
+                capture.__enter__()
+            try:
+                executer()
+            except Exception as e:  # noqa: BLE001
+                self.stderr.write(f"{nom}: erreur pendant l'exécution de la vue ({e})")
+            finally:
+                for capture in captures.values():
+                    capture.__exit__(None, None, None)
+
+            nb_requetes = 0
+            for alias, capture in captures.items():
+                selects = [
+                    q["sql"]
+                    for q in capture.captured_queries
+                    if q["sql"].lstrip().startswith("SELECT")
+                ]
+                nb_requetes += len(capture.captured_queries)
+                groupes = Counter(normaliser(sql) for sql in selects)
+                exemples = {normaliser(sql): sql for sql in selects}
+                for forme, occurrences in groupes.items():
+                    probleme = analyser_requete(nom, alias, exemples[forme], occurrences)
+                    if probleme is not None:
+                        problemes.append(probleme)
+            self.stdout.write(f"{nom}: {nb_requetes} requêtes capturées")
+        return problemes
+
+    def afficher(self, problemes, *, afficher_sql):
+        if not problemes:
+            self.stdout.write(self.style.SUCCESS("Aucun parcours complet ni tri temporaire."))
+            return
+        for probleme in problemes:
+            self.stdout.write(
+                self.style.WARNING(f"\n[{probleme.vue}] ({probleme.alias}) ")
+                + f"requête exécutée {probleme.occurrences} fois"
+            )
+            if afficher_sql:
+                self.stdout.write(f"  {probleme.sql}")
+            for detail in probleme.details:
+                self.stdout.write(f"  - {detail}")
+            for table, colonnes in probleme.candidats:
+                self.stdout.write(f"  => index candidat: {table} ({', '.join(colonnes)})")
+
+    def afficher_meta(self, problemes):
+        par_modele = defaultdict(list)
+        for probleme in problemes:
+            for table, colonnes in probleme.candidats:
+                label, declaration = declaration_index(table, colonnes)
+                if declaration not in par_modele[label]:
+                    par_modele[label].append(declaration)
+        if not par_modele:
+            msg = "Aucun index candidat à déclarer."
+            raise CommandError(msg)
+        for label, declarations in par_modele.items():
+            self.stdout.write(f"\n# {label}\nclass Meta:\n    indexes: ClassVar = [")
+            for declaration in declarations:
+                self.stdout.write(f"        {declaration},")
+            self.stdout.write("    ]")
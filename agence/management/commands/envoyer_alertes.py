@@ -0,0 +1,27 @@
+from django.core.management import BaseCommand
+
+from agence import alertes
+from agence.models import Bien
+
+
+class Command(BaseCommand):
+    help = (
+        "Propose tout de suite aux acheteurs les biens de la file des mises en vente "
+        "(sans attendre la tâche de fond envoyer_alertes)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--tous",
+            action="store_true",
+            help="Ajoute d'abord à la file tous les biens actuellement en vente",
+        )
+        parser.add_argument("--taille-lot", type=int, default=alertes.TAILLE_LOT)
+
+    def handle(self, *args, **options):
+        if options["tous"]:
+            alertes.signaler(
+                Bien.objects.filter(etat=Bien.Etat.MISE_EN_VENTE).values_list("pk", flat=True)
+            )
+        creees = alertes.envoyer_alertes(options["taille_lot"])
+        self.stdout.write(self.style.SUCCESS(f"{creees} proposition(s) créée(s)."))
@@ -0,0 +1,62 @@
+import sys
+
+from django.core.management import BaseCommand, CommandError
+
+from agence.export import CHUNK_SIZE, EXPORTS, TAILLE_GROUPE, ecrire_parquet, lignes_csv
+
+
+class Command(BaseCommand):
+    help = (
+        "Exporte les biens ou les transactions en CSV ou en Parquet, en lisant la base "
+        "par lots (mémoire constante quel que soit le nombre de lignes)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("export", choices=sorted(EXPORTS), help="Données à exporter")
+        parser.add_argument(
+            "--format", choices=["csv", "parquet"], default="csv", help="Format du fichier"
+        )
+        parser.add_argument(
+            "--sortie",
+            help="Fichier de sortie (obligatoire en Parquet, sortie standard par défaut en CSV)",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=CHUNK_SIZE,
+            help="Nombre de lignes lues par requête",
+        )
+        parser.add_argument(
+            "--taille-groupe",
+            type=int,
+            default=TAILLE_GROUPE,
+            help="Nombre de lignes par groupe Parquet",
+        )
+
+    def handle(self, *args, **options):
+        export = EXPORTS[options["export"]]
+        sortie = options["sortie"]
+
+        if options["format"] == "parquet":
+            if not sortie:
+                msg = "--sortie est obligatoire pour un export Parquet"
+                raise CommandError(msg)
+            try:
+                total = ecrire_parquet(
+                    export,
+                    sortie,
+                    chunk_size=options["chunk_size"],
+                    taille_groupe=options["taille_groupe"],
+                )
+            except ImportError as e:
+                raise CommandError(str(e)) from e
+            self.stderr.write(self.style.SUCCESS(f"{total} lignes écrites dans {sortie}."))
+            return
+
+        lignes = lignes_csv(export, chunk_size=options["chunk_size"])
+        if not sortie:
+            sys.stdout.writelines(lignes)
+            return
+        with open(sortie, "w", newline="", encoding="utf-8") as fichier:
+            fichier.writelines(lignes)
+        self.stderr.write(self.style.SUCCESS(f"Export {export.nom} écrit dans {sortie}."))
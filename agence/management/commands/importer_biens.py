@@ -0,0 +1,59 @@
+import csv
+
+from django.core.management import BaseCommand, CommandError
+
+from agence.import_biens import TAILLE_LOT, importer_biens
+from agence.models import Agent
+
+
+class Command(BaseCommand):
+    help = (
+        "Importe des biens depuis un fichier CSV (adresses géocodées par lots, "
+        "insertions en masse). Voir agence.import_biens pour les colonnes"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("fichier", help="Fichier CSV (UTF-8) à importer")
+        parser.add_argument(
+            "--agent", help="Email de l'agent des biens dont la colonne agent est vide"
+        )
+        parser.add_argument(
+            "--rapport", help="Fichier CSV où écrire les lignes en erreur (ligne, erreur)"
+        )
+        parser.add_argument(
+            "--taille-lot",
+            type=int,
+            default=TAILLE_LOT,
+            help="Nombre de lignes traitées par lot",
+        )
+
+    def handle(self, *args, **options):
+        agent = None
+        if options["agent"]:
+            agent = Agent.objects.filter(utilisateur__email=options["agent"]).first()
+            if agent is None:
+                msg = f"Aucun agent avec l'email {options['agent']}"
+                raise CommandError(msg)
+
+        with open(options["fichier"], newline="", encoding="utf-8-sig") as fichier:
+            rapport = importer_biens(fichier, agent=agent, taille_lot=options["taille_lot"])
+
+        if options["rapport"]:
+            with open(options["rapport"], "w", newline="", encoding="utf-8") as fichier:
+                writer = csv.writer(fichier)
+                writer.writerow(["ligne", "erreur"])
+                writer.writerows(rapport.erreurs)
+        else:
+            for numero, erreur in rapport.erreurs:
+                self.stderr.write(f"ligne {numero}: {erreur}")
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{rapport.biens_crees} biens créés sur {rapport.lignes} lignes "
+                f"({len(rapport.erreurs)} en erreur, "
+                f"{rapport.adresses} adresses distinctes)."
+            )
+        )
+        if rapport.interrompu:
+            msg = f"Import interrompu: {rapport.interrompu}"
+            raise CommandError(msg)
@@ -4,6 +4,9 @@ from django.db import transaction
 from faker import Faker
 
 import agence.models as ag
+from agence.entonnoir import reconstruire_entonnoir
+from agence.recherche import reconstruire_facettes
+from agence.recherche_texte import reconstruire_documents
 
 TZINFO = django.utils.timezone.get_current_timezone()
 
@@ -179,6 +182,10 @@ class Command(BaseCommand):
             ag.FaitAchat.objects.bulk_create(fait_achats)
             ag.RendezVous.objects.bulk_create(rdvs)
             ag.Message.objects.bulk_create(messages)
+            # bulk_create ne déclenche pas les signaux qui maintiennent les agrégats
+            reconstruire_facettes()
+            reconstruire_entonnoir()
+            reconstruire_documents()
 
         self.stdout.write(
             self.style.SUCCESS(f"Successfully populated the database with {N} records.")
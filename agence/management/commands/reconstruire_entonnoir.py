@@ -0,0 +1,14 @@
+from django.core.management import BaseCommand
+
+from agence.entonnoir import reconstruire_entonnoir
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcule les tables d'agrégats de l'entonnoir de vente (étapes d'achat et états "
+        "des biens par jour et par agent) à partir des données actuelles"
+    )
+
+    def handle(self, *args, **options):
+        reconstruire_entonnoir()
+        self.stdout.write(self.style.SUCCESS("Entonnoir de vente recalculé."))
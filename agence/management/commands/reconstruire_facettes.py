@@ -0,0 +1,14 @@
+from django.core.management import BaseCommand
+
+from agence.recherche import reconstruire_facettes
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcule la table d'agrégats des facettes de recherche de biens "
+        "(à lancer après des imports en masse qui ne passent pas par save())"
+    )
+
+    def handle(self, *args, **options):
+        reconstruire_facettes()
+        self.stdout.write(self.style.SUCCESS("Facettes de recherche recalculées."))
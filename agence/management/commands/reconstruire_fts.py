@@ -0,0 +1,15 @@
+from django.core.management import BaseCommand
+
+from agence.recherche_texte import creer_table, reconstruire_documents
+
+
+class Command(BaseCommand):
+    help = (
+        "Recrée les documents de la recherche plein texte des biens "
+        "(à lancer après des imports en masse qui ne passent pas par save())"
+    )
+
+    def handle(self, *args, **options):
+        creer_table()
+        reconstruire_documents()
+        self.stdout.write(self.style.SUCCESS("Index plein texte des biens reconstruit."))
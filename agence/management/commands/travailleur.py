@@ -0,0 +1,109 @@
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+from django.core.management import BaseCommand
+from django.db import close_old_connections, connections
+
+from agence import taches
+
+INTERVALLE_RECUPERATION = 60  # secondes entre deux recherches de tâches bloquées
+
+
+class Command(BaseCommand):
+    help = (
+        "Exécute les tâches de fond de la file (voir agence.taches) avec plusieurs threads "
+        "ou processus, jusqu'à SIGINT/SIGTERM"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=2, help="Threads par processus")
+        parser.add_argument(
+            "--processus", type=int, default=1, help="Nombre de processus travailleurs"
+        )
+        parser.add_argument(
+            "--intervalle",
+            type=float,
+            default=1.0,
+            help="Attente (s) quand aucune tâche n'est prête",
+        )
+        parser.add_argument(
+            "--une-fois",
+            action="store_true",
+            help="S'arrête dès qu'aucune tâche n'est prête (ex: tâche cron)",
+        )
+        parser.add_argument("--taches", nargs="*", help="N'exécute que ces tâches")
+
+    def handle(self, *args, **options):
+        if options["processus"] > 1:
+            self.lancer_processus(options)
+            return
+
+        arret = threading.Event()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, lambda *_: arret.set())
+        taches.recuperer_bloquees()
+        connections.close_all()
+
+        prefixe = f"{socket.gethostname()}:{os.getpid()}"
+        threads = [
+            threading.Thread(
+                target=self.boucle, args=(f"{prefixe}:{i}", arret, options), daemon=True
+            )
+            for i in range(options["threads"])
+        ]
+        for thread in threads:
+            thread.start()
+        self.stdout.write(f"{prefixe}: {len(threads)} thread(s) démarré(s)")
+        # join() avec délai: le thread principal doit rester réveillé pour les signaux
+        while any(thread.is_alive() for thread in threads):
+            for thread in threads:
+                thread.join(timeout=0.5)
+
+    @staticmethod
+    def boucle(travailleur: str, arret: threading.Event, options):
+        recupere_a = time.monotonic()
+        try:
+            while not arret.is_set():
+                close_old_connections()
+                if time.monotonic() - recupere_a > INTERVALLE_RECUPERATION:
+                    taches.recuperer_bloquees()
+                    recupere_a = time.monotonic()
+                tache = taches.prendre(travailleur, options["taches"])
+                if tache is not None:
+                    taches.executer(tache)
+                elif options["une_fois"]:
+                    break
+                else:
+                    arret.wait(options["intervalle"])
+        finally:
+            connections.close_all()
+
+    def lancer_processus(self, options):
+        commande = [
+            sys.executable,
+            sys.argv[0],
+            "travailleur",
+            "--threads",
+            str(options["threads"]),
+            "--intervalle",
+            str(options["intervalle"]),
+        ]
+        if options["une_fois"]:
+            commande.append("--une-fois")
+        if options["taches"]:
+            commande += ["--taches", *options["taches"]]
+        enfants = [subprocess.Popen(commande) for _ in range(options["processus"])]  # noqa: S603
+
+        def transmettre(signum, _frame):
+            for enfant in enfants:
+                enfant.send_signal(signum)
+
+        signal.signal(signal.SIGINT, transmettre)
+        signal.signal(signal.SIGTERM, transmettre)
+        for enfant in enfants:
+            enfant.wait()
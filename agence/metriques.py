@@ -0,0 +1,305 @@
+"""
+Métriques de l'application (compteurs et histogrammes), exposées au format texte de
+Prometheus sur /metrics (voir `views.metriques`).
+
+Les métriques sont déclarées en bas de ce module avec `compteur()` et
+`histogramme()`, puis mises à jour là où ça se passe:
+`CACHE.inc(cache="commune", resultat="succes")`,
+`with GEOCODAGE_DUREE.chronometrer(api="completion"): ...`.
+
+Chaque processus garde ses valeurs en mémoire. Avec plusieurs processus (workers
+gunicorn), le réglage `METRIQUES["DOSSIER"]` donne un dossier partagé: chaque
+processus y écrit ses valeurs (au plus une fois par `METRIQUES["INTERVALLE"]`
+secondes, après une requête, et à sa sortie) dans son propre fichier, et /metrics
+additionne les fichiers de tous les processus. Les fichiers des processus arrêtés
+sont gardés pour que les compteurs ne reculent pas: le dossier doit donc être vidé
+à chaque redémarrage du serveur.
+"""
+
+import atexit
+import bisect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import ClassVar
+
+from django.conf import settings
+
+SEUILS_DUREE = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)  # secondes
+SEUILS_NOMBRE = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+
+class Metrique:
+    type: ClassVar[str]
+
+    def __init__(self, nom: str, aide: str, etiquettes=()):
+        self.nom = nom
+        self.aide = aide
+        self.etiquettes = tuple(etiquettes)
+        self._valeurs = {}  # valeurs des étiquettes (tuple) -> valeur
+        self._verrou = threading.Lock()
+
+    def _cle(self, etiquettes: dict) -> tuple:
+        if etiquettes.keys() != set(self.etiquettes):
+            msg = f"{self.nom}: étiquettes {sorted(etiquettes)} au lieu de {self.etiquettes}"
+            raise ValueError(msg)
+        return tuple(str(etiquettes[nom]) for nom in self.etiquettes)
+
+    def valeurs(self) -> dict:
+        with self._verrou:
+            return {cle: self._copie(valeur) for cle, valeur in self._valeurs.items()}
+
+    @staticmethod
+    def _copie(valeur):
+        return valeur
+
+    def fusionner(self, valeurs: dict, autres: dict):
+        """Ajoute les valeurs `autres` (d'un autre processus) à `valeurs`."""
+        raise NotImplementedError
+
+    def lignes(self, valeurs: dict):
+        """Lignes du format texte de Prometheus pour les valeurs données."""
+        raise NotImplementedError
+
+    def _etiquettes(self, cle: tuple, **autres) -> str:
+        paires = [*zip(self.etiquettes, cle, strict=True), *autres.items()]
+        if not paires:
+            return ""
+        return "{" + ",".join(f'{nom}="{_echapper(valeur)}"' for nom, valeur in paires) + "}"
+
+
+class Compteur(Metrique):
+    type = "counter"
+
+    def inc(self, n: float = 1, **etiquettes):
+        cle = self._cle(etiquettes)
+        with self._verrou:
+            self._valeurs[cle] = self._valeurs.get(cle, 0) + n
+
+    def fusionner(self, valeurs, autres):
+        for cle, valeur in autres.items():
+            valeurs[cle] = valeurs.get(cle, 0) + valeur
+
+    def lignes(self, valeurs):
+        for cle, valeur in sorted(valeurs.items()):
+            yield f"{self.nom}{self._etiquettes(cle)} {_nombre(valeur)}"
+
+
+class Histogramme(Metrique):
+    """
+    Les valeurs sont [effectifs par intervalle (le dernier au-delà du plus grand
+    seuil), somme des observations].
+    """
+
+    type = "histogram"
+
+    def __init__(self, nom, aide, etiquettes=(), seuils=SEUILS_DUREE):
+        super().__init__(nom, aide, etiquettes)
+        self.seuils = tuple(seuils)
+
+    def observer(self, valeur: float, **etiquettes):
+        cle = self._cle(etiquettes)
+        # intervalle i: seuils[i-1] < valeur <= seuils[i]
+        i = bisect.bisect_left(self.seuils, valeur)
+        with self._verrou:
+            effectifs, _ = actuelle = self._valeurs.setdefault(
+                cle, [[0] * (len(self.seuils) + 1), 0.0]
+            )
+            effectifs[i] += 1
+            actuelle[1] += valeur
+
+    @contextmanager
+    def chronometrer(self, **etiquettes):
+        """Observe la durée (en secondes) du bloc `with`, même s'il lève une exception."""
+        debut = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observer(time.perf_counter() - debut, **etiquettes)
+
+    @staticmethod
+    def _copie(valeur):
+        return [list(valeur[0]), valeur[1]]
+
+    def fusionner(self, valeurs, autres):
+        for cle, (effectifs, somme) in autres.items():
+            if len(effectifs) != len(self.seuils) + 1:  # seuils modifiés depuis
+                continue
+            actuelle = valeurs.setdefault(cle, [[0] * len(effectifs), 0.0])
+            actuelle[0] = [a + b for a, b in zip(actuelle[0], effectifs, strict=True)]
+            actuelle[1] += somme
+
+    def lignes(self, valeurs):
+        for cle, (effectifs, somme) in sorted(valeurs.items()):
+            cumul = 0
+            for seuil, effectif in zip((*self.seuils, float("inf")), effectifs, strict=True):
+                cumul += effectif
+                yield f"{self.nom}_bucket{self._etiquettes(cle, le=_nombre(seuil))} {cumul}"
+            yield f"{self.nom}_sum{self._etiquettes(cle)} {_nombre(somme)}"
+            yield f"{self.nom}_count{self._etiquettes(cle)} {cumul}"
+
+
+def _echapper(valeur: str) -> str:
+    return valeur.replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n")
+
+
+def _nombre(valeur) -> str:
+    if valeur == float("inf"):
+        return "+Inf"
+    if isinstance(valeur, int) or float(valeur).is_integer():
+        return str(int(valeur))
+    return repr(float(valeur))
+
+
+# nom -> métrique
+METRIQUES: dict[str, Metrique] = {}
+
+
+def _enregistrer(metrique: Metrique):
+    if metrique.nom in METRIQUES:
+        msg = f"La métrique {metrique.nom} existe déjà"
+        raise ValueError(msg)
+    METRIQUES[metrique.nom] = metrique
+    return metrique
+
+
+def compteur(nom: str, aide: str, etiquettes=()) -> Compteur:
+    return _enregistrer(Compteur(nom, aide, etiquettes))
+
+
+def histogramme(nom: str, aide: str, etiquettes=(), seuils=SEUILS_DUREE) -> Histogramme:
+    return _enregistrer(Histogramme(nom, aide, etiquettes, seuils))
+
+
+# ---------------------------------------------------------------------------- #
+#                                 Multiprocessus                               #
+# ---------------------------------------------------------------------------- #
+
+_verrou_sauvegarde = threading.Lock()
+_sauvegarde_a = float("-inf")
+_fichiers = {}  # pid -> nom du fichier du processus
+
+
+def _dossier() -> Path | None:
+    dossier = settings.METRIQUES["DOSSIER"]
+    return Path(dossier) if dossier else None
+
+
+def _fichier() -> str:
+    # calculé dans le processus lui-même (le module peut être importé avant le fork
+    # des workers); la date évite d'écraser le fichier d'un ancien processus qui
+    # aurait eu le même pid
+    pid = os.getpid()
+    if pid not in _fichiers:
+        _fichiers[pid] = f"{pid}-{time.time_ns()}.json"
+    return _fichiers[pid]
+
+
+def sauvegarder():
+    """Écrit les valeurs de ce processus dans le dossier partagé (s'il y en a un)."""
+    global _sauvegarde_a  # noqa: PLW0603
+    if (dossier := _dossier()) is None:
+        return
+    with _verrou_sauvegarde:
+        _sauvegarde_a = time.monotonic()
+        etat = {
+            nom: [[list(cle), valeur] for cle, valeur in metrique.valeurs().items()]
+            for nom, metrique in METRIQUES.items()
+        }
+        if not any(etat.values()):  # ex: commande manage.py sans géocodage
+            return
+        dossier.mkdir(parents=True, exist_ok=True)
+        # écriture puis renommage: /metrics ne lit jamais un fichier à moitié écrit
+        fichier = _fichier()
+        temporaire = dossier / f".{fichier}.tmp"
+        temporaire.write_text(json.dumps(etat), encoding="utf-8")
+        temporaire.replace(dossier / fichier)
+
+
+def sauvegarder_si_besoin():
+    if time.monotonic() - _sauvegarde_a >= settings.METRIQUES["INTERVALLE"]:
+        sauvegarder()
+
+
+atexit.register(sauvegarder)
+
+
+def _valeurs_agregees() -> dict[str, dict]:
+    """{nom: valeurs} de ce processus, ou de tous ceux du dossier partagé."""
+    if (dossier := _dossier()) is None:
+        return {nom: metrique.valeurs() for nom, metrique in METRIQUES.items()}
+    sauvegarder()
+    agregees = {nom: {} for nom in METRIQUES}
+    for fichier in dossier.glob("*.json"):
+        try:
+            etat = json.loads(fichier.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            continue
+        for nom, valeurs in etat.items():
+            if (metrique := METRIQUES.get(nom)) is not None:
+                metrique.fusionner(agregees[nom], {tuple(cle): valeur for cle, valeur in valeurs})
+    return agregees
+
+
+def exposer() -> str:
+    """Toutes les métriques au format texte de Prometheus."""
+    lignes = []
+    for nom, valeurs in _valeurs_agregees().items():
+        metrique = METRIQUES[nom]
+        lignes.append(f"# HELP {nom} {metrique.aide}")
+        lignes.append(f"# TYPE {nom} {metrique.type}")
+        lignes.extend(metrique.lignes(valeurs))
+    return "\n".join(lignes) + "\n"
+
+
+# ---------------------------------------------------------------------------- #
+#                                   Métriques                                  #
+# ---------------------------------------------------------------------------- #
+
+VUES_DUREE = histogramme(
+    "gestion_immo_vue_duree_secondes",
+    "Durée de traitement des requêtes HTTP, par vue",
+    ["vue", "methode", "statut"],
+)
+VUES_REQUETES_SQL = histogramme(
+    "gestion_immo_vue_requetes_sql",
+    "Nombre de requêtes SQL par requête HTTP, par vue",
+    ["vue"],
+    seuils=SEUILS_NOMBRE,
+)
+GEOCODAGE_DUREE = histogramme(
+    "gestion_immo_geocodage_duree_secondes",
+    "Durée des appels aux API de géocodage",
+    ["api"],
+)
+GEOCODAGE_ECHECS = compteur(
+    "gestion_immo_geocodage_echecs_total",
+    "Appels aux API de géocodage en échec (erreur réseau ou réponse invalide)",
+    ["api"],
+)
+CACHE = compteur(
+    "gestion_immo_cache_lectures_total",
+    "Lectures des caches (carte d'identité, tables de référence), trouvées ou non",
+    ["cache", "resultat"],
+)
+PROPOSITIONS_DUREE = histogramme(
+    "gestion_immo_propositions_duree_secondes",
+    "Durée du calcul des biens proposés à un acheteur (get_proposition_biens)",
+)
+ALERTES = compteur(
+    "gestion_immo_alertes_total",
+    "Biens proposés aux acheteurs à leur mise en vente, envoyés ou écartés par la limite",
+    ["resultat"],
+)
+ALERTES_DUREE = histogramme(
+    "gestion_immo_alertes_lot_duree_secondes",
+    "Durée du traitement d'un lot de mises en vente (agence.alertes)",
+)
+ESTIMATION_DUREE = histogramme(
+    "gestion_immo_estimation_duree_secondes",
+    "Durée d'une estimation de prix (agence.estimation), construction de l'index comprise",
+    seuils=(0.001, 0.002, 0.005, 0.01, 0.025, 0.05, 0.1, 1.0, 10.0),
+)
@@ -0,0 +1,151 @@
+import cProfile
+import logging
+import random
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.contrib import messages
+from django.db import connections
+from django.utils import timezone
+
+from . import metriques, profilage, taches
+from .identite import carte_identite
+
+logger = logging.getLogger(__name__)
+
+
+class CarteIdentiteMiddleware:
+    """
+    Active une carte d'identité (voir agence.identite) pour chaque requête.
+    Les compteurs de succès/échecs de la carte sont disponibles dans
+    `request.carte_identite`, dans les logs (niveau DEBUG) et, en DEBUG,
+    dans l'en-tête de réponse `X-Carte-Identite`.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with carte_identite() as carte:
+            request.carte_identite = carte
+            response = self.get_response(request)
+        logger.debug(
+            "carte d'identité %s: %d succès, %d échecs",
+            request.path,
+            carte.succes,
+            carte.echecs,
+        )
+        metriques.CACHE.inc(carte.succes, cache="carte_identite", resultat="succes")
+        metriques.CACHE.inc(carte.echecs, cache="carte_identite", resultat="echec")
+        if settings.DEBUG:
+            response.headers["X-Carte-Identite"] = f"succes={carte.succes}; echecs={carte.echecs}"
+        return response
+
+
+class ProfilageMiddleware:
+    """
+    Profile avec cProfile une proportion `PROFILAGE["TAUX"]` des requêtes, ainsi que
+    les requêtes qui ont l'en-tête `PROFILAGE["ENTETE"]` (X-Profiler: 1) si
+    l'utilisateur est staff ou en DEBUG. Les profils sont enregistrés sur disque et
+    consultables sur /agence/profils/, voir agence.profilage.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.taux = settings.PROFILAGE["TAUX"]
+        self.entete = settings.PROFILAGE["ENTETE"]
+
+    def a_profiler(self, request) -> bool:
+        if request.headers.get(self.entete):
+            utilisateur = getattr(request, "user", None)
+            if settings.DEBUG or (utilisateur is not None and utilisateur.is_staff):
+                return True
+        return self.taux > 0 and random.random() < self.taux
+
+    def __call__(self, request):
+        if not self.a_profiler(request) or not profilage.verrou_profileur.acquire(blocking=False):
+            return self.get_response(request)
+        try:
+            profil = cProfile.Profile()
+            debut = time.perf_counter()
+            profil.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                profil.disable()
+            duree_ms = (time.perf_counter() - debut) * 1000
+        finally:
+            profilage.verrou_profileur.release()
+
+        resolver_match = request.resolver_match
+        nom = profilage.enregistrer(
+            profil,
+            {
+                "chemin": request.get_full_path(),
+                "methode": request.method,
+                "vue": resolver_match.view_name if resolver_match else None,
+                "statut": response.status_code,
+                "duree_ms": duree_ms,
+                "date": timezone.now().isoformat(),
+            },
+        )
+        logger.info("profil %s: %s en %.1f ms", nom, request.path, duree_ms)
+        if settings.DEBUG:
+            response.headers["X-Profil"] = nom
+        return response
+
+
+class MetriquesMiddleware:
+    """
+    Mesure la durée de chaque requête et son nombre de requêtes SQL, par vue (voir
+    agence.metriques). Pour une réponse en streaming, seule la création de la
+    réponse est mesurée.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        nb_requetes = 0
+
+        def compter(execute, sql, params, many, context):
+            nonlocal nb_requetes
+            nb_requetes += 1
+            return execute(sql, params, many, context)
+
+        debut = time.perf_counter()
+        with ExitStack() as pile:
+            for alias in connections:
+                pile.enter_context(connections[alias].execute_wrapper(compter))
+            response = self.get_response(request)
+        duree = time.perf_counter() - debut
+
+        # pas le chemin pour les URL inconnues: une série par URL demandée sinon
+        resolver_match = request.resolver_match
+        vue = resolver_match.view_name if resolver_match else "<inconnue>"
+        metriques.VUES_DUREE.observer(
+            duree, vue=vue, methode=request.method, statut=response.status_code
+        )
+        metriques.VUES_REQUETES_SQL.observer(nb_requetes, vue=vue)
+        metriques.sauvegarder_si_besoin()
+        return response
+
+
+class SuiviTachesMiddleware:
+    """
+    Annonce à l'utilisateur, par un message, le résultat des tâches de fond qu'il
+    a lancées (voir `taches.suivre`), à sa première requête après leur fin. Aucune
+    requête SQL en plus quand la session ne suit aucune tâche.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        for description, tache in taches.terminees_suivies(request):
+            if tache.statut == tache.Statut.REUSSIE:
+                messages.success(request, f"✅ {description} : terminé.")
+            else:
+                messages.error(request, f"⚠️ {description} : échec ({taches.cause_echec(tache)}).")
+        return self.get_response(request)
@@ -1,12 +1,20 @@
+from datetime import timedelta
 from math import atan2, cos, radians, sin, sqrt
 from typing import ClassVar
 
-import requests
 from bidict import bidict
+from django.apps import apps
+from django.core.exceptions import ObjectDoesNotExist
+from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models, transaction
+from django.db.models.functions import Collate
+from django.db.models.signals import class_prepared
+from django.dispatch import receiver
+from django.utils import timezone
 from djmoney.models.fields import MoneyField
 from phonenumber_field.modelfields import PhoneNumberField
-from sklearn.metrics.pairwise import cosine_similarity
+
+from .geocodage import geocoder_lot
 
 # Create your models here.
 
@@ -41,6 +49,11 @@ class Commune(models.Model):
     nom = models.CharField(max_length=255)
     code_postal = models.CharField(max_length=5)
 
+    class Meta:
+        # recherche de l'admin: SQLite n'utilise un index pour `LIKE 'abc%'` (insensible
+        # à la casse) que s'il est en NOCASE, idem pour les index suivants
+        indexes: ClassVar = [models.Index(Collate("nom", "NOCASE"), name="commune_nom_nocase")]
+
     def __str__(self):
         return f"{self.nom} ({self.code_postal})"
 
@@ -51,11 +64,26 @@ class Voie(models.Model):
 
     class Meta:
         unique_together: ClassVar = [("nom", "commune")]
+        indexes: ClassVar = [models.Index(Collate("nom", "NOCASE"), name="voie_nom_nocase")]
 
     def __str__(self):
         return f"{self.nom} - {self.commune}"
 
 
+class VersionReferentiel(models.Model):
+    """
+    Compteur incrémenté à chaque modification d'une table de référence (communes,
+    voies): les caches en mémoire des processus le comparent à leur propre version,
+    voir agence.referentiel.
+    """
+
+    table = models.CharField(max_length=64, primary_key=True)
+    version = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.table} v{self.version}"
+
+
 class Adresse(models.Model):
     id_ban = models.CharField(max_length=64, unique=True)
     voie = models.ForeignKey(Voie, models.PROTECT)
@@ -65,65 +93,122 @@ class Adresse(models.Model):
     latitude = models.FloatField(null=True, blank=True)
     label = models.CharField(max_length=255)
 
+    class Meta:
+        indexes: ClassVar = [models.Index(Collate("label", "NOCASE"), name="adresse_label_nocase")]
+
     def __str__(self):
         return self.label
 
     @classmethod
     def from_texte(cls, texte: str) -> "Adresse":
-        texte = texte.strip()
-
-        # ! toute la doc est ici:
-        # https://adresse.data.gouv.fr/outils/api-doc/adresse
-        try:
-            response = requests.get(
-                "https://api-adresse.data.gouv.fr/search/",
-                {"q": texte, "limit": 1, "autocomplete": 0},
-                timeout=5,
-            )
-            response.raise_for_status()
-            result = response.json()
-        except (requests.RequestException, ValueError) as e:
-            msg = "Adresse introuvable ou API inaccessible"
-            raise ValueError(msg) from e
-        try:
-            result = result["features"][0]
-            longitude, latitude = result["geometry"]["coordinates"]
-            prop = result["properties"]
-            commune_insee = prop["citycode"]
-            commune = prop["city"]
-            code_postal = prop["postcode"]
-
-            voie = prop["street"]
-
-            id_ban = prop["id"]
-            numero = prop.get("housenumber", "")
-            label = prop["label"]
+        """
+        Géocode l'adresse `texte` et la crée si besoin, voir `bulk_from_textes`.
 
-        except (KeyError, TypeError, ValueError) as e:
-            msg = "Réponse API invalide"
-            raise ValueError(msg) from e
+        :raise ValueError: si l'adresse est introuvable ou l'API inaccessible.
+        """
+        texte = texte.strip()
+        adresse = cls.bulk_from_textes([texte]).get(texte)
+        if adresse is None:
+            msg = "Adresse introuvable"
+            raise ValueError(msg)
+        return adresse
 
-        # On vérifie si l'adresse existe déjà dans la BDD
-        if Adresse.objects.filter(id_ban=id_ban).exists():
-            return Adresse.objects.get(id_ban=id_ban)
+    @classmethod
+    def bulk_from_textes(cls, textes) -> dict[str, "Adresse"]:
+        """
+        Résout plusieurs adresses d'un coup: celles dont le texte est le label d'une
+        adresse déjà en base sont lues en une requête, les autres sont géocodées en un
+        seul lot (voir agence.geocodage) puis les communes, voies et adresses sont
+        insérées ou mises à jour avec une requête par table (INSERT ... ON CONFLICT DO
+        UPDATE). Deux appels concurrents pour la même adresse ne peuvent donc pas se
+        gêner. Les communes et voies déjà en cache (agence.referentiel) et inchangées
+        ne sont pas réécrites.
+
+        :return: {texte: adresse}, sans les textes introuvables.
+        :raise geocodage.ErreurGeocodage: (une ValueError) si l'API est inaccessible
+            ou sa réponse invalide.
+        """
+        textes = {texte.strip() for texte in textes} - {""}
+        adresses = {adresse.label: adresse for adresse in cls.objects.filter(label__in=textes)}
+        resultats = {
+            texte: r
+            for texte, r in geocoder_lot(sorted(textes - adresses.keys())).items()
+            if r is not None
+        }
+        if not resultats:
+            return adresses
+
+        from .referentiel import COMMUNES, VOIES  # noqa: PLC0415
 
-        # On encapsule la création de l'adresse dans une transaction
-        # pour garantir l'intégrité des données
         with transaction.atomic():
-            commune, _ = Commune.objects.get_or_create(
-                code_insee=commune_insee, nom=commune, code_postal=code_postal
+            communes = {
+                r.code_insee: Commune(
+                    code_insee=r.code_insee, nom=r.commune, code_postal=r.code_postal
+                )
+                for r in resultats.values()
+            }
+            # les communes et voies déjà connues (et inchangées) viennent du cache
+            connues = COMMUNES.par_cles((code,) for code in communes)
+            modifiees = [
+                commune
+                for code, commune in communes.items()
+                if (connue := connues.get((code,))) is None
+                or (connue.nom, connue.code_postal) != (commune.nom, commune.code_postal)
+            ]
+            # update_conflicts renseigne aussi la clé primaire des lignes déjà existantes
+            Commune.objects.bulk_create(
+                modifiees,
+                update_conflicts=True,
+                unique_fields=["code_insee"],
+                update_fields=["nom", "code_postal"],
             )
-            voie, _ = Voie.objects.get_or_create(nom=voie, commune=commune)
-            adresse, _ = cls.objects.get_or_create(
-                id_ban=id_ban,
-                voie=voie,
-                numero=numero,
-                complement="",  # TODO: à changer
-                longitude=longitude,
-                latitude=latitude,
-                label=label,
+            if any((commune.code_insee,) in connues for commune in modifiees):
+                COMMUNES.invalider()
+            COMMUNES.ajouter(modifiees)
+            for code, commune in communes.items():
+                if commune.pk is None:
+                    commune.pk = connues[code,].pk
+
+            voies = {
+                (r.voie, r.code_insee): Voie(nom=r.voie, commune=communes[r.code_insee])
+                for r in resultats.values()
+            }
+            connues = VOIES.par_cles((voie.nom, voie.commune_id) for voie in voies.values())
+            for voie in voies.values():
+                if (connue := connues.get((voie.nom, voie.commune_id))) is not None:
+                    voie.pk = connue.pk
+            nouvelles = [voie for voie in voies.values() if voie.pk is None]
+            Voie.objects.bulk_create(
+                nouvelles,
+                update_conflicts=True,
+                unique_fields=["nom", "commune"],
+                update_fields=["nom"],  # rien à mettre à jour, mais il faut l'id
             )
-        return adresse
+            VOIES.ajouter(nouvelles)
+            par_id_ban = {
+                r.id_ban: cls(
+                    id_ban=r.id_ban,
+                    voie=voies[r.voie, r.code_insee],
+                    numero=r.numero,
+                    longitude=r.longitude,
+                    latitude=r.latitude,
+                    label=r.label,
+                )
+                for r in resultats.values()
+            }
+            cls.objects.bulk_create(
+                par_id_ban.values(),
+                update_conflicts=True,
+                unique_fields=["id_ban"],
+                update_fields=["voie", "numero", "longitude", "latitude", "label"],
+            )
+            # bulk_create ne déclenche pas les signaux: on réindexe les biens des
+            # adresses qui existaient déjà (leur label a pu changer)
+            from .recherche_texte import indexer  # noqa: PLC0415
+
+            indexer(models.Q(infos_bien__lieu__in=[a.pk for a in par_id_ban.values()]))
+        adresses.update({texte: par_id_ban[r.id_ban] for texte, r in resultats.items()})
+        return adresses
 
     def create_label(self, *, only_if_not_exists=True, save=False) -> str:
         """
@@ -236,7 +321,14 @@ class InfosBien(models.Model):
         dist = self.distance(autre=autre)
 
         # On calcule la similarité cosinus entre les deux vecteurs
-        score = cosine_similarity([bien_vector], [critere_vector])[0][0]
+        # (numpy importé ici: inutile de le charger pour chaque commande manage.py)
+        import numpy as np  # noqa: PLC0415
+
+        vecteurs = np.array([bien_vector, critere_vector], dtype=float)
+        normes = np.linalg.norm(vecteurs, axis=1)
+        normes[normes == 0] = 1  # un vecteur nul a une similarité nulle avec tout
+        vecteurs /= normes[:, None]
+        score = vecteurs[0] @ vecteurs[1]
         return int(score * 100) - int(dist / 1000)
 
 
@@ -261,6 +353,49 @@ class Bien(models.Model):
         return ", ".join(f"{k}: {v}" for k, v in attrs.items()) + f" ({self.pk})"
 
 
+class FacetteBien(models.Model):
+    """
+    Nombre de biens pour chaque combinaison de valeurs des facettes de recherche.
+    Table d'agrégats maintenue par agence.recherche, ne pas modifier à la main.
+    """
+
+    etat = models.CharField(max_length=2, choices=Bien.Etat.choices)
+    tranche_prix = models.CharField(max_length=16, blank=True)  # "" = prix non renseigné
+    chambres = models.IntegerField()  # 0 = non renseigné
+    nombre = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together: ClassVar = [("etat", "tranche_prix", "chambres")]
+
+    def __str__(self):
+        return f"{self.etat} / {self.tranche_prix} / {self.chambres} ch.: {self.nombre}"
+
+
+class DocumentBien(models.Model):
+    """
+    Document de recherche plein texte d'un bien (description, adresse, commune, voie).
+    C'est une table virtuelle SQLite FTS5, créée et maintenue par
+    agence.recherche_texte: pas de migration, ne pas modifier à la main.
+    """
+
+    bien = models.OneToOneField(
+        Bien, models.DO_NOTHING, primary_key=True, db_column="rowid", related_name="document"
+    )
+    description = models.TextField()
+    adresse = models.TextField()
+    commune = models.TextField()
+    voie = models.TextField()
+    # colonne cachée de FTS5: score bm25 (plus petit = plus pertinent), seulement avec MATCH
+    rank = models.FloatField(null=True)
+
+    class Meta:
+        managed = False
+        db_table = "agence_bien_fts"
+
+    def __str__(self):
+        return f"Document du bien {self.bien_id}"
+
+
 # endregion
 # ---------------------------------------------------------------------------- #
 #                              region Utilisateur                              #
@@ -276,12 +411,41 @@ class Bien(models.Model):
 # et qui se charge de tout ce qui est commun à tous les utilisateurs
 
 
+# relations one-to-one inverses de Utilisateur vers ses rôles. Pas la liste de
+# ProxyUtilisateur.TYPE_UTILISATEURS: les migrations y créent des copies des modèles
+ROLES = ("acheteur", "vendeur", "agent")
+
+
+class UtilisateurQuerySet(models.QuerySet):
+    def avec_roles(self):
+        """
+        Charge avec chaque utilisateur tous ses rôles (acheteur, vendeur, agent et
+        l'agence de l'agent) en une seule requête, avec des LEFT JOIN.
+        Les rôles sont ensuite accessibles sans requête avec `Utilisateur.role()`
+        ou `Utilisateur.roles`.
+        """
+        return self.select_related(*ROLES, "agent__agence")
+
+    def roles_par_id(self, ids) -> dict[int, "Utilisateur"]:
+        """Comme `avec_roles`, pour une liste d'identifiants: renvoie {id: utilisateur}."""
+        return self.avec_roles().in_bulk(ids)
+
+
 class Utilisateur(models.Model):
     nom = models.CharField(max_length=255)
     prenom = models.CharField(max_length=255)
     telephone = PhoneNumberField(null=True, blank=True, unique=True, default=None)
     email = models.EmailField(unique=True)
 
+    objects = UtilisateurQuerySet.as_manager()
+
+    class Meta:
+        # recherche de l'admin (=email, ^nom), voir Commune
+        indexes: ClassVar = [
+            models.Index(Collate("email", "NOCASE"), name="utilisateur_email_nocase"),
+            models.Index(Collate("nom", "NOCASE"), name="utilisateur_nom_nocase"),
+        ]
+
     def __str__(self):
         coords = (self.email, self.telephone)  # récupérer les coordonnées
         coords = filter(None, coords)  # filtrer les coordonnées vides
@@ -292,6 +456,21 @@ class Utilisateur(models.Model):
 
         return f"{self.prenom} {self.nom} {coords_str}"
 
+    def role(self, nom: str) -> "ProxyUtilisateur | None":
+        """
+        Renvoie le rôle `nom` ("acheteur", "vendeur" ou "agent") de l'utilisateur,
+        ou None s'il ne l'a pas. Sans requête si l'utilisateur vient de `avec_roles()`.
+        """
+        try:
+            return getattr(self, nom)
+        except ObjectDoesNotExist:
+            return None
+
+    @property
+    def roles(self) -> dict[str, "ProxyUtilisateur"]:
+        """Les rôles de l'utilisateur, par nom. Utilisable dans les templates."""
+        return {nom: role for nom in ROLES if (role := self.role(nom)) is not None}
+
 
 class ProxyUtilisateur:
     """Classe proxy pour Utilisateur."""
@@ -303,8 +482,8 @@ class ProxyUtilisateur:
         # On enregistre la classe dans le dict
         if name is None:
             name = cls.__name__.lower()
-        if cls is not ProxyUtilisateur and cls not in ProxyUtilisateur.TYPE_UTILISATEURS:
-            ProxyUtilisateur.TYPE_UTILISATEURS[cls.__name__.lower()] = cls
+        # enregistrée par _enregistrer_type_utilisateur, une fois le modèle prêt
+        cls._nom_type_utilisateur = name
 
     def __str__(self):
         coords = (self.utilisateur.email, self.utilisateur.telephone)  # récupérer les coordonnées
@@ -322,7 +501,8 @@ class ProxyUtilisateur:
         return f"/agence/{class_name}/{id_}/"
 
     def url(self):
-        return self.url_cls(self.utilisateur.id)
+        # la clé primaire est l'id de l'utilisateur: pas besoin de charger self.utilisateur
+        return self.url_cls(self.pk)
 
     @classmethod
     def url_html_cls(cls, id_):
@@ -332,6 +512,19 @@ class ProxyUtilisateur:
         return f'<a href="{self.url()}">{self.__class__.__name__.lower()}</a>'
 
 
+@receiver(class_prepared)
+def _enregistrer_type_utilisateur(sender, **kwargs):
+    # seulement les modèles du registre de l'application: pas les copies que font les
+    # migrations (SQLite reconstruit une table avec une classe NewAgent, par exemple),
+    # qui ont leur propre registre
+    if (
+        issubclass(sender, ProxyUtilisateur)
+        and sender._meta.apps is apps
+        and sender not in ProxyUtilisateur.TYPE_UTILISATEURS.inverse
+    ):
+        ProxyUtilisateur.TYPE_UTILISATEURS[sender._nom_type_utilisateur] = sender
+
+
 class Vendeur(ProxyUtilisateur, models.Model):
     utilisateur = models.OneToOneField(Utilisateur, models.CASCADE, primary_key=True)
 
@@ -374,27 +567,56 @@ class FaitAchat(models.Model):
         ABANDON = 11
 
     etape_achat = models.IntegerField(choices=EtapeAchat.choices)
+    cree_le = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        # propositions récentes de chaque acheteur, pour limiter les alertes (agence.alertes)
+        indexes: ClassVar = [models.Index(fields=["etape_achat", "cree_le"])]
 
     def __str__(self):
         return f"Fait achat de {self.acheteur} pour le bien {self.bien} ({self.etape_achat})"
 
 
 class RendezVous(models.Model):
+    DUREE_MAX: ClassVar = timedelta(hours=8)
+
     fait_achat = models.ForeignKey(FaitAchat, models.CASCADE)
     objet = models.CharField(max_length=255)
     commentaire = models.TextField(blank=True, default="")
     date = models.DateTimeField()
+    duree = models.DurationField(
+        default=timedelta(hours=1),
+        validators=[MinValueValidator(timedelta(minutes=5)), MaxValueValidator(DUREE_MAX)],
+    )
     lieu = models.ForeignKey(Adresse, models.PROTECT, null=True)
 
+    class Meta:
+        # pour la chronologie d'un fait d'achat (agence.chronologie), idem Avis et Message
+        indexes: ClassVar = [models.Index(fields=["fait_achat", "date"])]
+
     def __str__(self):
         return f"Rendez-vous pour {self.fait_achat} ({self.date})"
 
+    @property
+    def fin(self):
+        return self.date + self.duree
+
+    def clean(self):
+        # l'agent du bien ne peut pas être à deux rendez-vous en même temps
+        from .planning import verifier_disponibilite  # noqa: PLC0415
+
+        if self.fait_achat_id is not None:
+            verifier_disponibilite(self)
+
 
 class Avis(models.Model):
     fait_achat = models.ForeignKey(FaitAchat, models.CASCADE)
     commentaire = models.TextField(blank=True, default="")
     date = models.DateTimeField()
 
+    class Meta:
+        indexes: ClassVar = [models.Index(fields=["fait_achat", "date"])]
+
     def __str__(self):
         return f"Avis pour {self.fait_achat} ({self.date})"
 
@@ -405,8 +627,181 @@ class Message(models.Model):
     auteur = models.ForeignKey(Utilisateur, models.CASCADE)
     fait_achat = models.ForeignKey(FaitAchat, models.CASCADE)
 
+    class Meta:
+        indexes: ClassVar = [models.Index(fields=["fait_achat", "date"])]
+
     def __str__(self):
         return f"Message de {self.auteur} pour {self.fait_achat} ({self.date})"
 
 
+class EvenementAchat(models.Model):
+    """
+    Journal des messages, avis et rendez-vous créés pour un fait d'achat, rempli par
+    agence.direct. Son id croissant sert de curseur pour le suivi en direct
+    ("événements depuis l'id N").
+    """
+
+    class Type(models.TextChoices):
+        AVIS = "avis"
+        MESSAGE = "message"
+        RENDEZVOUS = "rendezvous", "Rendez-vous"
+
+    fait_achat = models.ForeignKey(FaitAchat, models.CASCADE)
+    type = models.CharField(max_length=16, choices=Type.choices)
+    objet_id = models.BigIntegerField()
+    date = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes: ClassVar = [models.Index(fields=["fait_achat", "id"])]
+
+    def __str__(self):
+        return f"{self.get_type_display()} {self.objet_id} pour {self.fait_achat_id} ({self.pk})"
+
+
+# endregion
+
+# ---------------------------------------------------------------------------- #
+#                                 region Tâches                                #
+# ---------------------------------------------------------------------------- #
+
+
+class Tache(models.Model):
+    """
+    Tâche de fond à exécuter par la commande `travailleur`, voir agence.taches.
+    """
+
+    class Statut(models.TextChoices):
+        EN_ATTENTE = "AT", "En attente"
+        EN_COURS = "EC", "En cours"
+        REUSSIE = "OK", "Réussie"
+        ECHOUEE = "KO", "Échouée"
+
+    nom = models.CharField(max_length=100)  # nom de la tâche dans agence.taches.TACHES
+    arguments = models.JSONField(default=dict)
+    # deux tâches de même nom et même clé ne peuvent pas être en attente ou en cours
+    # en même temps. NULL (pas "") pour les tâches sans clé: deux NULL ne sont jamais
+    # égaux pour l'index unique partiel, ces tâches ne sont donc pas dédupliquées.
+    cle = models.CharField(max_length=255, null=True, blank=True)  # noqa: DJ001
+    statut = models.CharField(max_length=2, choices=Statut.choices, default=Statut.EN_ATTENTE)
+    tentatives = models.PositiveIntegerField(default=0)
+    executer_apres = models.DateTimeField(default=timezone.now)
+    creee_le = models.DateTimeField(auto_now_add=True)
+    debut = models.DateTimeField(null=True, blank=True)
+    fin = models.DateTimeField(null=True, blank=True)
+    travailleur = models.CharField(max_length=100, blank=True)
+    resultat = models.JSONField(null=True, blank=True)
+    erreur = models.TextField(blank=True)
+
+    class Meta:
+        indexes: ClassVar = [
+            models.Index(fields=["statut", "executer_apres"]),
+            models.Index(fields=["nom", "cle", "-fin"]),
+        ]
+        constraints: ClassVar = [
+            models.UniqueConstraint(
+                fields=["nom", "cle"],
+                condition=models.Q(statut__in=["AT", "EC"]),
+                name="tache_cle_unique_active",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.nom} #{self.pk} ({self.get_statut_display()})"
+
+
+# endregion
+
+# ---------------------------------------------------------------------------- #
+#                                region Alertes                                #
+# ---------------------------------------------------------------------------- #
+
+
+class MiseEnVente(models.Model):
+    """
+    File des biens mis en vente dont les acheteurs n'ont pas encore été alertés, vidée
+    par lots par agence.alertes.
+    """
+
+    bien = models.OneToOneField(Bien, models.CASCADE, primary_key=True)
+    date = models.DateTimeField(auto_now_add=True)
+    # lot en cours de traitement: les autres exécutions de envoyer_alertes l'ignorent
+    reservation = models.UUIDField(null=True, blank=True)
+    reservee_le = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Mise en vente du bien {self.bien_id} ({self.date})"
+
+
+# endregion
+
+# ---------------------------------------------------------------------------- #
+#                              region Statistiques                             #
+# ---------------------------------------------------------------------------- #
+
+
+class StatistiqueJour(models.Model):
+    """
+    Nombre d'entrées et de sorties d'une valeur (étape d'achat, état de bien) par jour
+    et par agent, et solde des transferts d'un agent à un autre. Tables d'agrégats
+    maintenues par agence.entonnoir, ne pas modifier à la main.
+    """
+
+    jour = models.DateField()
+    # pas de contrainte de clé étrangère: l'historique reste après la suppression
+    # de l'agent. None: biens sans agent
+    agent = models.ForeignKey(
+        "Agent", models.DO_NOTHING, null=True, db_constraint=False, related_name="+"
+    )
+    entrees = models.PositiveIntegerField(default=0)
+    sorties = models.PositiveIntegerField(default=0)
+    # reçus d'un autre agent (> 0) ou donnés (< 0), sans changer de valeur: comptent
+    # dans le stock mais pas dans les entrées de l'entonnoir
+    transferts = models.IntegerField(default=0)
+
+    class Meta:
+        abstract = True
+
+
+class EtapeAchatJour(StatistiqueJour):
+    etape_achat = models.IntegerField(choices=FaitAchat.EtapeAchat.choices)
+
+    class Meta:
+        indexes: ClassVar = [models.Index(fields=["jour", "agent", "etape_achat"])]
+
+    def __str__(self):
+        return f"{self.jour} {self.agent_id} {self.etape_achat}: +{self.entrees} -{self.sorties}"
+
+
+class EtatBienJour(StatistiqueJour):
+    etat = models.CharField(max_length=2, choices=Bien.Etat.choices)
+
+    class Meta:
+        indexes: ClassVar = [models.Index(fields=["jour", "agent", "etat"])]
+
+    def __str__(self):
+        return f"{self.jour} {self.agent_id} {self.etat}: +{self.entrees} -{self.sorties}"
+
+
+# endregion
+
+# ---------------------------------------------------------------------------- #
+#                               region Estimation                              #
+# ---------------------------------------------------------------------------- #
+
+
+class ChangementVente(models.Model):
+    """
+    Journal des biens vendus ajoutés, modifiés ou retirés (vente annulée, bien
+    supprimé): l'index des ventes de chaque processus lit les lignes qu'il n'a pas
+    encore vues pour se mettre à jour, voir agence.estimation.
+    """
+
+    # pas de contrainte de clé étrangère: le bien peut avoir été supprimé
+    bien = models.ForeignKey(Bien, models.DO_NOTHING, db_constraint=False, related_name="+")
+    date = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Changement de la vente du bien {self.bien_id} ({self.date})"
+
+
 # endregion
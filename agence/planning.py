@@ -0,0 +1,185 @@
+"""
+Agenda des agents: détection des conflits de rendez-vous et créneaux libres.
+
+Un agent est concerné par les rendez-vous des faits d'achat de ses biens. Ses
+rendez-vous sont chargés une fois, triés par début, avec le maximum cumulé des fins
+(`AgendaAgent`): un nouveau créneau [debut, fin) est en conflit si un des
+rendez-vous qui commencent avant `fin` se termine après `debut`, ce qui se vérifie
+avec deux recherches dichotomiques, en O(log n). Les créneaux libres se calculent
+par un simple balayage des rendez-vous triés.
+
+Pour ne charger que les rendez-vous utiles, on s'appuie sur la durée maximale d'un
+rendez-vous (`RendezVous.DUREE_MAX`): un rendez-vous qui chevauche [debut, fin) a
+forcément commencé après `debut - DUREE_MAX`, ce que l'index sur la date permet de
+filtrer.
+"""
+
+import itertools
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+from typing import NamedTuple
+
+from django.core.exceptions import ValidationError
+from django.utils import timezone
+
+from .models import Agent, RendezVous
+
+HEURES_OUVRABLES = (time(9), time(18))
+JOURS_OUVRABLES = frozenset(range(5))  # du lundi au vendredi
+
+
+class Intervalle(NamedTuple):
+    debut: datetime
+    fin: datetime
+    id: int | None = None  # id du rendez-vous
+
+
+def rendez_vous_chevauchant(debut: datetime, fin: datetime, **filtres):
+    """
+    Renvoie une requête (id, agent_id, date, duree) des rendez-vous susceptibles de
+    chevaucher [debut, fin): il faut encore vérifier `date + duree > debut`.
+    """
+    return RendezVous.objects.filter(
+        date__gte=debut - RendezVous.DUREE_MAX, date__lt=fin, **filtres
+    ).values_list("id", "fait_achat__bien__agent_id", "date", "duree")
+
+
+class AgendaAgent:
+    """Rendez-vous d'un agent triés par début, voir le docstring du module."""
+
+    def __init__(self, intervalles=()):
+        intervalles = sorted(intervalles, key=lambda i: i.debut)
+        self.debuts = [i.debut for i in intervalles]
+        self.fins = [i.fin for i in intervalles]
+        self.ids = [i.id for i in intervalles]
+        self._fins_max = list(itertools.accumulate(self.fins, max))
+
+    @classmethod
+    def charger(cls, agent_id: int, debut: datetime, fin: datetime, exclure=None):
+        """
+        Agenda de l'agent limité aux rendez-vous qui chevauchent [debut, fin).
+
+        :param exclure: id d'un rendez-vous à ignorer (celui que l'on modifie).
+        """
+        lignes = rendez_vous_chevauchant(debut, fin, fait_achat__bien__agent_id=agent_id)
+        if exclure is not None:
+            lignes = lignes.exclude(pk=exclure)
+        return cls(
+            Intervalle(date_rdv, date_rdv + duree, pk)
+            for pk, _, date_rdv, duree in lignes
+            if date_rdv + duree > debut
+        )
+
+    def __len__(self):
+        return len(self.debuts)
+
+    def conflit(self, debut: datetime, fin: datetime) -> Intervalle | None:
+        """Renvoie un rendez-vous qui chevauche [debut, fin), ou None. En O(log n)."""
+        k = bisect_left(self.debuts, fin)  # les k premiers commencent avant `fin`
+        if k == 0 or self._fins_max[k - 1] <= debut:
+            return None
+        # le premier dont le maximum cumulé des fins dépasse `debut` se termine lui-même
+        # après `debut`
+        j = bisect_right(self._fins_max, debut, hi=k)
+        return Intervalle(self.debuts[j], self.fins[j], self.ids[j])
+
+    def occupations(self) -> list[tuple[datetime, datetime]]:
+        """Périodes occupées: les rendez-vous fusionnés quand ils se chevauchent."""
+        periodes = []
+        for debut, fin in zip(self.debuts, self.fins, strict=True):
+            if periodes and debut <= periodes[-1][1]:
+                periodes[-1][1] = max(periodes[-1][1], fin)
+            else:
+                periodes.append([debut, fin])
+        return [tuple(periode) for periode in periodes]
+
+    def creneaux_libres(
+        self, debut: datetime, fin: datetime, duree: timedelta
+    ) -> list[tuple[datetime, datetime]]:
+        """
+        Plages libres d'au moins `duree` entre `debut` et `fin`, pendant les heures
+        et jours ouvrables (heure locale).
+        """
+        libres = []
+        occupations = self.occupations()
+        i = 0
+        for ouverture, fermeture in _plages_ouvrables(debut, fin):
+            curseur = ouverture
+            # les occupations terminées avant cette plage ne servent plus
+            while i < len(occupations) and occupations[i][1] <= ouverture:
+                i += 1
+            j = i
+            while j < len(occupations) and occupations[j][0] < fermeture:
+                if occupations[j][0] - curseur >= duree:
+                    libres.append((curseur, occupations[j][0]))
+                curseur = max(curseur, occupations[j][1])
+                j += 1
+            if fermeture - curseur >= duree:
+                libres.append((curseur, fermeture))
+        return libres
+
+
+def _plages_ouvrables(debut: datetime, fin: datetime):
+    """Plages (ouverture, fermeture) des jours ouvrables, coupées à [debut, fin)."""
+    jour = timezone.localtime(debut).date()
+    dernier = timezone.localtime(fin).date()
+    while jour <= dernier:
+        if jour.weekday() in JOURS_OUVRABLES:
+            ouverture = timezone.make_aware(datetime.combine(jour, HEURES_OUVRABLES[0]))
+            fermeture = timezone.make_aware(datetime.combine(jour, HEURES_OUVRABLES[1]))
+            ouverture, fermeture = max(ouverture, debut), min(fermeture, fin)
+            if ouverture < fermeture:
+                yield ouverture, fermeture
+        jour += timedelta(days=1)
+
+
+def debut_semaine(jour: date | None = None) -> datetime:
+    """Lundi 0h (heure locale) de la semaine de `jour` (aujourd'hui par défaut)."""
+    jour = jour or timezone.localdate()
+    lundi = jour - timedelta(days=jour.weekday())
+    return timezone.make_aware(datetime.combine(lundi, time()))
+
+
+def creneaux_libres_agence(
+    agence_id: int, debut: datetime, fin: datetime, duree: timedelta
+) -> dict[int, list[tuple[datetime, datetime]]]:
+    """
+    Créneaux libres de chaque agent de l'agence, avec une seule requête pour tous
+    les rendez-vous de la période.
+
+    :return: {agent_id: [(debut, fin), ...]}
+    """
+    par_agent = defaultdict(list)
+    for pk, agent_id, date_rdv, duree_rdv in rendez_vous_chevauchant(
+        debut, fin, fait_achat__bien__agent__agence_id=agence_id
+    ):
+        if date_rdv + duree_rdv > debut:
+            par_agent[agent_id].append(Intervalle(date_rdv, date_rdv + duree_rdv, pk))
+    return {
+        agent_id: AgendaAgent(par_agent[agent_id]).creneaux_libres(debut, fin, duree)
+        for agent_id in Agent.objects.filter(agence_id=agence_id).values_list("pk", flat=True)
+    }
+
+
+def verifier_disponibilite(rendez_vous: RendezVous):
+    """
+    Vérifie que l'agent du bien n'a pas déjà un rendez-vous sur ce créneau.
+
+    :raise ValidationError: en cas de conflit.
+    """
+    if rendez_vous.date is None or rendez_vous.duree is None:
+        return
+    agent_id = rendez_vous.fait_achat.bien.agent_id
+    if agent_id is None:
+        return
+    debut, fin = rendez_vous.date, rendez_vous.fin
+    agenda = AgendaAgent.charger(agent_id, debut, fin, exclure=rendez_vous.pk)
+    if (conflit := agenda.conflit(debut, fin)) is not None:
+        debut_conflit = timezone.localtime(conflit.debut)
+        fin_conflit = timezone.localtime(conflit.fin)
+        msg = (
+            "L'agent a déjà un rendez-vous de "
+            f"{debut_conflit:%d/%m/%Y %H:%M} à {fin_conflit:%H:%M}."
+        )
+        raise ValidationError({"date": msg})
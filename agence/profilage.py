@@ -0,0 +1,170 @@
+"""
+Profilage d'un échantillon de requêtes avec cProfile (voir
+`agence.middleware.ProfilageMiddleware`).
+
+Chaque requête profilée donne deux fichiers dans `PROFILAGE["DOSSIER"]`: le profil
+pstats (`<nom>.prof`, lisible aussi avec `python -m pstats` ou snakeviz) et ses
+métadonnées (`<nom>.json`: chemin, vue, durée, statut...). Seuls les
+`PROFILAGE["MAX_FICHIERS"]` profils les plus récents sont gardés.
+
+Les vues `views.profils` et `views.profil_detail` listent les requêtes les plus lentes
+et affichent l'arbre d'appels d'un profil, ou de tous les profils d'une même vue
+agrégés. L'arbre est reconstruit à partir des statistiques appelant -> appelé de
+pstats, qui ne gardent pas la pile complète: quand une fonction est appelée depuis
+plusieurs endroits, le temps de ses propres appels est réparti entre eux au prorata
+du temps passé dans chacun (une estimation, exacte pour les fonctions qui n'ont
+qu'un appelant).
+"""
+
+import json
+import pstats
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from django.conf import settings
+
+NOM_VALIDE = re.compile(r"^[\w.-]+$")
+SEUIL_ARBRE = 0.005  # on masque les appels qui font moins de 0,5 % du temps total
+PROFONDEUR_MAX = 40
+
+# cProfile (sys.monitoring depuis Python 3.12) n'accepte qu'un profileur actif à la
+# fois par processus: les requêtes concurrentes ne sont pas profilées
+verrou_profileur = threading.Lock()
+
+
+def dossier() -> Path:
+    return Path(settings.PROFILAGE["DOSSIER"])
+
+
+# ---------------------------------------------------------------------------- #
+#                                  Écriture                                    #
+# ---------------------------------------------------------------------------- #
+
+
+def enregistrer(profil, meta: dict) -> str:
+    """
+    Écrit le profil (cProfile.Profile arrêté) et ses métadonnées, puis supprime les
+    plus anciens au-delà de `MAX_FICHIERS`. Renvoie le nom du profil.
+    """
+    racine = dossier()
+    racine.mkdir(parents=True, exist_ok=True)
+    vue = re.sub(r"[^\w-]", "_", meta.get("vue") or "inconnue")
+    nom = f"{time.time_ns()}-{vue}"
+    profil.dump_stats(racine / f"{nom}.prof")
+    (racine / f"{nom}.json").write_text(json.dumps(meta), encoding="utf-8")
+    _rotation(racine, settings.PROFILAGE["MAX_FICHIERS"])
+    return nom
+
+
+def _rotation(racine: Path, max_fichiers: int):
+    # les noms commencent par un horodatage en ns: l'ordre alphabétique est chronologique
+    profils = sorted(racine.glob("*.prof"))
+    for ancien in profils[: max(0, len(profils) - max_fichiers)]:
+        ancien.unlink(missing_ok=True)
+        ancien.with_suffix(".json").unlink(missing_ok=True)
+
+
+# ---------------------------------------------------------------------------- #
+#                                   Lecture                                    #
+# ---------------------------------------------------------------------------- #
+
+
+def lister(vue: str | None = None) -> list[dict]:
+    """Métadonnées des profils (de la vue `vue` si donnée), les plus lents d'abord."""
+    profils = []
+    for fichier in dossier().glob("*.json"):
+        try:
+            meta = json.loads(fichier.read_text(encoding="utf-8"))
+        except (OSError, ValueError):  # supprimé ou en cours d'écriture
+            continue
+        if vue is None or meta.get("vue") == vue:
+            profils.append(meta | {"nom": fichier.stem})
+    return sorted(profils, key=lambda meta: -meta["duree_ms"])
+
+
+def charger(noms) -> pstats.Stats | None:
+    """Statistiques agrégées des profils `noms`, ou None si aucun n'existe."""
+    fichiers = [
+        str(chemin)
+        for nom in noms
+        if NOM_VALIDE.match(nom) and (chemin := dossier() / f"{nom}.prof").exists()
+    ]
+    return pstats.Stats(*fichiers) if fichiers else None
+
+
+@dataclass
+class Noeud:
+    fonction: str
+    cumul_ms: float
+    propre_ms: float
+    appels: int
+    part: float  # du temps total
+    enfants: list["Noeud"] = field(default_factory=list)
+
+
+def _libelle(fonction) -> str:
+    fichier, ligne, nom = fonction
+    if fichier == "~":  # fonction C
+        return nom
+    chemin = Path(fichier)
+    for racine in (settings.BASE_DIR, *(p for p in chemin.parents if p.name == "site-packages")):
+        if chemin.is_relative_to(racine):
+            chemin = chemin.relative_to(racine)
+            break
+    return f"{nom} ({chemin}:{ligne})"
+
+
+def arbre(stats: pstats.Stats) -> tuple[float, list[Noeud]]:
+    """
+    Arbre d'appels (voir le docstring du module). Renvoie (durée totale en ms,
+    racines).
+    """
+    appeles = {}  # appelant -> {appelé: (nb appels, temps cumulé)}
+    racines = []
+    for fonction, (_, nb_appels, _, cumul, appelants) in stats.stats.items():
+        if not appelants:
+            racines.append((fonction, nb_appels, cumul))
+        for appelant, (_, nc, _, ct) in appelants.items():
+            appeles.setdefault(appelant, {})[fonction] = (nc, ct)
+    # le profileur entoure un seul appel (get_response), qui a le temps cumulé le plus
+    # grand; cProfile n'enregistre pas son appelant, mais il peut apparaître appelé
+    # par d'autres fonctions (les middlewares s'appellent en chaîne)
+    if stats.stats:
+        principale = max(stats.stats, key=lambda fonction: stats.stats[fonction][3])
+        if all(fonction != principale for fonction, _, _ in racines):
+            racines.append((principale, 1, stats.stats[principale][3]))
+    total = sum(cumul for _, _, cumul in racines) or 1e-9
+
+    def noeud(fonction, appels, cumul, chemin):
+        _, _, propre, cumul_total, _ = stats.stats[fonction]
+        # part des appels de `fonction` qui passent par ce chemin
+        facteur = min(1.0, cumul / cumul_total) if cumul_total else 1.0
+        n = Noeud(_libelle(fonction), cumul * 1000, propre * facteur * 1000, appels, cumul / total)
+        if len(chemin) < PROFONDEUR_MAX:
+            enfants = sorted(appeles.get(fonction, {}).items(), key=lambda item: -item[1][1])
+            n.enfants = [
+                noeud(enfant, nc, ct * facteur, chemin | {enfant})
+                for enfant, (nc, ct) in enfants
+                if ct * facteur / total >= SEUIL_ARBRE and enfant not in chemin
+            ]
+        return n
+
+    racines.sort(key=lambda racine: -racine[2])
+    return total * 1000, [
+        noeud(fonction, appels, cumul, {fonction})
+        for fonction, appels, cumul in racines
+        if cumul / total >= SEUIL_ARBRE
+    ]
+
+
+def fonctions_couteuses(stats: pstats.Stats, nombre: int = 30) -> list[Noeud]:
+    """Les fonctions qui prennent le plus de temps propre (hors appels)."""
+    total = sum(tt for _, _, tt, _, _ in stats.stats.values()) or 1e-9
+    lignes = sorted(stats.stats.items(), key=lambda item: -item[1][2])[:nombre]
+    return [
+        Noeud(_libelle(fonction), ct * 1000, tt * 1000, nc, tt / total)
+        for fonction, (_, nc, tt, ct, _) in lignes
+    ]
@@ -0,0 +1,52 @@
+"""
+Biens proposés à un acheteur selon ses critères de recherche.
+
+Le calcul compare les critères à chaque bien, trop lent pour être fait à chaque
+affichage du profil: il est fait par la tâche de fond `calculer_propositions` (voir
+agence.taches), et son dernier résultat est réutilisé pendant `DUREE_VALIDITE`.
+"""
+
+from datetime import timedelta
+
+from django.utils import timezone
+
+from . import metriques, taches
+from .models import Bien
+
+DUREE_VALIDITE = timedelta(minutes=10)
+
+
+def get_proposition_biens(acheteur):
+    """
+    Retourne les biens qui correspondent aux critères de recherche de l'acheteur.
+    """
+    critere = acheteur.critere_recherche
+    if not critere:
+        return Bien.objects.none()
+    with metriques.PROPOSITIONS_DUREE.chronometrer():
+        biens = list(Bien.objects.select_related("infos_bien").all())
+        biens_scores = [(bien, critere.score_correspondance(bien.infos_bien)) for bien in biens]
+    biens_scores.sort(key=lambda x: x[1], reverse=True)
+    return [bien for bien, score in biens_scores if score > 0][:10]  # Limite à 10 biens
+
+
+def recalculer(acheteur_id: int):
+    """Lance le calcul des propositions de l'acheteur (s'il n'est pas déjà prévu)."""
+    return taches.ajouter("calculer_propositions", cle=str(acheteur_id), acheteur_id=acheteur_id)
+
+
+def propositions_acheteur(acheteur) -> tuple[list[Bien], bool]:
+    """
+    Renvoie (biens proposés au dernier calcul, nouveau calcul en cours). Un nouveau
+    calcul est lancé si le dernier date de plus de `DUREE_VALIDITE`.
+    """
+    if not acheteur.critere_recherche_id:
+        return [], False
+    derniere = taches.derniere_reussie("calculer_propositions", str(acheteur.pk))
+    en_cours = derniere is None or derniere.fin < timezone.now() - DUREE_VALIDITE
+    if en_cours:
+        recalculer(acheteur.pk)
+    if derniere is None:
+        return [], en_cours
+    biens = Bien.objects.select_related("infos_bien").in_bulk(derniere.resultat)
+    return [biens[pk] for pk in derniere.resultat if pk in biens], en_cours
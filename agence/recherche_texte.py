@@ -0,0 +1,197 @@
+"""
+Recherche plein texte des biens avec SQLite FTS5.
+
+Chaque bien a un document dénormalisé (description, libellé de l'adresse, commune,
+voie) dans la table virtuelle `agence_bien_fts` (modèle non géré `DocumentBien`,
+rowid = id du bien). La table est créée après `migrate` (signal post_migrate) et
+tenue à jour par les signaux en bas du module. Les bulk_create / update / SQL brut
+ne déclenchent pas ces signaux: il faut alors appeler `reconstruire_documents()`
+(commande `reconstruire_fts`).
+
+Les mots sont comparés sans accents ni casse, et chaque mot de la recherche est
+un préfixe ("jard" trouve "jardin"). Les résultats sont classés par bm25, avec
+plus de poids pour la commune et l'adresse que pour la description.
+"""
+
+import re
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import BooleanField, F, Q, TextField, Value
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Coalesce, Concat
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Adresse, Bien, Commune, DocumentBien, InfosBien, Voie
+
+TABLE = DocumentBien._meta.db_table
+# Les requêtes écrites à la main n'insèrent dans le SQL que ce nom de table constant
+# (d'où les `noqa: S608` et `S611`): les valeurs passent toujours par des paramètres.
+TABLE_SQL = connections[DEFAULT_DB_ALIAS].ops.quote_name(TABLE)
+COLONNES = ("description", "adresse", "commune", "voie")
+# poids bm25 de chaque colonne, dans l'ordre de COLONNES
+POIDS = (1.0, 2.0, 3.0, 2.0)
+
+_MOT = re.compile(r"\w+")
+
+
+def fts_disponible(using=DEFAULT_DB_ALIAS) -> bool:
+    return connections[using].vendor == "sqlite"
+
+
+def creer_table(using=DEFAULT_DB_ALIAS, **kwargs):
+    """
+    Crée la table FTS5 si elle n'existe pas encore, et la remplit.
+    Branché sur le signal post_migrate dans `AgenceConfig.ready`.
+    """
+    if not fts_disponible(using):
+        return
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        if TABLE in connection.introspection.table_names(cursor):
+            return
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE {TABLE_SQL} USING fts5("
+            f"{', '.join(COLONNES)}, "
+            "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+        )
+        # le classement par défaut (colonne `rank`) utilise nos poids
+        cursor.execute(
+            f"INSERT INTO {TABLE_SQL}({TABLE_SQL}, rank) VALUES ('rank', %s)",  # noqa: S608
+            [f"bm25({', '.join(map(str, POIDS))})"],
+        )
+    reconstruire_documents(using)
+
+
+def _documents(queryset):
+    """Requête qui renvoie (rowid, *COLONNES) pour les biens de `queryset`."""
+    lieu = "infos_bien__lieu"
+    return queryset.order_by().values_list(
+        "pk",
+        Coalesce("infos_bien__description", Value(""), output_field=TextField()),
+        Coalesce(f"{lieu}__label", Value("")),
+        Coalesce(
+            Concat(
+                f"{lieu}__voie__commune__nom", Value(" "), f"{lieu}__voie__commune__code_postal"
+            ),
+            Value(""),
+        ),
+        Coalesce(f"{lieu}__voie__nom", Value("")),
+    )
+
+
+def indexer(condition: Q, using=DEFAULT_DB_ALIAS):
+    """(Ré)écrit les documents des biens qui vérifient `condition`, en SQL ensembliste."""
+    if not fts_disponible(using):
+        return
+    biens = Bien.objects.using(using).filter(condition)
+    sql_ids, params_ids = biens.values("pk").query.get_compiler(using).as_sql()
+    sql_docs, params_docs = _documents(biens).query.get_compiler(using).as_sql()
+    with connections[using].cursor() as cursor:
+        # sql_ids et sql_docs sont compilés par l'ORM, avec leurs paramètres à part
+        cursor.execute(
+            f"DELETE FROM {TABLE_SQL} WHERE rowid IN ({sql_ids})",  # noqa: S608
+            params_ids,
+        )
+        cursor.execute(
+            f"INSERT INTO {TABLE_SQL}(rowid, {', '.join(COLONNES)}) {sql_docs}",
+            params_docs,
+        )
+
+
+def reconstruire_documents(using=DEFAULT_DB_ALIAS):
+    """Recrée tous les documents à partir des biens."""
+    if not fts_disponible(using):
+        return
+    with connections[using].cursor() as cursor:
+        cursor.execute(f"DELETE FROM {TABLE_SQL}")  # noqa: S608
+    indexer(Q(), using)
+    with connections[using].cursor() as cursor:
+        cursor.execute(f"INSERT INTO {TABLE_SQL}({TABLE_SQL}) VALUES ('optimize')")  # noqa: S608
+
+
+# ---------------------------------------------------------------------------- #
+#                                   Recherche                                  #
+# ---------------------------------------------------------------------------- #
+
+
+def expression_fts(texte: str) -> str:
+    """
+    Traduit le texte saisi en requête FTS5: tous les mots doivent être présents,
+    chacun comme préfixe. Les caractères spéciaux de FTS5 sont ignorés.
+    """
+    return " ".join(f'"{mot}"*' for mot in _MOT.findall(texte))
+
+
+def filtrer_texte(queryset, texte: str):
+    """
+    Restreint `queryset` (de biens) à ceux qui correspondent à `texte`, annotés avec
+    `pertinence` (score bm25, plus petit = plus pertinent). Ne trie pas: ajouter
+    `.order_by("pertinence")` pour le classement.
+    """
+    expression = expression_fts(texte)
+    if not expression:
+        return queryset.annotate(pertinence=Value(0.0))
+    if not fts_disponible(queryset.db):
+        # repli sans index (autres bases de données): chaque mot quelque part
+        for mot in _MOT.findall(texte):
+            queryset = queryset.filter(
+                Q(infos_bien__description__icontains=mot)
+                | Q(infos_bien__lieu__label__icontains=mot)
+            )
+        return queryset.annotate(pertinence=Value(0.0))
+    return queryset.filter(
+        # la jointure doit être interne pour que SQLite parte de l'index FTS
+        Q(document__rank__isnull=False),
+        RawSQL(f"{TABLE_SQL} MATCH %s", [expression], output_field=BooleanField()),  # noqa: S611
+    ).annotate(pertinence=F("document__rank"))
+
+
+def rechercher_texte(texte: str, queryset=None):
+    """Biens correspondant à `texte`, du plus pertinent au moins pertinent."""
+    if queryset is None:
+        queryset = Bien.objects.all()
+    return filtrer_texte(queryset, texte).order_by("pertinence", "-pk")
+
+
+# ---------------------------------------------------------------------------- #
+#                                    Signaux                                   #
+# ---------------------------------------------------------------------------- #
+
+
+@receiver(post_save, sender=Bien)
+def _bien_apres_save(sender, instance, using, raw, **kwargs):
+    if not raw:
+        indexer(Q(pk=instance.pk), using)
+
+
+@receiver(post_delete, sender=Bien)
+def _bien_apres_delete(sender, instance, using, **kwargs):
+    if fts_disponible(using):
+        with connections[using].cursor() as cursor:
+            cursor.execute(f"DELETE FROM {TABLE_SQL} WHERE rowid = %s", [instance.pk])  # noqa: S608
+
+
+@receiver(post_save, sender=InfosBien)
+def _infos_apres_save(sender, instance, using, raw, created, **kwargs):
+    # un InfosBien qui vient d'être créé n'est encore rattaché à aucun bien
+    if not (raw or created):
+        indexer(Q(infos_bien=instance), using)
+
+
+@receiver(post_save, sender=Adresse)
+def _adresse_apres_save(sender, instance, using, raw, created, **kwargs):
+    if not (raw or created):
+        indexer(Q(infos_bien__lieu=instance), using)
+
+
+@receiver(post_save, sender=Voie)
+def _voie_apres_save(sender, instance, using, raw, created, **kwargs):
+    if not (raw or created):
+        indexer(Q(infos_bien__lieu__voie=instance), using)
+
+
+@receiver(post_save, sender=Commune)
+def _commune_apres_save(sender, instance, using, raw, created, **kwargs):
+    if not (raw or created):
+        indexer(Q(infos_bien__lieu__voie__commune=instance), using)
@@ -0,0 +1,241 @@
+"""
+Cache en mémoire des tables de référence (`Commune`, `Voie`).
+
+Ces tables changent rarement mais sont lues sans arrêt: `Adresse.create_label`
+(`self.voie.nom`, `self.voie.commune.nom`), `Voie.__str__`, la création d'adresses...
+Chaque processus garde donc les lignes déjà lues dans un cache LRU borné
+(`TAILLE_MAX` lignes par table), accessible par clé primaire ou par clé naturelle
+(code INSEE pour les communes, nom + commune pour les voies). Les clés étrangères
+vers ces modèles (`adresse.voie`, `voie.commune`) passent par le cache, voir
+`installer_descripteurs`.
+
+Cohérence entre processus: toute modification ou suppression d'une ligne (via
+`save()`/`delete()`, ou `invalider()` après une mise à jour en masse) incrémente la
+version de la table dans `VersionReferentiel`. Chaque cache relit cette version au
+plus toutes les `INTERVALLE_VERIFICATION` secondes et se vide si elle a changé: un
+processus voit donc les modifications des autres avec au plus ce délai. Les
+créations n'invalident rien, une ligne absente du cache étant lue en base.
+"""
+
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, transaction
+from django.db.models import F
+from django.db.models.fields.related_descriptors import ForwardManyToOneDescriptor
+from django.db.models.signals import post_delete, post_save
+
+from . import metriques
+from .models import Commune, VersionReferentiel, Voie
+
+TAILLE_MAX = 10_000
+INTERVALLE_VERIFICATION = 2.0  # secondes entre deux lectures de la version
+
+
+class CacheReferentiel:
+    """
+    Cache LRU d'une table de référence, voir le docstring du module. Les objets
+    renvoyés sont des copies: on peut les modifier sans toucher au cache.
+    """
+
+    def __init__(self, modele, champs_cle: tuple[str, ...], taille_max: int = TAILLE_MAX):
+        self.modele = modele
+        self.champs_cle = champs_cle  # attnames de la clé naturelle
+        self.taille_max = taille_max
+        self.table = modele._meta.db_table
+        self._objets = OrderedDict()  # pk -> objet, du moins au plus récemment utilisé
+        self._pks = {}  # clé naturelle -> pk
+        self._verrou = threading.Lock()
+        self._version = None
+        self._verifie_a = float("-inf")
+        self.succes = 0
+        self.echecs = 0
+
+    def __len__(self):
+        return len(self._objets)
+
+    def cle(self, objet) -> tuple:
+        return tuple(getattr(objet, champ) for champ in self.champs_cle)
+
+    # ------------------------------- Version ------------------------------- #
+
+    def _lire_version(self):
+        try:
+            return (
+                VersionReferentiel.objects.using(DEFAULT_DB_ALIAS)
+                .filter(table=self.table)
+                .values_list("version", flat=True)
+                .first()
+            ) or 0
+        except DatabaseError:  # table pas encore créée
+            return None
+
+    def _verifier(self):
+        maintenant = time.monotonic()
+        if maintenant - self._verifie_a < INTERVALLE_VERIFICATION:
+            return
+        version = self._lire_version()
+        with self._verrou:
+            if version is None or version != self._version:
+                self._objets.clear()
+                self._pks.clear()
+            self._version = version
+            self._verifie_a = maintenant
+
+    def vider(self):
+        """Vide le cache de ce processus seulement."""
+        with self._verrou:
+            self._objets.clear()
+            self._pks.clear()
+            self._verifie_a = float("-inf")
+
+    def invalider(self, using=DEFAULT_DB_ALIAS):
+        """
+        Incrémente la version de la table (tous les processus videront leur cache)
+        et vide le cache local, maintenant et à la validation de la transaction.
+        """
+        versions = VersionReferentiel.objects.using(using)
+        if not versions.filter(table=self.table).update(version=F("version") + 1):
+            versions.get_or_create(table=self.table, defaults={"version": 1})
+        self.vider()
+        transaction.on_commit(self.vider, using=using)
+
+    # ------------------------------- Lectures ------------------------------ #
+
+    def _ajouter(self, objet):
+        # on ne garde pas les objets liés: ils passent eux aussi par leur cache
+        objet._state.fields_cache = {}
+        with self._verrou:
+            self._objets[objet.pk] = objet
+            self._objets.move_to_end(objet.pk)
+            self._pks[self.cle(objet)] = objet.pk
+            while len(self._objets) > self.taille_max:
+                _, ancien = self._objets.popitem(last=False)
+                self._pks.pop(self.cle(ancien), None)
+
+    def ajouter(self, objets, using=DEFAULT_DB_ALIAS):
+        """
+        Met en cache des objets tout juste écrits en base (ex: `bulk_create`), à la
+        validation de la transaction: rien n'est ajouté si elle est annulée.
+        """
+        copies = [copy.copy(objet) for objet in objets]
+
+        def ajouter():
+            self._verifier()
+            for objet in copies:
+                self._ajouter(objet)
+
+        transaction.on_commit(ajouter, using=using)
+
+    def _compter(self, succes=0, echecs=0):
+        self.succes += succes
+        self.echecs += echecs
+        nom = self.modele._meta.model_name
+        metriques.CACHE.inc(succes, cache=nom, resultat="succes")
+        metriques.CACHE.inc(echecs, cache=nom, resultat="echec")
+
+    def _lire(self, pk):
+        with self._verrou:
+            objet = self._objets.get(pk)
+            if objet is not None:
+                self._objets.move_to_end(pk)
+        return objet
+
+    def get(self, pk):
+        """Renvoie l'objet de clé primaire `pk` (une copie), ou None s'il n'existe pas."""
+        self._verifier()
+        objet = self._lire(pk)
+        if objet is None:
+            self._compter(echecs=1)
+            objet = self.modele._default_manager.filter(pk=pk).first()
+            if objet is None:
+                return None
+            self._ajouter(objet)
+        else:
+            self._compter(succes=1)
+        return copy.copy(objet)
+
+    def par_cles(self, cles) -> dict[tuple, object]:
+        """
+        Renvoie {clé naturelle: objet} pour les clés données, avec au plus une requête
+        pour celles qui ne sont pas en cache. Les clés inconnues sont absentes.
+        """
+        self._verifier()
+        trouves, manquantes = {}, set()
+        for cle in set(cles):
+            with self._verrou:
+                pk = self._pks.get(cle)
+            objet = self._lire(pk) if pk is not None else None
+            if objet is None:
+                manquantes.add(cle)
+            else:
+                trouves[cle] = objet
+        self._compter(succes=len(trouves), echecs=len(manquantes))
+        if manquantes:
+            # une condition IN par champ, puis on ne garde que les combinaisons voulues
+            filtre = {
+                f"{champ}__in": {cle[i] for cle in manquantes}
+                for i, champ in enumerate(self.champs_cle)
+            }
+            for objet in self.modele._default_manager.filter(**filtre):
+                if (cle := self.cle(objet)) in manquantes:
+                    self._ajouter(objet)
+                    trouves[cle] = objet
+        return {cle: copy.copy(objet) for cle, objet in trouves.items()}
+
+    def par_cle(self, *cle):
+        """Ex: `COMMUNES.par_cle("69123")`, `VOIES.par_cle("Rue de la Paix", 12)`."""
+        return self.par_cles([cle]).get(cle)
+
+
+# modèle -> cache
+CACHES: dict[type, CacheReferentiel] = {}
+
+
+def enregistrer_cache(modele, champs_cle, taille_max=TAILLE_MAX) -> CacheReferentiel:
+    cache = CACHES[modele] = CacheReferentiel(modele, tuple(champs_cle), taille_max)
+    post_save.connect(_invalider_apres_save, sender=modele)
+    post_delete.connect(_invalider_apres_delete, sender=modele)
+    return cache
+
+
+def _invalider_apres_save(sender, instance, created, raw, using, **kwargs):
+    if not created and not raw:
+        CACHES[sender].invalider(using)
+
+
+def _invalider_apres_delete(sender, instance, using, **kwargs):
+    CACHES[sender].invalider(using)
+
+
+COMMUNES = enregistrer_cache(Commune, ["code_insee"])
+VOIES = enregistrer_cache(Voie, ["nom", "commune_id"])
+
+
+# ---------------------------------------------------------------------------- #
+#                               Clés étrangères                                #
+# ---------------------------------------------------------------------------- #
+
+
+class ReferentielDescriptor(ForwardManyToOneDescriptor):
+    """Charge la cible d'une clé étrangère depuis le cache de référence."""
+
+    def get_object(self, instance):
+        cache = CACHES[self.field.remote_field.model]
+        objet = cache.get(getattr(instance, self.field.attname))
+        if objet is None:
+            return super().get_object(instance)  # lève DoesNotExist
+        return objet
+
+
+def installer_descripteurs(modeles):
+    """
+    Fait passer par le cache les clés étrangères des modèles donnés qui pointent vers
+    une table de référence (à appeler après `identite.installer_descripteurs`).
+    """
+    for modele in modeles:
+        for champ in modele._meta.local_fields:
+            if champ.many_to_one and champ.remote_field.model in CACHES:
+                setattr(modele, champ.name, ReferentielDescriptor(champ))
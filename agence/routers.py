@@ -0,0 +1,94 @@
+"""
+Routage des requêtes entre la base principale et une connexion en lecture seule.
+
+Les vues qui ne font que lire sont déclarées avec le décorateur `lecture_seule`:
+pendant leur exécution, les lectures partent sur l'alias `ALIAS_LECTURE` (une URI
+SQLite `mode=ro` par défaut, ou un réplica dans d'autres déploiements). Les écritures
+restent toujours sur la base principale, et dès qu'une écriture a eu lieu, les
+lectures suivantes de la même requête y retournent aussi (lecture après écriture).
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.decorators import method_decorator
+
+ALIAS_LECTURE = "lecture"
+METHODES_LECTURE = frozenset({"GET", "HEAD", "OPTIONS"})
+
+_lecture_seule: ContextVar[bool] = ContextVar("lecture_seule", default=False)
+_ecriture_faite: ContextVar[bool] = ContextVar("ecriture_faite", default=False)
+
+
+def alias_lecture() -> str:
+    """
+    Renvoie l'alias de base de données à utiliser pour une lecture dans le contexte
+    courant. Utile pour les requêtes SQL brutes, qui ne passent pas par le routeur.
+    """
+    if _lecture_seule.get() and not _ecriture_faite.get() and ALIAS_LECTURE in settings.DATABASES:
+        return ALIAS_LECTURE
+    return DEFAULT_DB_ALIAS
+
+
+@contextmanager
+def en_lecture_seule():
+    """Envoie les lectures du bloc sur la connexion en lecture seule."""
+    jeton = _lecture_seule.set(True)
+    jeton_ecriture = _ecriture_faite.set(False)
+    try:
+        yield
+    finally:
+        _ecriture_faite.reset(jeton_ecriture)
+        _lecture_seule.reset(jeton)
+
+
+def lecture_seule(vue):
+    """
+    Décorateur pour déclarer qu'une vue (fonction ou classe) ne fait que lire pour les
+    méthodes GET/HEAD/OPTIONS. Les autres méthodes restent entièrement sur la base
+    principale.
+    """
+    if isinstance(vue, type):
+        return method_decorator(lecture_seule, name="dispatch")(vue)
+
+    @wraps(vue)
+    def wrapper(request, *args, **kwargs):
+        if request.method not in METHODES_LECTURE:
+            return vue(request, *args, **kwargs)
+        with en_lecture_seule():
+            response = vue(request, *args, **kwargs)
+            # Les TemplateResponse (vues génériques) sont rendues après la vue,
+            # et donc après l'évaluation paresseuse des querysets du contexte.
+            # On force le rendu ici pour qu'il profite aussi de la connexion en lecture.
+            if hasattr(response, "render") and not response.is_rendered:
+                response.render()
+        return response
+
+    return wrapper
+
+
+class LectureEcritureRouter:
+    """
+    Routeur de base de données, voir le docstring du module.
+    """
+
+    def db_for_read(self, model, **hints):
+        # On renvoie toujours un alias explicite: sinon Django réutilise la base
+        # de l'instance passée en indice, et un objet lu sur la connexion en lecture
+        # entraînerait toutes ses relations avec lui, même après une écriture.
+        return alias_lecture()
+
+    def db_for_write(self, model, **hints):
+        if _lecture_seule.get():
+            _ecriture_faite.set(True)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Les deux alias pointent vers les mêmes données
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != ALIAS_LECTURE
@@ -0,0 +1,33 @@
+// Fiche InfosBien de l'administration : recalcule l'estimation du prix pendant la
+// saisie, avec la vue estimation_prix.
+"use strict";
+django.jQuery(function ($) {
+  const form = $("#infosbien_form");
+  const affichage = $(".field-estimation .readonly");
+  if (!form.length || !affichage.length) {
+    return;
+  }
+  // id de l'InfosBien modifié : /admin/agence/infosbien/<id>/change/
+  const modifie = window.location.pathname.match(/\/(\d+)\/change\/$/);
+  let attente = null;
+
+  async function estimer() {
+    const params = new URLSearchParams(new FormData(form[0]));
+    params.delete("csrfmiddlewaretoken");
+    if (modifie) {
+      params.set("infos_bien", modifie[1]);
+    }
+    const reponse = await fetch("/agence/biens/estimation/?" + params);
+    if (!reponse.ok) {
+      return; // formulaire incomplet ou invalide : on garde l'estimation affichée
+    }
+    const donnees = await reponse.json();
+    affichage.text(donnees.texte || "Pas assez de ventes comparables");
+  }
+
+  // l'adresse est un select2, qui déclenche "change" avec jQuery
+  form.on("input change", "input, select", function () {
+    clearTimeout(attente);
+    attente = setTimeout(estimer, 300);
+  });
+});
@@ -0,0 +1,274 @@
+"""
+File de tâches de fond stockée en base (`models.Tache`), sans autre service à
+installer.
+
+Une tâche est une fonction déclarée avec le décorateur `tache`, dont les arguments
+et la valeur de retour sont sérialisables en JSON:
+
+    @tache("creer_agence", max_tentatives=3)
+    def creer_agence(nom, telephone, adresse): ...
+
+    ajouter("creer_agence", cle=nom, nom=nom, telephone=None, adresse="...")
+
+`ajouter` enregistre la tâche et rend la main tout de suite, la commande
+`travailleur` l'exécute ensuite. Si la fonction lève une exception, la tâche est
+relancée plus tard (attente exponentielle, voir `delai_relance`) jusqu'à
+`max_tentatives` fois, sauf pour `EchecDefinitif`. La valeur renvoyée est gardée
+dans `Tache.resultat`.
+
+Déduplication: tant qu'une tâche de même nom et même clé est en attente ou en cours,
+`ajouter` la renvoie au lieu d'en créer une nouvelle (contrainte unique partielle en
+base, donc aussi entre processus).
+
+Une vue peut `suivre` la tâche qu'elle ajoute: son résultat est alors annoncé à
+l'utilisateur (message Django) à sa première requête après la fin de la tâche, par
+`middleware.SuiviTachesMiddleware`.
+
+Pour prendre une tâche, un travailleur fait un `UPDATE` conditionné au statut "en
+attente": si un autre l'a prise entre temps, aucune ligne n'est modifiée et il en
+essaie une autre (SQLite n'a pas de `SELECT ... FOR UPDATE SKIP LOCKED`). Une tâche
+en cours depuis plus de `duree_max` (travailleur arrêté brutalement) est considérée
+comme échouée par `recuperer_bloquees`, puis relancée.
+"""
+
+import logging
+import random
+import traceback
+from collections.abc import Callable
+from dataclasses import dataclass
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .geocodage import ErreurGeocodage
+from .models import Acheteur, Adresse, Agence, Tache
+
+logger = logging.getLogger(__name__)
+
+RELANCE_BASE = 10  # secondes avant la 2e tentative, doublées à chaque échec
+RELANCE_MAX = 3600
+ACTIVES = (Tache.Statut.EN_ATTENTE, Tache.Statut.EN_COURS)
+SESSION_SUIVIES = "taches_suivies"  # {pk: description} dans la session
+
+
+class EchecDefinitif(Exception):
+    """À lever dans une tâche pour qu'elle échoue sans être relancée."""
+
+
+@dataclass(frozen=True)
+class DefinitionTache:
+    nom: str
+    fonction: Callable
+    max_tentatives: int
+    duree_max: timedelta
+
+
+# nom -> définition
+TACHES: dict[str, DefinitionTache] = {}
+
+
+def tache(nom: str, max_tentatives: int = 5, duree_max: timedelta = timedelta(minutes=10)):
+    """Déclare une tâche de fond, voir le docstring du module."""
+
+    def decorateur(fonction):
+        TACHES[nom] = DefinitionTache(nom, fonction, max_tentatives, duree_max)
+        return fonction
+
+    return decorateur
+
+
+def delai_relance(tentatives: int) -> timedelta:
+    """Attente avant de relancer une tâche qui a échoué `tentatives` fois."""
+    secondes = min(RELANCE_MAX, RELANCE_BASE * 2 ** (tentatives - 1))
+    # ±20 %: les tâches qui ont échoué ensemble ne sont pas relancées ensemble
+    return timedelta(seconds=secondes * random.uniform(0.8, 1.2))
+
+
+def ajouter(nom: str, /, *, cle: str | None = None, delai: timedelta | None = None, **arguments):
+    """
+    Ajoute une tâche à la file, exécutée dès que possible (ou après `delai`). Les
+    autres arguments nommés sont ceux de la fonction de la tâche (`cle` et `delai`
+    sont donc réservés).
+
+    :param cle: clé de déduplication, voir le docstring du module.
+    :return: la tâche créée, ou celle de même clé déjà en attente ou en cours.
+    :raise ValueError: si la tâche `nom` n'existe pas.
+    """
+    if nom not in TACHES:
+        msg = f"Tâche inconnue: {nom}"
+        raise ValueError(msg)
+    executer_apres = timezone.now() + (delai or timedelta())
+    try:
+        with transaction.atomic():
+            return Tache.objects.create(
+                nom=nom, cle=cle, arguments=arguments, executer_apres=executer_apres
+            )
+    except IntegrityError:
+        if cle is None:
+            raise
+    existante = Tache.objects.filter(nom=nom, cle=cle, statut__in=ACTIVES).first()
+    if existante is None:  # terminée entre l'insertion et cette lecture
+        return ajouter(nom, cle=cle, delai=delai, **arguments)
+    return existante
+
+
+def derniere_reussie(nom: str, cle: str) -> Tache | None:
+    """La dernière tâche réussie de ce nom et cette clé."""
+    return (
+        Tache.objects.filter(nom=nom, cle=cle, statut=Tache.Statut.REUSSIE).order_by("-fin").first()
+    )
+
+
+def cause_echec(tache: Tache) -> str:
+    """Le message de l'exception qui a fait échouer la tâche (dernière ligne de la trace)."""
+    derniere = tache.erreur.strip().rsplit("\n", 1)[-1]
+    return derniere.partition(": ")[2] or derniere
+
+
+# ---------------------------------------------------------------------------- #
+#                                    Suivi                                     #
+# ---------------------------------------------------------------------------- #
+
+
+def suivre(request, tache: Tache, description: str):
+    """Annonce le résultat de `tache` à l'utilisateur quand elle sera terminée."""
+    suivies = request.session.get(SESSION_SUIVIES, {})
+    suivies[str(tache.pk)] = description
+    request.session[SESSION_SUIVIES] = suivies
+
+
+def terminees_suivies(request) -> list[tuple[str, Tache]]:
+    """
+    Les tâches suivies par la session de `request` qui sont terminées, avec leur
+    description, en une requête. Elles ne sont plus suivies ensuite (ni celles qui
+    n'existent plus).
+    """
+    suivies = request.session.get(SESSION_SUIVIES)
+    if not suivies:
+        return []
+    existantes = {
+        str(tache.pk): tache
+        for tache in Tache.objects.filter(pk__in=list(suivies)).only("statut", "erreur")
+    }
+    terminees = [
+        (description, existantes[pk])
+        for pk, description in suivies.items()
+        if pk in existantes and existantes[pk].statut not in ACTIVES
+    ]
+    restantes = {
+        pk: description
+        for pk, description in suivies.items()
+        if pk in existantes and existantes[pk].statut in ACTIVES
+    }
+    if restantes != suivies:
+        request.session[SESSION_SUIVIES] = restantes
+    return terminees
+
+
+# ---------------------------------------------------------------------------- #
+#                                  Exécution                                   #
+# ---------------------------------------------------------------------------- #
+
+
+def prendre(travailleur: str, noms=None) -> Tache | None:
+    """Réserve la prochaine tâche prête pour `travailleur`, ou renvoie None."""
+    maintenant = timezone.now()
+    pretes = Tache.objects.filter(statut=Tache.Statut.EN_ATTENTE, executer_apres__lte=maintenant)
+    if noms:
+        pretes = pretes.filter(nom__in=noms)
+    for pk in pretes.order_by("executer_apres", "pk").values_list("pk", flat=True)[:10]:
+        prise = Tache.objects.filter(pk=pk, statut=Tache.Statut.EN_ATTENTE).update(
+            statut=Tache.Statut.EN_COURS,
+            debut=maintenant,
+            travailleur=travailleur,
+            tentatives=F("tentatives") + 1,
+        )
+        if prise:
+            return Tache.objects.get(pk=pk)
+    return None
+
+
+def _echec(tache: Tache, erreur: BaseException):
+    definition = TACHES.get(tache.nom)
+    tache.erreur = "".join(traceback.format_exception(erreur))
+    if (
+        isinstance(erreur, EchecDefinitif)
+        or definition is None
+        or tache.tentatives >= definition.max_tentatives
+    ):
+        tache.statut = Tache.Statut.ECHOUEE
+        tache.fin = timezone.now()
+        logger.error("tâche %s échouée: %s", tache, erreur)
+    else:
+        tache.statut = Tache.Statut.EN_ATTENTE
+        tache.executer_apres = timezone.now() + delai_relance(tache.tentatives)
+        logger.warning("tâche %s relancée après l'erreur: %s", tache, erreur)
+    tache.save(update_fields=["statut", "erreur", "fin", "executer_apres"])
+
+
+def executer(tache: Tache):
+    """Exécute une tâche réservée par `prendre` et enregistre son résultat."""
+    try:
+        definition = TACHES.get(tache.nom)
+        if definition is None:
+            msg = f"Tâche inconnue: {tache.nom}"
+            raise EchecDefinitif(msg)
+        resultat = definition.fonction(**tache.arguments)
+    except Exception as e:  # noqa: BLE001
+        _echec(tache, e)
+        return
+    tache.statut = Tache.Statut.REUSSIE
+    tache.resultat = resultat
+    tache.erreur = ""
+    tache.fin = timezone.now()
+    tache.save(update_fields=["statut", "resultat", "erreur", "fin"])
+
+
+def recuperer_bloquees():
+    """Traite comme échouées les tâches en cours depuis plus de leur `duree_max`."""
+    maintenant = timezone.now()
+    for tache in Tache.objects.filter(statut=Tache.Statut.EN_COURS):
+        definition = TACHES.get(tache.nom)
+        duree_max = definition.duree_max if definition else timedelta()
+        if tache.debut + duree_max < maintenant:
+            msg = f"Pas terminée après {duree_max} (travailleur {tache.travailleur} arrêté ?)"
+            _echec(tache, TimeoutError(msg))
+
+
+# ---------------------------------------------------------------------------- #
+#                                    Tâches                                    #
+# ---------------------------------------------------------------------------- #
+
+
+@tache("creer_agence", max_tentatives=5)
+def creer_agence(nom: str, telephone: str | None, adresse: str) -> int:
+    """Géocode l'adresse de l'agence puis la crée (voir `views.create_agence`)."""
+    try:
+        lieu = Adresse.from_texte(adresse)
+    except ErreurGeocodage:
+        raise  # API inaccessible: on réessaiera
+    except ValueError as e:
+        raise EchecDefinitif(str(e)) from e
+    return Agence.objects.create(nom=nom, telephone=telephone, adresse=lieu).pk
+
+
+@tache("calculer_propositions", max_tentatives=3)
+def calculer_propositions(acheteur_id: int) -> list[int]:
+    """Ids des biens proposés à l'acheteur, voir agence.propositions."""
+    from .propositions import get_proposition_biens  # noqa: PLC0415
+
+    acheteur = Acheteur.objects.filter(pk=acheteur_id).first()
+    if acheteur is None:
+        msg = f"Acheteur {acheteur_id} introuvable"
+        raise EchecDefinitif(msg)
+    return [bien.pk for bien in get_proposition_biens(acheteur)]
+
+
+@tache("envoyer_alertes", max_tentatives=5, duree_max=timedelta(minutes=30))
+def envoyer_alertes() -> int:
+    """Propositions aux acheteurs des biens mis en vente, voir agence.alertes."""
+    from .alertes import envoyer_alertes  # noqa: PLC0415
+
+    return envoyer_alertes()
@@ -1,3 +1,28 @@
-from django.test import TestCase
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
 
-# Create your tests here.
+from .models import Acheteur, Agent, ProxyUtilisateur, Utilisateur
+
+
+class RolesUtilisateurTest(TestCase):
+    def test_avec_roles(self):
+        utilisateur = Utilisateur.objects.create(nom="Martin", prenom="Léa", email="lea@exemple.fr")
+        Acheteur.objects.create(utilisateur=utilisateur)
+
+        with self.assertNumQueries(1):
+            charge = Utilisateur.objects.avec_roles().get(pk=utilisateur.pk)
+            self.assertEqual(list(charge.roles), ["acheteur"])
+            self.assertIsNone(charge.role("agent"))
+
+
+class TypesUtilisateurTest(TransactionTestCase):
+    def test_table_reconstruite(self):
+        # SQLite reconstruit la table (migration qui modifie un champ) avec une copie
+        # du modèle, NewAgent, qui ne doit pas devenir un type d'utilisateur
+        with connection.schema_editor() as editeur:
+            editeur._remake_table(Agent)
+
+        self.assertEqual(set(ProxyUtilisateur.TYPE_UTILISATEURS), {"acheteur", "vendeur", "agent"})
+        self.assertIs(ProxyUtilisateur.TYPE_UTILISATEURS["agent"], Agent)
+        utilisateur = Utilisateur.objects.create(nom="Martin", prenom="Léa", email="lea@exemple.fr")
+        self.assertEqual(Utilisateur.objects.avec_roles().get(pk=utilisateur.pk).roles, {})
@@ -14,13 +14,39 @@ urlpatterns = [
     # ---------------------------------- Profils --------------------------------- #
     path("acheteur/<int:utilisateur_id>/", views.profil_acheteur, name="profil_acheteur"),
     path("vendeur/<int:vendeur_id>/", views.ProfilVendeurView.as_view(), name="profil_vendeur"),
+    path(
+        "achat/<int:fait_achat_id>/chronologie/",
+        views.chronologie_fait_achat,
+        name="chronologie_fait_achat",
+    ),
+    path(
+        "achat/<int:fait_achat_id>/evenements/",
+        views.evenements_fait_achat,
+        name="evenements_fait_achat",
+    ),
+    path("achat/<int:fait_achat_id>/flux/", views.flux_fait_achat, name="flux_fait_achat"),
     # -----------------------------------Bien---------------------------------------#
     path("create_bien/", views.create_bien, name="create_bien"),
+    path("biens/recherche/", views.recherche_bien, name="recherche_bien"),
+    path("biens/estimation/", views.estimation_prix, name="estimation_prix"),
     # -----------------------------------Agent--------------------------------------#
     path("agent/<int:utilisateur_id>/", views.profil_agent, name="profil_agent"),
     # path("agent/", views.list_agents, name="list_agents"),
     # # -----------------------------------LIste Bien--------------------------------------#
     # path("biens/", ListViewBiens.as_view(), name="list_biens"),
+    # ---------------------------------- Exports --------------------------------- #
+    path("export/<str:nom>/", views.exporter, name="exporter"),
+    # ---------------------------------- Imports --------------------------------- #
+    path("import/biens/", views.import_biens, name="import_biens"),
+    # ------------------------------------ API ----------------------------------- #
+    path("api/<str:nom>/", views.api_ressource, name="api_ressource"),
+    # ------------------------------ Tableau de bord ----------------------------- #
+    path("tableau-de-bord/", views.tableau_de_bord, name="tableau_de_bord"),
+    # --------------------------------- Profilage -------------------------------- #
+    path("taches/", views.liste_taches, name="liste_taches"),
+    path("profils/", views.profils, name="profils"),
+    path("profils/agrege/", views.profil_detail, name="profil_agrege"),
+    path("profils/<str:nom>/", views.profil_detail, name="profil_detail"),
     # ----------------------------------- Utils ---------------------------------- #
     path("bien/<int:pk>/etat/", UpdateEtatBienView.as_view(), name="update_etat_bien"),
     path(
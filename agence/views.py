@@ -1,16 +1,39 @@
+import asyncio
+import csv
+import io
+import tempfile
+from dataclasses import asdict
+from datetime import date, timedelta
 from typing import NamedTuple
 
-import requests
+from asgiref.sync import sync_to_async
 from dal import autocomplete
+from django.conf import settings
 from django.contrib import messages
-from django.core.exceptions import BadRequest
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.exceptions import BadRequest, PermissionDenied
 from django.core.paginator import Paginator
-from django.db import connection, transaction
+from django.db import IntegrityError, connections, transaction
+from django.db.models import Count
 from django.forms import ValidationError
+from django.http import (
+    FileResponse,
+    Http404,
+    HttpResponse,
+    JsonResponse,
+    StreamingHttpResponse,
+)
 from django.shortcuts import redirect, render
 from django.urls import reverse_lazy
 from django.utils import timezone
+from django.utils.cache import (
+    get_conditional_response,
+    patch_cache_control,
+    patch_vary_headers,
+    set_response_etag,
+)
 from django.views import View
+from django.views.decorators.http import require_safe
 from django.views.generic import ListView, TemplateView
 from django.views.generic.edit import UpdateView
 
@@ -23,30 +46,36 @@ from agence.forms import (
     empty_utilisateur_forms,
 )
 
-from .forms import AvisForm, BienForm, EtapeAchatForm
+from . import api, direct, entonnoir, estimation, metriques, profilage, taches
+from .chronologie import apercus, chronologie
+from .export import EXPORTS, ecrire_parquet, lignes_csv
+from .forms import (
+    AvisForm,
+    BienForm,
+    EntonnoirForm,
+    EtapeAchatForm,
+    ImportBiensForm,
+    InfosBienForm,
+    RechercheBienForm,
+)
+from .identite import get_or_none
+from .import_biens import importer_biens
 from .models import (
     Acheteur,
     Agent,
     Avis,
     Bien,
+    EvenementAchat,
     FaitAchat,
     ProxyUtilisateur,
     RendezVous,
     Utilisateur,
     Vendeur,
 )
-
-# ---------------------------------------------------------------------------- #
-#                                     Utils                                    #
-# ---------------------------------------------------------------------------- #
-
-
-def get_or_none(classmodel, **kwargs):
-    try:
-        return classmodel.objects.get(**kwargs)
-    except classmodel.DoesNotExist:
-        return None
-
+from .planning import creneaux_libres_agence, debut_semaine
+from .propositions import propositions_acheteur, recalculer
+from .recherche import CHAMBRES_MAX, rechercher_biens
+from .routers import alias_lecture, lecture_seule
 
 # ---------------------------------------------------------------------------- #
 #                                     Index                                    #
@@ -69,6 +98,21 @@ class UserInfo(NamedTuple):
     prenom: str
     types: str
 
+    @classmethod
+    def depuis_utilisateur(cls, utilisateur: Utilisateur) -> "UserInfo":
+        """
+        Construit un UserInfo à partir d'un utilisateur. Pour éviter une requête par
+        rôle, l'utilisateur doit venir de `Utilisateur.objects.avec_roles()`.
+        """
+        return cls(
+            id=utilisateur.id,
+            email=utilisateur.email,
+            telephone=utilisateur.telephone and str(utilisateur.telephone),
+            nom=utilisateur.nom,
+            prenom=utilisateur.prenom,
+            types=",".join(sorted(utilisateur.roles)) or "aucune type",
+        )
+
     def types_url_html(self):
         """Retourne des liens HTML pour chaque type d'utilisateur."""
         return ", ".join(
@@ -121,12 +165,13 @@ def get_user_list():
         ORDER BY
             nom, prenom, email;
     """
-    with connection.cursor() as cursor:
+    with connections[alias_lecture()].cursor() as cursor:
         cursor.execute(query)
         result = cursor.fetchall()
     return [UserInfo(*ligne) for ligne in result]
 
 
+@lecture_seule
 def list_users(request):
     user_list = get_user_list()
     paginator = Paginator(user_list, 100)  # 100 utilisateurs par page
@@ -186,6 +231,8 @@ class CreateUserView(View):
             if submitted_form_type == "acheteur":
                 instance.critere_recherche.save()
             instance.save()
+            if submitted_form_type == "acheteur":
+                recalculer(instance.pk)
             messages.success(request, f"✅ {submitted_form_type} créé avec succès !")
             return redirect(request.path)
         messages.error(request, "⚠️ Veuillez corriger les erreurs spécifiques.")
@@ -219,8 +266,20 @@ def create_agence(request):
     if request.method == "POST":
         form = AgenceForm(request.POST)
         if form.is_valid():
-            form.save()
-            messages.success(request, "✅ Agence créée avec succès !")
+            # le géocodage de l'adresse peut être long: l'agence est créée en tâche de fond
+            telephone = form.cleaned_data["telephone"]
+            tache = taches.ajouter(
+                "creer_agence",
+                cle=f"{form.cleaned_data['nom']}|{form.cleaned_data['adresse']}",
+                nom=form.cleaned_data["nom"],
+                telephone=str(telephone) if telephone else None,
+                adresse=form.cleaned_data["adresse"],
+            )
+            # adresse introuvable, API inaccessible...: annoncé à la prochaine page
+            taches.suivre(request, tache, f"Création de l'agence {form.cleaned_data['nom']}")
+            messages.success(
+                request, "✅ Agence en cours de création, le résultat s'affichera ici."
+            )
             return render(request, "agence/create_user.html", {"form_agence": AgenceForm()})
         else:
             messages.error(request, "⚠️ Veuillez corriger les erreurs ci-dessous.")
@@ -244,24 +303,29 @@ class AdresseAutocomplete(autocomplete.Select2ListView):
     """Classe pour l'autocomplétion des adresses."""
 
     def get_list(self):
+        import requests  # noqa: PLC0415
+
         if not self.q:
             return []
         try:
-            response = requests.get(
-                "https://data.geopf.fr/geocodage/completion/",
-                {
-                    "text": self.q,
-                    "maximumResponses": 10,
-                    "type": "StreetAddress",
-                },
-                timeout=5,
-            )
+            with metriques.GEOCODAGE_DUREE.chronometrer(api="completion"):
+                response = requests.get(
+                    f"{settings.API_COMPLETION_URL}/completion/",
+                    {
+                        "text": self.q,
+                        "maximumResponses": 10,
+                        "type": "StreetAddress",
+                    },
+                    timeout=5,
+                )
             response.raise_for_status()  # Vérifie si la requête a réussi
+            result = response.json()
         except (requests.RequestException, ValueError):
+            metriques.GEOCODAGE_ECHECS.inc(api="completion")
             return []
 
-        result = response.json()
         if (status := result.get("status")) != "OK":
+            metriques.GEOCODAGE_ECHECS.inc(api="completion")
             return [f"Error status: {status}"]
 
         results = result.get("results")
@@ -277,6 +341,7 @@ class AdresseAutocomplete(autocomplete.Select2ListView):
         return results
 
 
+@lecture_seule
 class EmailAutocomplete(autocomplete.Select2ListView):
     def get_list(self):
         qs = Utilisateur.objects.all()
@@ -296,35 +361,28 @@ class EmailAutocomplete(autocomplete.Select2ListView):
 # ---------------------------------------------------------------------------- #
 
 
-def get_proposition_biens(acheteur):
-    """
-    Retourne les biens qui correspondent aux critères de recherche de l'acheteur.
-    """
-    critere = acheteur.critere_recherche
-    if not critere:
-        return models.Bien.objects.none()
-    biens = list(models.Bien.objects.select_related("infos_bien").all())
-    biens_scores = [(bien, critere.score_correspondance(bien.infos_bien)) for bien in biens]
-    biens_scores.sort(key=lambda x: x[1], reverse=True)
-    return [bien for bien, score in biens_scores if score > 0][:10]  # Limite à 10 biens
-
-
+@lecture_seule
 def profil_acheteur(request, utilisateur_id):
     context: dict = {"acheteur": None, "utilisateur": None}
-    utilisateur = get_or_none(Utilisateur, id=utilisateur_id)
+    utilisateur = get_or_none(Utilisateur.objects.avec_roles(), id=utilisateur_id)
     if utilisateur is None:
         messages.error(request, "⚠️ Utilisateur non trouvé.")
         return render(request, "agence/profil_acheteur.html", context)
     context["utilisateur"] = utilisateur
 
-    acheteur = get_or_none(Acheteur, utilisateur=utilisateur)
+    acheteur = utilisateur.role("acheteur")
     if acheteur is None:
         messages.error(request, "⚠️ Acheteur non trouvé pour cet utilisateur.")
         return render(
             request, "agence/profil_acheteur.html", {"acheteur": None, "utilisateur": utilisateur}
         )
     context["acheteur"] = acheteur
-    context["faits_achat"] = FaitAchat.objects.filter(acheteur=acheteur)
+    context["faits_achat"] = FaitAchat.objects.filter(acheteur=acheteur).select_related(
+        "bien__infos_bien__lieu",
+        "bien__vendeur__utilisateur",
+        "bien__agent__utilisateur",
+        "bien__agent__agence",
+    )
 
     if request.method == "POST":
         action = request.POST.get("action")
@@ -352,8 +410,15 @@ def profil_acheteur(request, utilisateur_id):
         else:
             messages.error(request, "⚠️ Fait d'achat non trouvé ou non associé à cet acheteur.")
 
-    # Récupération des biens correspondant aux critères de recherche
-    context["proposition_biens"] = get_proposition_biens(acheteur)
+    # Début de la chronologie de chaque achat, la suite se charge à la demande
+    faits_achat = list(context["faits_achat"])
+    pages = apercus((fait.pk for fait in faits_achat), limite=APERCU_CHRONOLOGIE)
+    for fait in faits_achat:
+        fait.chronologie = pages[fait.pk]
+    context["faits_achat"] = faits_achat
+
+    # Biens correspondant aux critères de recherche, calculés en tâche de fond
+    context["proposition_biens"], context["propositions_en_cours"] = propositions_acheteur(acheteur)
 
     messages.success(request, "✅ Profil acheteur chargé avec succès.")
     return render(
@@ -363,6 +428,410 @@ def profil_acheteur(request, utilisateur_id):
     )
 
 
+# ---------------------------------------------------------------------------- #
+#                                  Chronologie                                 #
+# ---------------------------------------------------------------------------- #
+
+APERCU_CHRONOLOGIE = 5  # nombre d'événements affichés directement dans le profil
+
+
+@lecture_seule
+def chronologie_fait_achat(request, fait_achat_id):
+    """
+    Chronologie (messages, rendez-vous, avis) d'un fait d'achat, page par page avec
+    `?curseur=`. Renvoie du JSON avec `?format=json`.
+    """
+    fait_achat = get_or_none(FaitAchat, id=fait_achat_id)
+    if fait_achat is None:
+        msg = "Fait d'achat non trouvé"
+        raise Http404(msg)
+    try:
+        page = chronologie(fait_achat.pk, request.GET.get("curseur"))
+    except ValueError as e:
+        raise BadRequest(str(e)) from e
+
+    if request.GET.get("format") == "json":
+        return JsonResponse(
+            {
+                "evenements": [evenement._asdict() for evenement in page.evenements],
+                "suivant": page.suivant,
+            }
+        )
+    context = {
+        "fait_achat": fait_achat,
+        "chronologie": page,
+        "flux": direct.flux_disponible(request),
+        "intervalle_sans_flux": direct.INTERVALLE_SANS_FLUX,
+    }
+    if not request.GET.get("curseur"):
+        # première page: la suite arrive en direct à partir du dernier événement connu
+        context["dernier_evenement"] = (
+            EvenementAchat.objects.filter(fait_achat=fait_achat)
+            .order_by("-id")
+            .values_list("id", flat=True)
+            .first()
+            or 0
+        )
+    return render(request, "agence/chronologie.html", context)
+
+
+def _depuis(request) -> int:
+    """Id du dernier événement déjà reçu par le client (0 = aucun)."""
+    valeur = request.headers.get("Last-Event-ID") or request.GET.get("depuis") or 0
+    try:
+        return max(0, int(valeur))
+    except ValueError as e:
+        msg = "Identifiant d'événement invalide"
+        raise BadRequest(msg) from e
+
+
+@lecture_seule
+def evenements_fait_achat(request, fait_achat_id):
+    """
+    Événements (messages, avis, rendez-vous) créés depuis `?depuis=<id>`, pour les
+    clients qui ne peuvent pas utiliser le flux SSE.
+    """
+    depuis = _depuis(request)
+    if get_or_none(FaitAchat, id=fait_achat_id) is None:
+        msg = "Fait d'achat non trouvé"
+        raise Http404(msg)
+    evenements = direct.evenements_depuis(fait_achat_id, depuis)
+    return JsonResponse(
+        {
+            "evenements": evenements,
+            "dernier": evenements[-1]["id"] if evenements else depuis,
+        }
+    )
+
+
+async def flux_fait_achat(request, fait_achat_id):
+    """
+    Flux Server-Sent Events des événements d'un fait d'achat. Le client reprend où
+    il en était avec l'en-tête `Last-Event-ID` (envoyé automatiquement par EventSource).
+    """
+    depuis = _depuis(request)
+    if not await FaitAchat.objects.filter(pk=fait_achat_id).aexists():
+        msg = "Fait d'achat non trouvé"
+        raise Http404(msg)
+    rattraper = sync_to_async(direct.evenements_depuis)
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    if not direct.flux_disponible(request):
+        # sous WSGI, le flux infini ne serait jamais envoyé: on répond tout de suite
+        # avec les événements en attente, et EventSource se reconnecte plus tard
+        evenements = await rattraper(fait_achat_id, depuis)
+        return HttpResponse(
+            f"retry: {direct.INTERVALLE_SANS_FLUX * 1000}\n\n"
+            + "".join(direct.format_sse(evenement) for evenement in evenements),
+            content_type="text/event-stream",
+            headers=headers,
+        )
+
+    async def flux():
+        dernier = depuis
+        # abonné avant de lire le journal: un événement créé entre-temps réveille le flux
+        async with direct.canal.abonnement(fait_achat_id) as reveil:
+            while True:
+                while evenements := await rattraper(fait_achat_id, dernier):
+                    for evenement in evenements:
+                        dernier = evenement["id"]
+                        yield direct.format_sse(evenement)
+                try:
+                    await asyncio.wait_for(reveil.get(), direct.BATTEMENT)
+                except TimeoutError:
+                    yield ": battement\n\n"
+
+    return StreamingHttpResponse(flux(), content_type="text/event-stream", headers=headers)
+
+
+# ---------------------------------------------------------------------------- #
+#                                    Exports                                   #
+# ---------------------------------------------------------------------------- #
+
+
+@staff_member_required
+@lecture_seule
+def exporter(request, nom):
+    """
+    Export des biens ou des transactions, en CSV (par défaut) ou en Parquet
+    (`?format=parquet`). Le CSV est envoyé au fur et à mesure de la lecture.
+    """
+    export = EXPORTS.get(nom)
+    if export is None:
+        msg = "Export inconnu"
+        raise Http404(msg)
+    # alias fixé maintenant: la réponse est produite après la fin de la vue
+    using = alias_lecture()
+
+    if request.GET.get("format") == "parquet":
+        fichier = tempfile.TemporaryFile()  # fermé par FileResponse
+        try:
+            ecrire_parquet(export, fichier, using=using)
+        except ImportError as e:
+            fichier.close()
+            return HttpResponse(str(e), status=501, content_type="text/plain")
+        fichier.seek(0)
+        return FileResponse(fichier, as_attachment=True, filename=f"{nom}.parquet")
+
+    return StreamingHttpResponse(
+        lignes_csv(export, using=using),
+        content_type="text/csv; charset=utf-8",
+        headers={"Content-Disposition": f'attachment; filename="{nom}.csv"'},
+    )
+
+
+# ---------------------------------------------------------------------------- #
+#                                   Profilage                                  #
+# ---------------------------------------------------------------------------- #
+
+PROFILS_PAR_PAGE = 50
+
+
+@staff_member_required
+def profils(request):
+    """Requêtes profilées (voir agence.profilage), les plus lentes d'abord."""
+    vue = request.GET.get("vue") or None
+    page = Paginator(profilage.lister(vue), PROFILS_PAR_PAGE).get_page(request.GET.get("page"))
+    return render(request, "agence/profils.html", {"page": page, "vue": vue})
+
+
+@staff_member_required
+def profil_detail(request, nom=None):
+    """
+    Arbre d'appels d'un profil, ou de tous les profils d'une vue agrégés
+    (`?vue=<nom de la vue>`).
+    """
+    vue = request.GET.get("vue")
+    if nom is not None:
+        noms = [nom]
+    elif vue:
+        noms = [meta["nom"] for meta in profilage.lister(vue)]
+    else:
+        noms = []
+    stats = profilage.charger(noms)
+    if stats is None:
+        msg = "Profil introuvable"
+        raise Http404(msg)
+    total_ms, racines = profilage.arbre(stats)
+    return render(
+        request,
+        "agence/profil_detail.html",
+        {
+            "nom": nom,
+            "vue": vue,
+            "nombre": len(noms),
+            "total_ms": total_ms,
+            "racines": racines,
+            "fonctions": profilage.fonctions_couteuses(stats),
+        },
+    )
+
+
+# ---------------------------------------------------------------------------- #
+#                                   Métriques                                  #
+# ---------------------------------------------------------------------------- #
+
+
+def metriques_prometheus(request):
+    """
+    Métriques au format texte de Prometheus (voir agence.metriques), pour les
+    adresses de `METRIQUES["IPS"]` et les utilisateurs staff.
+    """
+    if request.META.get("REMOTE_ADDR") not in settings.METRIQUES["IPS"] and not (
+        request.user.is_active and request.user.is_staff
+    ):
+        raise PermissionDenied
+    return HttpResponse(
+        metriques.exposer(), content_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+# ---------------------------------------------------------------------------- #
+#                                      API                                     #
+# ---------------------------------------------------------------------------- #
+
+
+def _json_api(contenu, status=200):
+    response = JsonResponse(
+        contenu, encoder=api.EncodeurApi, status=status, json_dumps_params={"ensure_ascii": False}
+    )
+    patch_vary_headers(response, ["Authorization", "Cookie"])
+    return response
+
+
+def _reponse_api(request, contenu):
+    response = _json_api(contenu)
+    # l'ETag est l'empreinte du contenu: un client qui renvoie If-None-Match reçoit un
+    # 304 vide si rien n'a changé depuis son dernier appel
+    patch_cache_control(response, private=True, no_cache=True)
+    set_response_etag(response)
+    return get_conditional_response(request, etag=response["ETag"], response=response)
+
+
+@require_safe
+@lecture_seule
+def api_ressource(request, nom):
+    """
+    Objets de la ressource `nom` en JSON (voir agence.api), pour les utilisateurs staff
+    et les clés de `API["CLES"]` (en-tête `Authorization: Bearer <clé>`).
+    """
+    cle = request.headers.get("Authorization", "").removeprefix("Bearer ").strip()
+    if not api.cle_valide(cle) and not (request.user.is_active and request.user.is_staff):
+        return _json_api({"erreur": "Clé d'API manquante ou invalide"}, status=401)
+    try:
+        contenu = api.repondre(nom, request.GET)
+    except LookupError:
+        return _json_api({"erreur": f"Ressource inconnue: {nom}"}, status=404)
+    except ValueError as e:
+        return _json_api({"erreur": str(e)}, status=400)
+    return _reponse_api(request, contenu)
+
+
+# ---------------------------------------------------------------------------- #
+#                                Tableau de bord                               #
+# ---------------------------------------------------------------------------- #
+
+# étapes qui ne suivent pas l'étape précédente dans l'entonnoir
+ETAPES_SORTIE = (FaitAchat.EtapeAchat.REFUSE, FaitAchat.EtapeAchat.ABANDON)
+
+
+@staff_member_required
+@lecture_seule
+def tableau_de_bord(request):
+    """
+    Entonnoir de vente jour par jour (voir agence.entonnoir), pour tout le réseau, une
+    agence (`?agence=`) ou un agent (`?agent=`), de `?debut=` à `?fin=`.
+    """
+    form = EntonnoirForm(request.GET)
+    context = {"form": form, "etapes": FaitAchat.EtapeAchat, "etats": Bien.Etat}
+    if not form.is_valid():
+        return render(request, "agence/tableau_de_bord.html", context)
+    filtres = form.cleaned_data
+    donnees = entonnoir.entonnoir(
+        filtres["debut"],
+        filtres["fin"],
+        agence_id=filtres["agence"] and filtres["agence"].pk,
+        agent_id=filtres["agent"] and filtres["agent"].pk,
+    )
+
+    lignes_entonnoir, precedentes = [], None
+    for etape in FaitAchat.EtapeAchat:
+        entrees = donnees.entrees.get(etape, 0)
+        taux = None
+        if etape not in ETAPES_SORTIE and precedentes:
+            taux = round(100 * entrees / precedentes)
+        if etape not in ETAPES_SORTIE:
+            precedentes = entrees
+        lignes_entonnoir.append((etape.label, entrees, taux, donnees.en_cours.get(etape, 0)))
+
+    agents = Agent.objects.select_related("utilisateur").in_bulk(
+        [pk for pk in donnees.entrees_par_agent if pk is not None]
+    )
+
+    def nom_agent(pk):
+        if pk is None:
+            return "Sans agent"
+        if pk not in agents:  # les agrégats gardent l'id d'un agent supprimé depuis
+            return "Agent supprimé"
+        return f"{agents[pk].utilisateur.prenom} {agents[pk].utilisateur.nom}"
+
+    context.update(
+        filtres=filtres,
+        lignes_entonnoir=lignes_entonnoir,
+        entrees_par_jour=[
+            (jour, [entrees.get(etape, 0) for etape in FaitAchat.EtapeAchat])
+            for jour, entrees in donnees.entrees_par_jour.items()
+        ],
+        etats_par_jour=[
+            (jour, [etats.get(etat, 0) for etat in Bien.Etat])
+            for jour, etats in donnees.etats_par_jour.items()
+        ],
+        entrees_par_agent=[
+            (nom_agent(pk), [compteurs.get(etape, 0) for etape in FaitAchat.EtapeAchat])
+            for pk, compteurs in sorted(
+                donnees.entrees_par_agent.items(), key=lambda item: -sum(item[1].values())
+            )
+        ],
+    )
+    return render(request, "agence/tableau_de_bord.html", context)
+
+
+# ---------------------------------------------------------------------------- #
+#                                Tâches de fond                                #
+# ---------------------------------------------------------------------------- #
+
+TACHES_PAR_PAGE = 50
+
+
+@staff_member_required
+def liste_taches(request):
+    """
+    État de la file de tâches (voir agence.taches), filtrable par `?statut=` et
+    `?nom=`. Une tâche échouée peut être relancée (POST `relancer`).
+    """
+    if request.method == "POST":
+        tache = get_or_none(models.Tache, id=request.POST.get("tache_id"))
+        if tache is None or tache.statut != models.Tache.Statut.ECHOUEE:
+            messages.error(request, "⚠️ Seule une tâche échouée peut être relancée.")
+        else:
+            tache.statut = models.Tache.Statut.EN_ATTENTE
+            tache.tentatives = 0
+            tache.executer_apres = timezone.now()
+            tache.fin = None
+            try:
+                with transaction.atomic():
+                    tache.save(update_fields=["statut", "tentatives", "executer_apres", "fin"])
+            except IntegrityError:
+                messages.error(request, "⚠️ Une tâche avec la même clé est déjà prévue.")
+            else:
+                messages.success(request, f"✅ Tâche {tache.pk} relancée.")
+        return redirect(request.get_full_path())
+
+    filtres = {champ: valeur for champ in ("statut", "nom") if (valeur := request.GET.get(champ))}
+    compteurs = dict(
+        models.Tache.objects.values_list("statut").annotate(nombre=Count("pk")).order_by()
+    )
+    page = Paginator(models.Tache.objects.filter(**filtres).order_by("-pk"), TACHES_PAR_PAGE)
+    return render(
+        request,
+        "agence/taches.html",
+        {
+            "page": page.get_page(request.GET.get("page")),
+            "filtres": filtres,
+            "compteurs": [
+                (statut, libelle, compteurs.get(statut, 0))
+                for statut, libelle in models.Tache.Statut.choices
+            ],
+            "noms": sorted(taches.TACHES),
+        },
+    )
+
+
+# ---------------------------------------------------------------------------- #
+#                                    Imports                                   #
+# ---------------------------------------------------------------------------- #
+
+
+@staff_member_required
+def import_biens(request):
+    """Import d'un fichier CSV de biens, voir agence.import_biens pour le format."""
+    rapport = None
+    if request.method == "POST":
+        form = ImportBiensForm(request.POST, request.FILES)
+        if form.is_valid():
+            fichier = io.TextIOWrapper(form.cleaned_data["fichier"].file, encoding="utf-8-sig")
+            try:
+                rapport = importer_biens(fichier, agent=form.cleaned_data["agent"])
+            except (UnicodeDecodeError, csv.Error) as e:
+                messages.error(request, f"⚠️ Fichier illisible: {e}")
+            else:
+                if rapport.interrompu:
+                    messages.error(request, f"⚠️ Import interrompu: {rapport.interrompu}")
+                messages.success(request, f"✅ {rapport.biens_crees} biens importés.")
+    else:
+        form = ImportBiensForm()
+    return render(request, "agence/import_biens.html", {"form": form, "rapport": rapport})
+
+
 # ---------------------------------------------------#
 #               BIEN                                #
 # ---------------------------------------------------#
@@ -380,15 +849,39 @@ def create_bien(request):
     return render(request, "agence/create_bien.html", {"form": form})
 
 
+@staff_member_required
+@require_safe
+@lecture_seule
+def estimation_prix(request):
+    """
+    Estimation du prix d'un bien en JSON (voir agence.estimation), à partir des champs
+    de `InfosBienForm` (`?lieu=<id d'Adresse>&nb_chambres=...&surface_habitable=...`).
+    Appelée par la fiche `InfosBien` de l'administration pendant la saisie
+    (static/estimation_prix.js), avec `infos_bien=<id>` pour ne pas prendre le bien
+    lui-même comme vente comparable.
+    """
+    form = InfosBienForm(request.GET)
+    if not form.is_valid():
+        return JsonResponse({"erreur": form.errors.get_json_data()}, status=400)
+    if form.instance.lieu is None:
+        return JsonResponse({"erreur": "Adresse manquante"}, status=400)
+    exclure = ()
+    if (infos_bien := request.GET.get("infos_bien", "")).isdigit():
+        exclure = models.Bien.objects.filter(infos_bien_id=infos_bien).values_list("pk", flat=True)
+    resultat = estimation.estimer(form.instance, exclure=exclure)
+    return JsonResponse({"estimation": resultat and asdict(resultat), "texte": str(resultat or "")})
+
+
+@lecture_seule
 def profil_agent(request, utilisateur_id):
     context: dict = {"agent": None, "utilisateur": None}
-    utilisateur = get_or_none(Utilisateur, id=utilisateur_id)
+    utilisateur = get_or_none(Utilisateur.objects.avec_roles(), id=utilisateur_id)
     if utilisateur is None:
         messages.error(request, "⚠️ Utilisateur non trouvé.")
         return render(request, "agence/profil_agent.html", context)
     context["utilisateur"] = utilisateur
 
-    agent = get_or_none(Agent, utilisateur=utilisateur)
+    agent = utilisateur.role("agent")
     if agent is None:
         messages.error(request, "⚠️ Agent non trouvé pour cet utilisateur.")
         return render(
@@ -407,6 +900,29 @@ def profil_agent(request, utilisateur_id):
         .order_by("utilisateur__nom", "utilisateur__prenom")
     )
 
+    # Créneaux d'une heure encore libres d'ici la fin de la semaine, pour l'agent et
+    # les autres agents de son agence (une requête pour tous leurs rendez-vous)
+    maintenant = timezone.now().replace(second=0, microsecond=0)
+    maintenant += timedelta(minutes=-maintenant.minute % 15)  # au quart d'heure suivant
+    debut = max(maintenant, debut_semaine())
+    fin = debut_semaine() + timedelta(days=7)
+    creneaux = creneaux_libres_agence(agent.agence_id, debut, fin, timedelta(hours=1))
+    context["creneaux_libres"] = creneaux.pop(agent.pk, [])
+    collegues = models.Agent.objects.select_related("utilisateur").in_bulk(creneaux)
+    context["creneaux_collegues"] = sorted(
+        ((collegues[pk], libres) for pk, libres in creneaux.items() if pk in collegues),
+        key=lambda item: (item[0].utilisateur.nom, item[0].utilisateur.prenom),
+    )
+
+    # Tournée optimisée des rendez-vous du jour demandé (?jour=AAAA-MM-JJ)
+    try:
+        jour = date.fromisoformat(request.GET["jour"])
+    except (KeyError, ValueError):
+        jour = timezone.localdate()
+    from .itineraire import tournee_agent  # noqa: PLC0415 (numpy)
+
+    context["tournee"] = tournee_agent(agent, jour)
+
     # fait_achats = FaitAchat.objects.filter(agent=agent).()
     messages.success(request, "✅ Profil agent chargé avec succès.")
     return render(
@@ -416,6 +932,71 @@ def profil_agent(request, utilisateur_id):
     )
 
 
+def _url_avec(params, **modifications):
+    """Renvoie la querystring `params` avec les `modifications` (None = supprimer)."""
+    params = params.copy()
+    params.pop("page", None)
+    for cle, valeur in modifications.items():
+        if valeur is None:
+            params.pop(cle, None)
+        else:
+            params[cle] = valeur
+    return f"?{params.urlencode()}"
+
+
+def _facettes_affichage(params, filtres, facettes):
+    """Met en forme les compteurs des facettes pour le template."""
+    libelles = {
+        "etat": ("État", lambda v: Bien.Etat(v).label),
+        "tranche_prix": ("Prix", str),
+        "chambres": ("Chambres", lambda v: f"{v}+" if v == CHAMBRES_MAX else str(v)),
+    }
+    affichage = []
+    for nom, compteurs in facettes.items():
+        titre, libelle = libelles[nom]
+        valeurs = []
+        for valeur, nombre in compteurs.items():
+            actif = filtres.get(nom) == valeur
+            valeurs.append(
+                {
+                    "libelle": libelle(valeur),
+                    "nombre": nombre,
+                    "actif": actif,
+                    # cliquer sur une valeur active la désélectionne
+                    "url": _url_avec(params, **{nom: None if actif else str(valeur)}),
+                }
+            )
+        affichage.append({"titre": titre, "valeurs": valeurs})
+    return affichage
+
+
+@lecture_seule
+def recherche_bien(request):
+    form = RechercheBienForm(request.GET or None)
+    filtres = form.cleaned_data if form.is_valid() else {}
+    try:
+        page = int(request.GET.get("page", 1))
+    except ValueError:
+        page = 1
+
+    resultat = rechercher_biens(filtres, page=page)
+    params = request.GET.copy()
+    context = {
+        "form": form,
+        "resultat": resultat,
+        "facettes": _facettes_affichage(params, filtres, resultat.facettes),
+        "url_precedente": (
+            f"{_url_avec(params)}&page={resultat.page - 1}" if resultat.page > 1 else None
+        ),
+        "url_suivante": (
+            f"{_url_avec(params)}&page={resultat.page + 1}"
+            if resultat.page < resultat.nb_pages
+            else None
+        ),
+    }
+    return render(request, "agence/recherche_bien.html", context)
+
+
 class UpdateEtatBienView(UpdateView):
     model = Bien
     fields = ["etat"]
@@ -437,6 +1018,7 @@ class ListViewBiens(ListView):
 # views.py
 
 
+@lecture_seule
 class RendezVousParVendeurView(ListView):
     model = RendezVous
     template_name = "agence/rendezvous_vendeur.html"
@@ -456,6 +1038,7 @@ class RendezVousParVendeurView(ListView):
         return context
 
 
+@lecture_seule
 class ProfilVendeurView(TemplateView):
     template_name = "agence/profil_vendeur.html"
 
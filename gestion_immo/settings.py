@@ -10,10 +10,9 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
-from phonenumbers import PhoneMetadata
-
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -55,13 +54,17 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "agence.middleware.MetriquesMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "agence.middleware.ProfilageMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
+    "agence.middleware.SuiviTachesMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "agence.middleware.CarteIdentiteMiddleware",
 ]
 
 ROOT_URLCONF = "gestion_immo.urls"
@@ -90,10 +93,63 @@ WSGI_APPLICATION = "gestion_immo.wsgi.application"
 DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
+        # GESTION_IMMO_BDD_FICHIER: utiliser un autre fichier (ex: copie pour la
+        # commande charge)
+        "NAME": os.environ.get("GESTION_IMMO_BDD_FICHIER") or BASE_DIR / "db.sqlite3",
     },
 }
 
+# Profil "production" de SQLite, à activer avec la variable d'environnement
+# GESTION_IMMO_BDD=production. Par défaut SQLite utilise un journal "rollback"
+# qui bloque les lecteurs pendant une écriture ("database is locked").
+# https://www.sqlite.org/pragma.html
+SQLITE_PRAGMAS_PRODUCTION = {
+    # les lecteurs ne bloquent plus l'écrivain (et inversement)
+    "journal_mode": "WAL",
+    # en WAL, NORMAL reste sûr en cas de crash de l'application et évite un fsync par commit
+    "synchronous": "NORMAL",
+    "mmap_size": 256 * 1024 * 1024,  # 256 Mo
+    "cache_size": -64_000,  # négatif = en Kio, donc ~64 Mo
+    "temp_store": "MEMORY",
+    "busy_timeout": 5_000,  # en millisecondes
+}
+
+if os.environ.get("GESTION_IMMO_BDD", "").lower() == "production":
+    DATABASES["default"] |= {
+        # connexions persistantes: les pragmas ne sont appliqués qu'une fois par connexion
+        "CONN_MAX_AGE": 600,
+        "CONN_HEALTH_CHECKS": True,
+        "OPTIONS": {
+            "init_command": ";".join(
+                f"PRAGMA {nom}={valeur}" for nom, valeur in SQLITE_PRAGMAS_PRODUCTION.items()
+            ),
+            # prend le verrou d'écriture dès le BEGIN, sinon deux transactions qui
+            # lisent puis écrivent se bloquent mutuellement malgré le busy_timeout
+            "transaction_mode": "IMMEDIATE",
+        },
+    }
+
+# Connexion en lecture seule utilisée par les vues décorées avec
+# agence.routers.lecture_seule. Ici c'est le même fichier ouvert avec mode=ro,
+# mais ça peut être un réplica dans d'autres déploiements.
+DATABASES["lecture"] = {
+    **DATABASES["default"],
+    # resolve(): as_uri() refuse les chemins relatifs (GESTION_IMMO_BDD_FICHIER)
+    "NAME": f"{Path(DATABASES['default']['NAME']).resolve().as_uri()}?mode=ro",
+    "TEST": {"MIRROR": "default"},
+}
+if "OPTIONS" in DATABASES["lecture"]:
+    # journal_mode ne peut pas être modifié sur une connexion en lecture seule
+    DATABASES["lecture"]["OPTIONS"] = {
+        "init_command": ";".join(
+            f"PRAGMA {nom}={valeur}"
+            for nom, valeur in SQLITE_PRAGMAS_PRODUCTION.items()
+            if nom != "journal_mode"
+        ),
+    }
+
+DATABASE_ROUTERS = ["agence.routers.LectureEcritureRouter"]
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -141,3 +197,34 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 # https://django-money.readthedocs.io/en/latest/#note-on-serialization
 SERIALIZATION_MODULES = {"json": "djmoney.serializers"}
+
+# API Adresse (Base Adresse Nationale) utilisée pour géocoder les adresses,
+# voir agence.geocodage. Modifiable pour pointer vers un serveur local ou un bouchon.
+API_ADRESSE_URL = os.environ.get("API_ADRESSE_URL", "https://api-adresse.data.gouv.fr")
+# API de complétion d'adresses de l'IGN, utilisée par l'autocomplétion des formulaires
+API_COMPLETION_URL = os.environ.get("API_COMPLETION_URL", "https://data.geopf.fr/geocodage")
+
+# Profilage d'un échantillon de requêtes, voir agence.middleware.ProfilageMiddleware.
+# GESTION_IMMO_PROFILAGE=0.01 profile 1 % des requêtes (aucune par défaut).
+PROFILAGE = {
+    "TAUX": float(os.environ.get("GESTION_IMMO_PROFILAGE") or 0),
+    # en-tête pour forcer le profilage d'une requête (staff ou DEBUG uniquement)
+    "ENTETE": "X-Profiler",
+    "DOSSIER": BASE_DIR / "profils",
+    "MAX_FICHIERS": 500,
+}
+
+# Métriques au format Prometheus sur /metrics, voir agence.metriques.
+METRIQUES = {
+    # dossier partagé entre les processus (workers gunicorn), à vider au démarrage
+    "DOSSIER": os.environ.get("GESTION_IMMO_METRIQUES_DOSSIER") or None,
+    "INTERVALLE": 1.0,  # secondes entre deux écritures du fichier d'un processus
+    # adresses autorisées à lire /metrics sans être connecté en staff
+    "IPS": os.environ.get("GESTION_IMMO_METRIQUES_IPS", "127.0.0.1,::1").split(","),
+}
+
+# API JSON en lecture seule sur /agence/api/, voir agence.api.
+API = {
+    # clés acceptées dans l'en-tête "Authorization: Bearer <clé>" (en plus du staff)
+    "CLES": [cle for cle in os.environ.get("GESTION_IMMO_API_CLES", "").split(",") if cle],
+}
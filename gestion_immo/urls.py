@@ -19,8 +19,11 @@ from django.contrib import admin
 from django.urls import include, path
 from django.views.generic import RedirectView
 
+from agence.views import metriques_prometheus
+
 urlpatterns = [
     path("", RedirectView.as_view(url="agence/")),
     path("agence/", include("agence.urls")),
     path("admin/", admin.site.urls),
+    path("metrics", metriques_prometheus, name="metrics"),
 ]